@@ -109,11 +109,13 @@ def test_rule_pattern(validated_data):
 def apply_branch_rules():
     """应用分支规则到所有分支"""
     params = get_request_params({
-        'repository_id': {'type': int, 'required': False}
+        'repository_id': {'type': int, 'required': False},
+        'pushdown': {'default': None}  # 是否在数据库中批量计算，未指定时 PostgreSQL 自动启用
     })
+    pushdown = str(params['pushdown']).lower() == 'true' if params['pushdown'] is not None else None
     
     rule_service = BranchRuleService()
-    result = rule_service.apply_rules_to_branches(params['repository_id'])
+    result = rule_service.apply_rules_to_branches(params['repository_id'], pushdown=pushdown)
     
     status_code = 200 if result.get('success', True) else 500
     return jsonify(result), status_code
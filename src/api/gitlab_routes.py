@@ -14,7 +14,9 @@ from datetime import datetime
 from services.gitlab_service import GitlabService
 from services.database_service import DatabaseService
 from services.gitlab_query_service import GitlabQueryService
-from services.task_service import task_service
+from services.task_service import task_service, PRIORITY_HIGH, PRIORITY_NORMAL
+from services.sync_run_service import sync_run_service
+from services import task_handlers
 from dto.tag_create_dto import TagCreateDTO
 from middleware.logging_middleware import get_current_user_id
 from api.response import api_response, handle_service_result
@@ -42,25 +44,24 @@ def sync_repositories():
     """
     params = get_request_params({
         'async': {'default': 'true'},
-        'force': {'default': 'false'}  # 强制执行（忽略防重复检查）
+        'force': {'default': 'false'},  # 强制执行（忽略防重复检查）
+        'incremental': {'default': 'false'}  # 增量同步（基于 last_activity_at 水位）
     })
     
     use_async = params['async'].lower() == 'true'
+    incremental = str(params['incremental']).lower() == 'true'
     
     if use_async:
         # 异步执行
-        def sync_task():
-            gitlab_service = GitlabService()
-            return gitlab_service.sync_repositories()
-        
         try:
             result = task_service.create_task(
                 task_type='sync_repositories',
-                func=sync_task,
+                func=task_handlers.sync_repositories,
                 allow_duplicate=params['force'].lower() == 'true',
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None
-                }
+                },
+                incremental=incremental
             )
             
             return api_response(
@@ -73,7 +74,7 @@ def sync_repositories():
             )
             
         except ValueError as e:
-            # 时间窗口限制
+            # 时间窗口限制或任务队列已满
             return api_response(
                 success=False,
                 error=str(e),
@@ -82,7 +83,7 @@ def sync_repositories():
     else:
         # 同步执行（保持向后兼容）
         gitlab_service = GitlabService()
-        result = gitlab_service.sync_repositories()
+        result = gitlab_service.sync_repositories(incremental=incremental)
         result_dict = handle_service_result(result)
         
         status_code = 200 if result_dict.get('success', True) else 500
@@ -102,14 +103,10 @@ def sync_groups():
     use_async = params['async'].lower() == 'true'
     
     if use_async:
-        def sync_task():
-            gitlab_service = GitlabService()
-            return gitlab_service.sync_groups()
-        
         try:
             result = task_service.create_task(
                 task_type='sync_groups',
-                func=sync_task,
+                func=task_handlers.sync_groups,
                 allow_duplicate=params['force'].lower() == 'true',
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None
@@ -148,28 +145,38 @@ def sync_branches():
     params = get_request_params({
         'repository_id': {'type': int, 'required': False},
         'async': {'default': 'true'},
-        'force': {'default': 'false'}
+        'force': {'default': 'false'},
+        'concurrent': {'default': None},  # 是否并发同步，未指定时使用 SYNC_CONCURRENT 配置
+        'max_workers': {'type': int, 'required': False},
+        'deep': {'default': 'false'},  # 深度同步：逐分支拉取提交详情
+        'incremental': {'default': 'false'}
     })
     
     use_async = params['async'].lower() == 'true'
+    concurrent = str(params['concurrent']).lower() == 'true' if params['concurrent'] is not None else None
+    deep = str(params['deep']).lower() == 'true'
+    incremental = str(params['incremental']).lower() == 'true'
     
     if use_async:
-        def sync_task():
-            gitlab_service = GitlabService()
-            return gitlab_service.sync_repository_branches(params['repository_id'])
-        
         try:
             # 包含 repository_id 的任务类型以支持更精细的控制
             task_type = f"sync_branches_{params['repository_id']}" if params['repository_id'] else 'sync_branches'
             
             result = task_service.create_task(
                 task_type=task_type,
-                func=sync_task,
+                func=task_handlers.sync_branches,
                 allow_duplicate=params['force'].lower() == 'true',
+                # 单个仓库的同步耗时短，优先于全量同步执行
+                priority=PRIORITY_HIGH if params['repository_id'] else PRIORITY_NORMAL,
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None,
                     'repository_id': params['repository_id']
-                }
+                },
+                repository_id=params['repository_id'],
+                concurrent=concurrent,
+                max_workers=params['max_workers'],
+                deep=deep,
+                incremental=incremental
             )
             
             return api_response(
@@ -189,7 +196,10 @@ def sync_branches():
             )
     else:
         gitlab_service = GitlabService()
-        result = gitlab_service.sync_repository_branches(params['repository_id'])
+        result = gitlab_service.sync_repository_branches(
+            params['repository_id'], concurrent=concurrent, max_workers=params['max_workers'],
+            deep=deep, incremental=incremental
+        )
         result_dict = handle_service_result(result)
         
         status_code = 200 if result_dict.get('success', True) else 500
@@ -204,27 +214,29 @@ def sync_permissions():
     params = get_request_params({
         'repository_id': {'type': int, 'required': False},
         'async': {'default': 'true'},
-        'force': {'default': 'false'}
+        'force': {'default': 'false'},
+        'incremental': {'default': 'false'}
     })
     
     use_async = params['async'].lower() == 'true'
+    incremental = str(params['incremental']).lower() == 'true'
     
     if use_async:
-        def sync_task():
-            gitlab_service = GitlabService()
-            return gitlab_service.sync_repository_permissions(params['repository_id'])
-        
         try:
             task_type = f"sync_permissions_{params['repository_id']}" if params['repository_id'] else 'sync_permissions'
             
             result = task_service.create_task(
                 task_type=task_type,
-                func=sync_task,
+                func=task_handlers.sync_permissions,
                 allow_duplicate=params['force'].lower() == 'true',
+                # 单个仓库的同步耗时短，优先于全量同步执行
+                priority=PRIORITY_HIGH if params['repository_id'] else PRIORITY_NORMAL,
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None,
                     'repository_id': params['repository_id']
-                }
+                },
+                repository_id=params['repository_id'],
+                incremental=incremental
             )
             
             return api_response(
@@ -244,7 +256,7 @@ def sync_permissions():
             )
     else:
         gitlab_service = GitlabService()
-        result = gitlab_service.sync_repository_permissions(params['repository_id'])
+        result = gitlab_service.sync_repository_permissions(params['repository_id'], incremental=incremental)
         result_dict = handle_service_result(result)
         
         status_code = 200 if result_dict.get('success', True) else 500
@@ -255,27 +267,33 @@ def sync_permissions():
 @token_required
 @handle_exceptions
 def sync_all():
-    """同步所有 GitLab 数据（异步）"""
+    """同步所有 GitLab 数据（异步）
+    
+    resume=true 时，若上次同模式的同步未完成（失败、取消或进程退出），
+    从其检查点继续，跳过已完成的阶段和仓库
+    """
     params = get_request_params({
         'async': {'default': 'true'},
-        'force': {'default': 'false'}
+        'force': {'default': 'false'},
+        'incremental': {'default': 'false'},  # 默认全量对账
+        'resume': {'default': 'false'}
     })
     
     use_async = params['async'].lower() == 'true'
+    incremental = str(params['incremental']).lower() == 'true'
+    resume = str(params['resume']).lower() == 'true'
     
     if use_async:
-        def sync_task():
-            gitlab_service = GitlabService()
-            return gitlab_service.sync_all()
-        
         try:
             result = task_service.create_task(
                 task_type='sync_all',
-                func=sync_task,
+                func=task_handlers.sync_all,
                 allow_duplicate=params['force'].lower() == 'true',
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None
-                }
+                },
+                incremental=incremental,
+                resume=resume
             )
             
             return api_response(
@@ -295,7 +313,7 @@ def sync_all():
             )
     else:
         gitlab_service = GitlabService()
-        result = gitlab_service.sync_all()
+        result = gitlab_service.sync_all(incremental=incremental, resume=resume)
         result_dict = handle_service_result(result)
         
         status_code = 200 if result_dict.get('success', True) else 500
@@ -304,6 +322,46 @@ def sync_all():
 
 # ==================== 数据查询 API ====================
 
+@gitlab_bp.route('/sync-runs', methods=['GET'])
+@token_required
+@handle_exceptions
+def get_sync_runs():
+    """获取最近的全量同步（sync_all）运行记录及各阶段耗时"""
+    params = get_request_params({
+        'limit': {'type': int, 'default': 20}
+    })
+    
+    runs = sync_run_service.list_runs(params['limit'])
+    return api_response(
+        success=True,
+        runs=runs,
+        count=len(runs)
+    )
+
+
+@gitlab_bp.route('/sync-runs/<int:run_id>', methods=['GET'])
+@token_required
+@handle_exceptions
+def get_sync_run(run_id):
+    """获取同步运行详情：各仓库阶段的状态统计、耗时最长的仓库和失败的仓库"""
+    params = get_request_params({
+        'slowest': {'type': int, 'default': 20}
+    })
+    
+    run = sync_run_service.get_run(run_id, slowest=params['slowest'])
+    if not run:
+        return api_response(
+            success=False,
+            error='同步运行记录不存在',
+            status_code=404
+        )
+    
+    return api_response(
+        success=True,
+        run=run
+    )
+
+
 @gitlab_bp.route('/repositories', methods=['GET'])
 @handle_exceptions
 def get_repositories():
@@ -879,18 +937,15 @@ def generate_branch_summaries():
         
         if use_async:
             # 异步执行
-            def generate_task():
-                gitlab_service = GitlabService()
-                return gitlab_service.generate_branch_summaries(force_refresh)
-            
             result = task_service.create_task(
                 task_type='generate_branch_summaries',
-                func=generate_task,
+                func=task_handlers.generate_branch_summaries,
                 allow_duplicate=False,
                 metadata={
                     'user_id': get_current_user_id() if hasattr(g, 'current_user') else None,
                     'force_refresh': force_refresh
-                }
+                },
+                force_refresh=bool(force_refresh)
             )
             
             return api_response(
@@ -921,6 +976,13 @@ def generate_branch_summaries():
                     error=result.get('error', '生成分支汇总失败'),
                     status_code=500
                 )
+    except ValueError as e:
+        # 时间窗口限制或任务队列已满
+        return api_response(
+            success=False,
+            error=str(e),
+            status_code=429  # Too Many Requests
+        )
     except Exception as e:
         logger.exception('生成分支汇总失败')
         return api_response(
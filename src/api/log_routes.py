@@ -6,13 +6,23 @@
 - 导入状态查询
 - 导入历史记录
 - 日志数据查询
+- 日志跟随导入
+- 访问统计（预聚合）
+- 访问日志归档（Parquet）
 """
 
 from flask import Blueprint, request
+from datetime import date, datetime, timedelta
 import os
 from services.log_parser import LogParser
+from services.log_follower import log_follower
+from services.access_rollup_service import access_rollup_service
+from services.log_archive_service import log_archive_service
 from services.database_service import DatabaseService
+from services.task_service import task_service
+from services import task_handlers
 from api.response import api_response
+from api.auth_decorators import token_required, admin_required
 from utils.validators import get_request_params
 from utils.errorhandler import handle_exceptions
 
@@ -29,8 +39,17 @@ def parse_log():
     if not log_file_path:
         return api_response(success=False, error='Log file path not provided', status_code=400)
 
+    workers = data.get('workers') if data else None
+    if workers is not None:
+        try:
+            workers = int(workers)
+        except (TypeError, ValueError):
+            return api_response(success=False, error='workers must be an integer', status_code=400)
+        if workers < 1:
+            return api_response(success=False, error='workers must be greater than 0', status_code=400)
+
     log_parser = LogParser(log_file_path)
-    parse_result = log_parser.parse()
+    parse_result = log_parser.parse(workers=workers)
     
     # 修复：直接处理 ImportResult 对象，不使用 handle_service_result
     if not parse_result.success:
@@ -93,16 +112,311 @@ def get_import_history():
 @log_bp.route('/logs', methods=['GET'])
 @handle_exceptions
 def get_logs():
-    """获取日志数据"""
+    """获取日志数据，可按日期范围（YYYY-MM-DD，包含两端）过滤
+
+    source=archive 时直接从 Parquet 归档文件查询（归档后已从数据库删除的日志）。
+    """
     params = get_request_params({
-        'limit': {'type': int, 'default': 100}
+        'limit': {'type': int, 'default': 100},
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False},
+        'source': {'type': str, 'default': 'db'}
     })
     
+    try:
+        start_date = datetime.strptime(params['start_date'], '%Y-%m-%d').date() if params.get('start_date') else None
+        end_date = datetime.strptime(params['end_date'], '%Y-%m-%d').date() if params.get('end_date') else None
+    except ValueError:
+        return api_response(success=False, error='Invalid date format, expected YYYY-MM-DD', status_code=400)
+    
+    if params['source'] == 'archive':
+        if not log_archive_service.available:
+            return api_response(success=False, error='pyarrow is not installed, access log archive is unavailable', status_code=400)
+        logs = log_archive_service.get_logs(limit=params['limit'], start_date=start_date, end_date=end_date)
+        archives = log_archive_service.list_archives(start_date, end_date)
+        return api_response(
+            logs=logs,
+            count=len(logs),
+            total_records=sum(archive['rows'] for archive in archives),
+            source='archive'
+        )
+    if params['source'] != 'db':
+        return api_response(success=False, error='source must be db or archive', status_code=400)
+    
     db_service = DatabaseService()
-    logs = db_service.get_logs(limit=params['limit'])
+    logs = db_service.get_logs(limit=params['limit'], start_date=start_date, end_date=end_date)
     
     return api_response(
         logs=logs,
         count=len(logs),
         total_records=db_service.get_total_count()
     )
+
+
+@log_bp.route('/archive', methods=['GET'])
+@handle_exceptions
+def list_archives():
+    """列出已归档的日期（文件数、行数、大小），可按日期范围过滤"""
+    if not log_archive_service.available:
+        return api_response(success=False, error='pyarrow is not installed, access log archive is unavailable', status_code=400)
+    
+    params = get_request_params({
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False}
+    })
+    try:
+        start_date = datetime.strptime(params['start_date'], '%Y-%m-%d').date() if params.get('start_date') else None
+        end_date = datetime.strptime(params['end_date'], '%Y-%m-%d').date() if params.get('end_date') else None
+    except ValueError:
+        return api_response(success=False, error='Invalid date format, expected YYYY-MM-DD', status_code=400)
+    
+    archives = log_archive_service.list_archives(start_date, end_date)
+    return api_response(
+        archive_dir=log_archive_service.archive_dir,
+        archives=archives,
+        total_rows=sum(archive['rows'] for archive in archives),
+        total_size_bytes=sum(archive['size_bytes'] for archive in archives)
+    )
+
+
+@log_bp.route('/archive', methods=['POST'])
+@token_required
+@admin_required
+@handle_exceptions
+def archive_logs():
+    """把指定日期范围的访问日志归档为 Parquet 文件，delete 为 true 时归档后删除数据库中的日志（仅管理员，异步）
+
+    start_date 默认为数据库中最早的日志，end_date 默认为昨天。
+    立即返回任务 ID，客户端可通过 /api/tasks/{task_id} 查询进度和归档结果。
+    """
+    if not log_archive_service.available:
+        return api_response(success=False, error='pyarrow is not installed, access log archive is unavailable', status_code=400)
+    
+    data = request.get_json() if request.is_json else {}
+    data = data or {}
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else None
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None
+    except (TypeError, ValueError):
+        return api_response(success=False, error='Invalid date format, expected YYYY-MM-DD', status_code=400)
+    
+    try:
+        result = task_service.create_task(
+            task_type='archive_access_logs',
+            func=task_handlers.archive_access_logs,
+            start_date=start_date.isoformat() if start_date else None,
+            end_date=end_date.isoformat() if end_date else None,
+            delete=bool(data.get('delete', False))
+        )
+    except ValueError as e:
+        # 时间窗口限制或任务队列已满
+        return api_response(success=False, error=str(e), status_code=429)
+    
+    return api_response(
+        success=True,
+        message=result['message'],
+        task_id=result['task_id'],
+        is_new_task=result['is_new'],
+        status_url=f"/api/tasks/{result['task_id']}",
+        status_code=202
+    )
+
+
+@log_bp.route('/follow/start', methods=['POST'])
+@handle_exceptions
+def start_follow():
+    """启动日志跟随导入（持续导入日志文件新增的行）"""
+    try:
+        params = get_request_params({
+            'log_file': {'type': str, 'required': False},
+            'interval': {'type': int, 'required': False}
+        })
+    except ValueError as e:
+        return api_response(success=False, error=str(e), status_code=400)
+    
+    if params['interval'] is not None and params['interval'] < 1:
+        return api_response(success=False, error='interval must be a positive number of seconds', status_code=400)
+    
+    log_file_path = params['log_file'] or os.environ.get('LOG_FILE_PATH')
+    result = log_follower.start(log_file_path, params['interval'])
+    if not result.pop('success'):
+        return api_response(success=False, error=result.pop('message'), status_code=400, **result)
+    
+    return api_response(**result)
+
+
+@log_bp.route('/follow/stop', methods=['POST'])
+@handle_exceptions
+def stop_follow():
+    """停止日志跟随导入（跟随线程在其他进程中时请求其停止）"""
+    params = get_request_params({'log_file': {'type': str, 'required': False}})
+    result = log_follower.stop(params['log_file'])
+    if not result.pop('success'):
+        return api_response(success=False, error=result.pop('message'), status_code=400, **result)
+    
+    return api_response(**result)
+
+
+@log_bp.route('/follow/status', methods=['GET'])
+@handle_exceptions
+def get_follow_status():
+    """获取日志跟随导入状态及断点（状态保存在数据库中，任意 worker 返回的结果一致）"""
+    params = get_request_params({'log_file': {'type': str, 'required': False}})
+    status = log_follower.status(params['log_file'])
+    checkpoint = None
+    if status['log_file_path']:
+        checkpoint = DatabaseService().get_log_checkpoint(os.path.abspath(status['log_file_path']))
+    
+    return api_response(checkpoint=checkpoint, **status)
+
+
+def _parse_date_range(params: dict, default_days: int = 7):
+    """解析 start_date/end_date（YYYY-MM-DD，包含两端），默认最近 default_days 天"""
+    end_date = datetime.strptime(params['end_date'], '%Y-%m-%d').date() if params.get('end_date') else date.today()
+    if params.get('start_date'):
+        start_date = datetime.strptime(params['start_date'], '%Y-%m-%d').date()
+    else:
+        start_date = end_date - timedelta(days=default_days - 1)
+    return start_date, end_date
+
+
+@log_bp.route('/access-stats/endpoints', methods=['GET'])
+@handle_exceptions
+def get_endpoint_access_stats():
+    """按接口模板汇总访问统计（请求数、错误数、平均/分位延迟），数据来自预聚合表"""
+    params = get_request_params({
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False},
+        'order_by': {'type': str, 'default': 'request_count'},
+        'http_method': {'type': str, 'required': False},
+        'status_class': {'type': int, 'required': False},
+        'limit': {'type': int, 'default': 50}
+    })
+    
+    try:
+        start_date, end_date = _parse_date_range(params)
+        endpoints = access_rollup_service.get_endpoint_stats(
+            start_date, end_date,
+            order_by=params['order_by'],
+            http_method=params.get('http_method'),
+            status_class=params.get('status_class'),
+            limit=params['limit']
+        )
+    except ValueError as e:
+        return api_response(success=False, error=str(e), status_code=400)
+    
+    return api_response(
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
+        endpoints=endpoints,
+        count=len(endpoints)
+    )
+
+
+@log_bp.route('/access-stats/endpoints/daily', methods=['GET'])
+@handle_exceptions
+def get_endpoint_daily_access_stats():
+    """单个接口模板按天的访问统计"""
+    params = get_request_params({
+        'api_template': {'type': str, 'required': True},
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False},
+        'http_method': {'type': str, 'required': False}
+    })
+    
+    try:
+        start_date, end_date = _parse_date_range(params, default_days=30)
+    except ValueError:
+        return api_response(success=False, error='Invalid date format, expected YYYY-MM-DD', status_code=400)
+    
+    days = access_rollup_service.get_endpoint_daily(
+        params['api_template'], start_date, end_date, http_method=params.get('http_method')
+    )
+    return api_response(api_template=params['api_template'], days=days)
+
+
+@log_bp.route('/access-stats/clients', methods=['GET'])
+@handle_exceptions
+def get_client_access_stats():
+    """按客户端 IP 汇总访问统计"""
+    params = get_request_params({
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False},
+        'order_by': {'type': str, 'default': 'request_count'},
+        'limit': {'type': int, 'default': 50}
+    })
+    
+    try:
+        start_date, end_date = _parse_date_range(params)
+        clients = access_rollup_service.get_client_stats(
+            start_date, end_date, order_by=params['order_by'], limit=params['limit']
+        )
+    except ValueError as e:
+        return api_response(success=False, error=str(e), status_code=400)
+    
+    return api_response(
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
+        clients=clients,
+        count=len(clients)
+    )
+
+
+@log_bp.route('/access-stats/daily', methods=['GET'])
+@handle_exceptions
+def get_daily_access_stats():
+    """按天汇总的请求数和错误数"""
+    params = get_request_params({
+        'start_date': {'type': str, 'required': False},
+        'end_date': {'type': str, 'required': False}
+    })
+    
+    try:
+        start_date, end_date = _parse_date_range(params, default_days=30)
+    except ValueError:
+        return api_response(success=False, error='Invalid date format, expected YYYY-MM-DD', status_code=400)
+    
+    return api_response(days=access_rollup_service.get_daily_totals(start_date, end_date))
+
+
+@log_bp.route('/access-stats/latency', methods=['GET'])
+@handle_exceptions
+def get_latency_percentiles():
+    """按接口模板或按小时返回响应时间分位数（合并小时级草图，不扫描原始日志）
+    
+    start_time/end_time 为 ISO 格式时间，默认最近 24 小时；quantiles 为逗号分隔的分位数，如 0.5,0.95,0.99
+    """
+    params = get_request_params({
+        'start_time': {'type': str, 'required': False},
+        'end_time': {'type': str, 'required': False},
+        'api_template': {'type': str, 'required': False},
+        'group_by': {'type': str, 'default': 'api_template'},
+        'quantiles': {'type': str, 'default': '0.5,0.95,0.99'},
+        'order_by': {'type': str, 'default': 'p95'},
+        'limit': {'type': int, 'default': 50}
+    })
+    
+    try:
+        end_time = datetime.fromisoformat(params['end_time']) if params.get('end_time') else datetime.now()
+        start_time = datetime.fromisoformat(params['start_time']) if params.get('start_time') else end_time - timedelta(hours=24)
+        quantiles = tuple(float(value) for value in params['quantiles'].split(',') if value.strip())
+        if not quantiles or any(not 0 <= quantile <= 1 for quantile in quantiles):
+            raise ValueError('quantiles must be between 0 and 1')
+        
+        percentiles = access_rollup_service.get_latency_percentiles(
+            start_time, end_time,
+            api_template=params.get('api_template'),
+            group_by=params['group_by'],
+            quantiles=quantiles,
+            order_by=params['order_by'],
+            limit=params['limit']
+        )
+    except ValueError as e:
+        return api_response(success=False, error=str(e), status_code=400)
+    
+    return api_response(
+        start_time=start_time.isoformat(),
+        end_time=end_time.isoformat(),
+        percentiles=percentiles,
+        count=len(percentiles)
+    )
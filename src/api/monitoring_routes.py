@@ -155,14 +155,26 @@ def get_application_summary(application):
 @token_required
 @handle_exceptions
 def get_scheduler_status():
-    """获取调度器状态"""
+    """
+    获取调度器状态
+    
+    返回各定时任务的下次执行时间、最近一次执行结果和耗时统计，以及最近的执行记录。
+    支持参数：
+    - job_id: 只返回该任务的执行记录
+    - history_limit: 执行记录条数（默认 20）
+    """
+    params = get_request_params({
+        'job_id': {'type': str, 'required': False},
+        'history_limit': {'type': int, 'default': 20}
+    })
     try:
         jobs_status = monitoring_scheduler.get_jobs_status()
         return api_response(
             success=True,
             running=monitoring_scheduler.scheduler.running,
             jobs=jobs_status,
-            count=len(jobs_status)
+            count=len(jobs_status),
+            history=monitoring_scheduler.get_job_history(params.get('job_id'), params['history_limit'])
         )
     except Exception as e:
         return api_response(
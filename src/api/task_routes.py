@@ -5,6 +5,7 @@
 - 获取任务状态
 - 查询任务列表
 - 取消任务
+- 任务队列状态
 """
 
 from flask import Blueprint
@@ -17,6 +18,17 @@ from utils.errorhandler import handle_exceptions
 task_bp = Blueprint('task', __name__)
 
 
+@task_bp.route('/queue', methods=['GET'])
+@token_required
+@handle_exceptions
+def get_task_queue():
+    """获取任务队列状态（各类任务的等待数、运行数和并发上限）"""
+    return api_response(
+        success=True,
+        queue=task_service.get_queue_stats()
+    )
+
+
 @task_bp.route('/<task_id>', methods=['GET'])
 @token_required
 @handle_exceptions
@@ -88,17 +100,25 @@ def get_tasks():
 @token_required
 @handle_exceptions
 def cancel_task(task_id):
-    """取消任务（仅限等待中的任务）"""
+    """
+    取消任务
+    
+    等待中的任务立即取消；运行中的同步任务在下一个检查点（仓库之间、分页之间）停止，
+    可轮询任务状态确认已变为 cancelled
+    """
     success = task_service.cancel_task(task_id)
     
     if success:
+        task = task_service.get_task(task_id)
+        cancelled = task is not None and task['status'] == TaskStatus.CANCELLED.value
         return api_response(
             success=True,
-            message='任务已取消'
+            message='任务已取消' if cancelled else '已请求取消，任务将在下一个检查点停止',
+            task=task
         )
     else:
         return api_response(
             success=False,
-            error='无法取消任务（任务不存在或已开始执行）',
+            error='无法取消任务（任务不存在或已结束）',
             status_code=400
         )
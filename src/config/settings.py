@@ -15,8 +15,8 @@
 
 import os
 import re
-from typing import Optional
-from dataclasses import dataclass
+from typing import Dict, Optional
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -250,14 +250,102 @@ class AppConfig:
 class TaskConfig:
     """异步任务配置"""
     min_interval: int = 300  # 5 分钟
-    max_concurrent: int = 10
+    max_concurrent: int = 10  # 每个进程执行任务的工作线程数
+    worker_enabled: bool = True  # 是否在本进程执行任务，关闭后只负责创建任务（由其他进程执行）
+    poll_interval: int = 2  # 工作线程空闲时轮询任务表的间隔（秒）
+    lease_seconds: int = 60  # 任务租约时长（秒），执行中每 1/3 租约续约一次
+    max_attempts: int = 2  # 工作进程退出（租约过期）后任务最多被执行的次数
+    default_type_concurrency: int = 2  # 每种任务（处理函数）默认的全局并发上限
+    type_concurrency: Dict[str, int] = field(default_factory=dict)  # 按任务处理函数单独设置的并发上限
+    max_queue_depth: int = 100  # 等待执行的任务总数上限，超过后拒绝创建新任务
+    max_queue_per_type: int = 10  # 每种任务（处理函数）等待执行的任务数上限
     
     @classmethod
     def from_env(cls):
         """从环境变量加载配置"""
         return cls(
             min_interval=int(os.getenv("TASK_MIN_INTERVAL", "300")),
-            max_concurrent=int(os.getenv("MAX_CONCURRENT_TASKS", "10"))
+            max_concurrent=int(os.getenv("MAX_CONCURRENT_TASKS", "10")),
+            worker_enabled=os.getenv("TASK_WORKER_ENABLED", "true").lower() == "true",
+            poll_interval=int(os.getenv("TASK_POLL_INTERVAL", "2")),
+            lease_seconds=int(os.getenv("TASK_LEASE_SECONDS", "60")),
+            max_attempts=int(os.getenv("TASK_MAX_ATTEMPTS", "2")),
+            default_type_concurrency=int(os.getenv("TASK_DEFAULT_TYPE_CONCURRENCY", "2")),
+            type_concurrency=cls._parse_type_concurrency(os.getenv("TASK_TYPE_CONCURRENCY", "")),
+            max_queue_depth=int(os.getenv("TASK_MAX_QUEUE_DEPTH", "100")),
+            max_queue_per_type=int(os.getenv("TASK_MAX_QUEUE_PER_TYPE", "10"))
+        )
+    
+    @staticmethod
+    def _parse_type_concurrency(value: str) -> Dict[str, int]:
+        """解析 "sync_all=1,sync_branches=3" 格式的并发上限配置"""
+        limits = {}
+        for item in value.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            name, sep, limit = item.partition('=')
+            if not sep or not limit.strip().isdigit():
+                raise ConfigurationError(f"TASK_TYPE_CONCURRENCY 格式错误: {item}，应为 任务类型=并发数")
+            limits[name.strip()] = int(limit)
+        return limits
+    
+    def concurrency_for(self, handler: str) -> int:
+        """任务处理函数的全局并发上限"""
+        return self.type_concurrency.get(handler, self.default_type_concurrency)
+
+
+@dataclass
+class SyncConfig:
+    """GitLab 数据同步配置"""
+    concurrent: bool = False
+    max_workers: int = 8  # 仓库级 / 提交查询级线程池大小
+    max_inflight_requests: int = 16  # 全局同时在途的 GitLab 请求上限
+    incremental_overlap_minutes: int = 60  # 增量同步水位回退时间，GitLab 最多每小时刷新一次 last_activity_at
+    lazy_projects: bool = True  # 分支/权限同步使用 lazy 项目对象，省去逐个 projects.get() 请求
+    schedule_enabled: bool = False  # 是否由调度器定时同步
+    incremental_interval_minutes: int = 30  # 定时增量同步间隔（分钟），0 表示不执行
+    full_sync_time: str = "02:00"  # 每晚全量同步并重新生成分支汇总的时间（HH:MM），为空表示不执行
+    schedule_jitter_seconds: int = 300  # 定时同步的随机延迟上限（秒），错开多个副本和整点负载
+    
+    @classmethod
+    def from_env(cls):
+        """从环境变量加载配置"""
+        return cls(
+            concurrent=os.getenv("SYNC_CONCURRENT", "false").lower() == "true",
+            max_workers=int(os.getenv("SYNC_MAX_WORKERS", "8")),
+            max_inflight_requests=int(os.getenv("SYNC_MAX_INFLIGHT_REQUESTS", "16")),
+            incremental_overlap_minutes=int(os.getenv("SYNC_INCREMENTAL_OVERLAP_MINUTES", "60")),
+            lazy_projects=os.getenv("SYNC_LAZY_PROJECTS", "true").lower() == "true",
+            schedule_enabled=os.getenv("SYNC_SCHEDULE_ENABLED", "false").lower() == "true",
+            incremental_interval_minutes=int(os.getenv("SYNC_INCREMENTAL_INTERVAL_MINUTES", "30")),
+            full_sync_time=os.getenv("SYNC_FULL_SYNC_TIME", "02:00").strip(),
+            schedule_jitter_seconds=int(os.getenv("SYNC_SCHEDULE_JITTER_SECONDS", "300"))
+        )
+
+
+@dataclass
+class LogIngestConfig:
+    """访问日志导入配置"""
+    chunk_size: int = 5000  # 每批写入数据库的日志行数
+    workers: int = 1  # 并行解析的进程数，1 表示单进程流式导入
+    follow_interval: int = 5  # 跟随导入模式的轮询间隔（秒）
+    partition_interval: str = "day"  # PostgreSQL 分区表的分区粒度：day 或 month
+    retention_days: int = 0  # 访问日志保留天数，0 表示不清理
+    archive_dir: str = "archive/access_log"  # 访问日志 Parquet 归档目录
+    archive_on_cleanup: bool = False  # 清理过期访问日志前先归档
+    
+    @classmethod
+    def from_env(cls):
+        """从环境变量加载配置"""
+        return cls(
+            chunk_size=int(os.getenv("LOG_INGEST_CHUNK_SIZE", "5000")),
+            workers=int(os.getenv("LOG_INGEST_WORKERS", "1")),
+            follow_interval=int(os.getenv("LOG_FOLLOW_INTERVAL", "5")),
+            partition_interval=os.getenv("LOG_PARTITION_INTERVAL", "day").lower(),
+            retention_days=int(os.getenv("LOG_RETENTION_DAYS", "0")),
+            archive_dir=os.getenv("LOG_ARCHIVE_DIR", "archive/access_log"),
+            archive_on_cleanup=os.getenv("LOG_ARCHIVE_ON_CLEANUP", "false").lower() == "true"
         )
 
 
@@ -289,6 +377,8 @@ class Settings:
             self.ldap = LDAPConfig.from_env()
             self.logging = LoggingConfig.from_env()
             self.task = TaskConfig.from_env()
+            self.sync = SyncConfig.from_env()
+            self.log_ingest = LogIngestConfig.from_env()
         except ConfigurationError:
             # 重新抛出配置错误，不包装
             raise
@@ -317,6 +407,48 @@ class Settings:
                 f"LOG_FORMAT 必须是 {valid_log_formats} 之一，当前值: {self.logging.format}"
             )
         
+        # 验证同步并发配置
+        if self.sync.max_workers < 1:
+            errors.append(f"SYNC_MAX_WORKERS 必须大于 0，当前值: {self.sync.max_workers}")
+        if self.sync.max_inflight_requests < 1:
+            errors.append(f"SYNC_MAX_INFLIGHT_REQUESTS 必须大于 0，当前值: {self.sync.max_inflight_requests}")
+        if self.sync.incremental_interval_minutes < 0:
+            errors.append(
+                f"SYNC_INCREMENTAL_INTERVAL_MINUTES 不能为负数，当前值: {self.sync.incremental_interval_minutes}"
+            )
+        if self.sync.full_sync_time and not re.fullmatch(r'([01]?\d|2[0-3]):[0-5]\d', self.sync.full_sync_time):
+            errors.append(f"SYNC_FULL_SYNC_TIME 格式应为 HH:MM，当前值: {self.sync.full_sync_time}")
+        if self.sync.schedule_jitter_seconds < 0:
+            errors.append(f"SYNC_SCHEDULE_JITTER_SECONDS 不能为负数，当前值: {self.sync.schedule_jitter_seconds}")
+        
+        # 验证日志导入配置
+        if self.log_ingest.chunk_size < 1:
+            errors.append(f"LOG_INGEST_CHUNK_SIZE 必须大于 0，当前值: {self.log_ingest.chunk_size}")
+        if self.log_ingest.workers < 1:
+            errors.append(f"LOG_INGEST_WORKERS 必须大于 0，当前值: {self.log_ingest.workers}")
+        if self.log_ingest.follow_interval < 1:
+            errors.append(f"LOG_FOLLOW_INTERVAL 必须大于 0，当前值: {self.log_ingest.follow_interval}")
+        if self.log_ingest.partition_interval not in ('day', 'month'):
+            errors.append(f"LOG_PARTITION_INTERVAL 必须为 day 或 month，当前值: {self.log_ingest.partition_interval}")
+        if self.log_ingest.retention_days < 0:
+            errors.append(f"LOG_RETENTION_DAYS 不能为负数，当前值: {self.log_ingest.retention_days}")
+        
+        # 验证异步任务配置
+        if self.task.max_concurrent < 1:
+            errors.append(f"MAX_CONCURRENT_TASKS 必须大于 0，当前值: {self.task.max_concurrent}")
+        if self.task.poll_interval < 1:
+            errors.append(f"TASK_POLL_INTERVAL 必须大于 0，当前值: {self.task.poll_interval}")
+        if self.task.lease_seconds < 10:
+            errors.append(f"TASK_LEASE_SECONDS 不能小于 10，当前值: {self.task.lease_seconds}")
+        if self.task.max_attempts < 1:
+            errors.append(f"TASK_MAX_ATTEMPTS 必须大于 0，当前值: {self.task.max_attempts}")
+        if self.task.default_type_concurrency < 1 or any(limit < 1 for limit in self.task.type_concurrency.values()):
+            errors.append("TASK_DEFAULT_TYPE_CONCURRENCY 和 TASK_TYPE_CONCURRENCY 中的并发数必须大于 0")
+        if self.task.max_queue_depth < 1:
+            errors.append(f"TASK_MAX_QUEUE_DEPTH 必须大于 0，当前值: {self.task.max_queue_depth}")
+        if self.task.max_queue_per_type < 1:
+            errors.append(f"TASK_MAX_QUEUE_PER_TYPE 必须大于 0，当前值: {self.task.max_queue_per_type}")
+        
         # 生产环境检查
         if self.app.environment == "production":
             if self.app.debug:
@@ -397,7 +529,35 @@ class Settings:
             },
             "task": {
                 "min_interval": self.task.min_interval,
-                "max_concurrent": self.task.max_concurrent
+                "max_concurrent": self.task.max_concurrent,
+                "worker_enabled": self.task.worker_enabled,
+                "poll_interval": self.task.poll_interval,
+                "lease_seconds": self.task.lease_seconds,
+                "max_attempts": self.task.max_attempts,
+                "default_type_concurrency": self.task.default_type_concurrency,
+                "type_concurrency": self.task.type_concurrency,
+                "max_queue_depth": self.task.max_queue_depth,
+                "max_queue_per_type": self.task.max_queue_per_type
+            },
+            "sync": {
+                "concurrent": self.sync.concurrent,
+                "max_workers": self.sync.max_workers,
+                "max_inflight_requests": self.sync.max_inflight_requests,
+                "incremental_overlap_minutes": self.sync.incremental_overlap_minutes,
+                "lazy_projects": self.sync.lazy_projects,
+                "schedule_enabled": self.sync.schedule_enabled,
+                "incremental_interval_minutes": self.sync.incremental_interval_minutes,
+                "full_sync_time": self.sync.full_sync_time,
+                "schedule_jitter_seconds": self.sync.schedule_jitter_seconds
+            },
+            "log_ingest": {
+                "chunk_size": self.log_ingest.chunk_size,
+                "workers": self.log_ingest.workers,
+                "follow_interval": self.log_ingest.follow_interval,
+                "partition_interval": self.log_ingest.partition_interval,
+                "retention_days": self.log_ingest.retention_days,
+                "archive_dir": self.log_ingest.archive_dir,
+                "archive_on_cleanup": self.log_ingest.archive_on_cleanup
             }
         }
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Date, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Float, Date, Boolean, JSON, LargeBinary, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -46,18 +46,30 @@ class User(Base):
         return f"<User(username='{self.username}', is_admin={self.is_admin})>"
 
 class GitlabApiAccessLog(Base):
+    # PostgreSQL 下可转换为按 access_time 范围分区的分区表（scripts/partition_access_log.py），
+    # 转换后数据库主键为 (id, access_time)，ORM 仍以 id 标识行
     __tablename__ = 'gitlab_api_access_log'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     access_time = Column(DateTime, nullable=False)
     client_ip = Column(String(45), nullable=False)
     http_method = Column(String(10), nullable=False)
-    api_path = Column(Text, nullable=False)
+    api_path = Column(Text, nullable=False)  # 请求路径（不含查询字符串）
+    api_template = Column(String(500), nullable=True)  # 接口模板，如 /api/v4/projects/:id/repository/branches
     http_status = Column(Integer, nullable=False)
     response_size = Column(Integer, nullable=True)
     user_agent = Column(Text, nullable=True)
     response_time = Column(Float, nullable=True)
-    extra = Column(JSON, nullable=True)
+    extra = Column(JSON(none_as_null=True), nullable=True)  # 查询字符串等附加信息
+    
+    __table_args__ = (
+        # 日志查询按访问时间倒序
+        Index('idx_access_log_time', 'access_time'),
+        # 按接口模板统计或查询某个接口的访问记录
+        Index('idx_access_log_template_time', 'api_template', 'access_time'),
+        # SQLite 不复用已删除的 id，归档按 id 范围识别已导出的行（见 log_archive_service）
+        {'sqlite_autoincrement': True},
+    )
 
 class LogImportStatus(Base):
     __tablename__ = 'log_import_status'
@@ -68,6 +80,107 @@ class LogImportStatus(Base):
     import_time = Column(DateTime, nullable=False, default=datetime.now)
     log_file_path = Column(String(500), nullable=True)
     is_complete = Column(Boolean, nullable=False, default=True)
+    import_run_id = Column(String(36), nullable=True)  # 写入该日期的导入（log_import_run），未完成时据此判断导入是否仍在进行
+
+# 日志导入的运行记录，导入期间定期更新心跳；未结束且心跳未过期的导入视为仍在进行，其未完成的日期不会被其他导入清除
+class LogImportRun(Base):
+    __tablename__ = 'log_import_run'
+    
+    run_id = Column(String(36), primary_key=True)
+    owner = Column(String(255), nullable=True)  # 执行导入的进程（主机名:进程号）
+    log_file_path = Column(String(500), nullable=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    heartbeat_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+# 访问日志按天预聚合（日期 × 接口模板 × 方法 × 状态码类别），导入时增量维护
+class ApiAccessDailyRollup(Base):
+    __tablename__ = 'api_access_daily_rollup'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    rollup_date = Column(Date, nullable=False)
+    api_template = Column(String(500), nullable=False)  # 接口路径模板，如 /api/v4/projects/:id/repository/branches
+    http_method = Column(String(10), nullable=False)
+    status_class = Column(Integer, nullable=False)  # 状态码类别：2 表示 2xx，5 表示 5xx
+    request_count = Column(BigInteger, nullable=False, default=0)
+    response_size_sum = Column(BigInteger, nullable=False, default=0)
+    response_time_count = Column(BigInteger, nullable=False, default=0)  # 有响应时间的请求数
+    response_time_sum = Column(Float, nullable=False, default=0)
+    response_time_min = Column(Float, nullable=True)
+    response_time_max = Column(Float, nullable=True)
+    latency_histogram = Column(JSON, nullable=True)  # 各延迟区间的请求数，区间见 access_rollup_service.LATENCY_BUCKETS
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        UniqueConstraint('rollup_date', 'api_template', 'http_method', 'status_class', name='uq_access_daily_rollup_key'),
+    )
+
+# 访问日志按天、按客户端 IP 预聚合
+class ApiAccessClientRollup(Base):
+    __tablename__ = 'api_access_client_rollup'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    rollup_date = Column(Date, nullable=False)
+    client_ip = Column(String(45), nullable=False)
+    request_count = Column(BigInteger, nullable=False, default=0)
+    error_count = Column(BigInteger, nullable=False, default=0)  # 状态码 >= 400 的请求数
+    response_size_sum = Column(BigInteger, nullable=False, default=0)
+    response_time_count = Column(BigInteger, nullable=False, default=0)
+    response_time_sum = Column(Float, nullable=False, default=0)
+    response_time_min = Column(Float, nullable=True)
+    response_time_max = Column(Float, nullable=True)
+    latency_histogram = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        UniqueConstraint('rollup_date', 'client_ip', name='uq_access_client_rollup_key'),
+    )
+
+# 响应时间分位数草图（小时 × 接口模板），查询任意时间窗口的分位数时合并草图，不扫描原始日志
+class ApiLatencySketch(Base):
+    __tablename__ = 'api_latency_sketch'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bucket_start = Column(DateTime, nullable=False)  # 小时起点
+    api_template = Column(String(500), nullable=False)
+    sample_count = Column(BigInteger, nullable=False, default=0)  # 草图中有响应时间的请求数
+    sketch = Column(LargeBinary, nullable=False)  # DDSketch 序列化结果，见 services/latency_sketch.py
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        UniqueConstraint('bucket_start', 'api_template', name='uq_latency_sketch_key'),
+        Index('idx_latency_sketch_template_bucket', 'api_template', 'bucket_start'),
+    )
+
+# 日志跟随导入的断点（每个日志源一条）
+class LogIngestCheckpoint(Base):
+    __tablename__ = 'log_ingest_checkpoint'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_key = Column(String(500), nullable=False, unique=True)  # 日志源标识：跟随导入为日志文件路径，按文件导入为 content:<内容标识>
+    log_file_path = Column(String(500), nullable=False)
+    inode = Column(BigInteger, nullable=True)  # 当前读取文件的 inode，用于识别日志轮转
+    offset = Column(BigInteger, nullable=False, default=0)  # 已导入内容的字节偏移（总在行尾）
+    fingerprint = Column(String(64), nullable=True)  # 文件首行（解压后）的哈希，inode 被复用或文件被压缩后识别同一内容
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+# 日志跟随导入的运行状态（每个日志源一条），由运行跟随导入的进程定期更新，任意进程都可查询或请求停止
+class LogFollowerState(Base):
+    __tablename__ = 'log_follower_state'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_key = Column(String(500), nullable=False, unique=True)  # 同 log_ingest_checkpoint.source_key
+    log_file_path = Column(String(500), nullable=False)
+    owner = Column(String(255), nullable=True)  # 运行跟随导入的进程（主机名:进程号）
+    interval = Column(Integer, nullable=False, default=5)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # 最近一次轮询时间，长时间未更新视为进程已退出
+    stopped_at = Column(DateTime, nullable=True)
+    stop_requested = Column(Boolean, nullable=False, default=False)  # 其他进程请求停止，运行进程下次轮询时停止
+    lines_ingested = Column(BigInteger, nullable=False, default=0)
+    batches = Column(Integer, nullable=False, default=0)
+    rotations = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
 
 class GitlabRepository(Base):
     __tablename__ = 'gitlab_repository'
@@ -85,6 +198,19 @@ class GitlabRepository(Base):
     last_activity_at = Column(DateTime, nullable=True)
     sync_time = Column(DateTime, nullable=False, default=datetime.now)
 
+# 增量同步水位表 - 记录每类资源最近一次同步覆盖到的 last_activity_at
+class GitlabSyncWatermark(Base):
+    __tablename__ = 'gitlab_sync_watermark'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    resource = Column(String(50), nullable=False, unique=True)  # 资源类型：repositories, branches, permissions
+    watermark = Column(DateTime, nullable=True)  # 已同步到的最大 last_activity_at
+    sync_mode = Column(String(20), nullable=True)  # 最近一次同步方式：incremental / full
+    last_sync_time = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    def __repr__(self):
+        return f"<GitlabSyncWatermark(resource='{self.resource}', watermark={self.watermark})>"
+
 # 表2：组织及其用户表
 class GitlabGroup(Base):
     __tablename__ = 'gitlab_group'
@@ -112,6 +238,11 @@ class GitlabGroupMember(Base):
     sync_time = Column(DateTime, nullable=False, default=datetime.now)
     
     group = relationship("GitlabGroup", backref="members")
+    
+    __table_args__ = (
+        # 成员同步按 (group_id, user_id) 比对，同时用于按组查询
+        UniqueConstraint('group_id', 'user_id', name='uq_group_member_group_user'),
+    )
 
 # 分支规则表（手动维护）- 必须在 GitlabRepositoryBranch 之前定义
 class GitlabBranchRule(Base):
@@ -157,6 +288,25 @@ class GitlabRepositoryBranch(Base):
     
     repository = relationship("GitlabRepository", backref="branches")
     matched_rule = relationship("GitlabBranchRule", backref="matched_branches")
+    
+    __table_args__ = (
+        # 分支同步按 (repository_id, branch_name) 比对，同时用于按仓库查询
+        UniqueConstraint('repository_id', 'branch_name', name='uq_branch_repository_name'),
+        # 统计/检查规则被多少分支使用
+        Index('idx_branch_matched_rule', 'matched_rule_id'),
+        # 可删除分支及按最后提交时间筛选过期分支
+        Index('idx_branch_deletable_commit_date', 'is_deletable', 'last_commit_date'),
+    )
+
+# 仓库分支规则分析状态 - 记录最近一次全量分析使用的规则集指纹，规则变化、分析失败或跨天后重新全量分析
+class GitlabBranchAnalysisState(Base):
+    __tablename__ = 'gitlab_branch_analysis_state'
+    
+    repository_id = Column(Integer, primary_key=True)  # GitLab仓库ID
+    rule_fingerprint = Column(String(64), nullable=True)  # 最近一次成功全量分析时的规则集指纹
+    analyzed_at = Column(DateTime, nullable=True)  # 最近一次成功全量分析的时间
+    success = Column(Boolean, nullable=False, default=True)  # 最近一次分析是否成功
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
 
 # 表4：仓库权限信息表
 class GitlabRepositoryPermission(Base):
@@ -172,6 +322,11 @@ class GitlabRepositoryPermission(Base):
     sync_time = Column(DateTime, nullable=False, default=datetime.now)
     
     repository = relationship("GitlabRepository", backref="permissions")
+    
+    __table_args__ = (
+        # 权限同步和查询均按仓库过滤
+        Index('idx_permission_repository', 'repository_id'),
+    )
 
 # 分支清理历史汇总表 - 添加在现有模型之后
 class GitlabBranchCleanupHistory(Base):
@@ -496,6 +651,139 @@ class GitlabBranchSummary(Base):
     def __repr__(self):
         return f"<GitlabBranchSummary(repo_id={self.repository_id}, total={self.total_branches})>"
 
+# 后台任务表 - 多个进程共享的任务队列，工作线程通过租约（lease）认领并定期续约
+class BackgroundTask(Base):
+    __tablename__ = 'background_task'
+    
+    task_id = Column(String(36), primary_key=True)
+    task_type = Column(String(100), nullable=False)  # 任务类型，如 sync_branches_123，用于防重复
+    handler = Column(String(100), nullable=False)  # 注册的任务处理函数名，如 sync_branches，用于并发限制
+    params = Column(JSON, nullable=True)  # 处理函数的关键字参数
+    status = Column(String(20), nullable=False, default='pending')  # pending/running/completed/failed/cancelled
+    priority = Column(Integer, nullable=False, default=0)  # 优先级，数值大的先执行，相同时按创建时间
+    active_key = Column(String(100), nullable=True, unique=True)  # 不允许重复的任务在等待/运行期间为 task_type，结束后置空
+    progress = Column(Integer, nullable=False, default=0)
+    progress_detail = Column(JSON, nullable=True)  # 当前阶段、已处理/总数、预计剩余时间等
+    message = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)  # 运行中的任务已被请求取消，在下一个检查点停止
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    task_metadata = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)  # 已被认领执行的次数
+    worker_id = Column(String(100), nullable=True)  # 当前执行的工作线程，如 hostname:pid:thread
+    lease_expires_at = Column(DateTime, nullable=True)  # 租约到期后仍未续约视为工作进程已退出
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # 认领任务按状态、优先级和创建时间扫描
+        Index('idx_background_task_status_priority', 'status', 'priority', 'created_at'),
+        Index('idx_background_task_type_created', 'task_type', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f"<BackgroundTask(task_id='{self.task_id}', task_type='{self.task_type}', status='{self.status}')>"
+
+# 全量同步（sync_all）运行记录 - 记录各阶段的状态和耗时，中断后可从检查点继续
+class SyncRun(Base):
+    __tablename__ = 'sync_run'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    mode = Column(String(20), nullable=False)  # full / incremental
+    status = Column(String(20), nullable=False, default='running')  # running/completed/failed/cancelled
+    stages = Column(JSON, nullable=True)  # 阶段 -> {status, seconds, started_at, finished_at}
+    watermarks = Column(JSON, nullable=True)  # 分支/权限阶段开始时记录的水位候选值，继续执行时沿用
+    resume_count = Column(Integer, nullable=False, default=0)  # 从检查点继续执行的次数
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+    
+    repositories = relationship("SyncRunRepository", back_populates="run", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index('idx_sync_run_status_started', 'status', 'started_at'),
+    )
+    
+    def __repr__(self):
+        return f"<SyncRun(id={self.id}, mode='{self.mode}', status='{self.status}')>"
+
+# 全量同步中每个仓库各阶段（仓库、分支、权限、规则分析）的状态和耗时
+class SyncRunRepository(Base):
+    __tablename__ = 'sync_run_repository'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey('sync_run.id', ondelete='CASCADE'), nullable=False)
+    repository_id = Column(Integer, nullable=False)
+    repository_status = Column(String(20), nullable=True)  # done / failed，未执行时为空
+    branches_status = Column(String(20), nullable=True)
+    analysis_status = Column(String(20), nullable=True)
+    permissions_status = Column(String(20), nullable=True)
+    branches_seconds = Column(Float, nullable=True)  # 拉取并写入分支的耗时
+    analysis_seconds = Column(Float, nullable=True)  # 分支规则分析的耗时
+    permissions_seconds = Column(Float, nullable=True)
+    branch_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+    
+    run = relationship("SyncRun", back_populates="repositories")
+    
+    __table_args__ = (
+        UniqueConstraint('run_id', 'repository_id', name='uq_sync_run_repository'),
+    )
+    
+    def to_dict(self):
+        return {
+            'repository_id': self.repository_id,
+            'repository_status': self.repository_status,
+            'branches_status': self.branches_status,
+            'analysis_status': self.analysis_status,
+            'permissions_status': self.permissions_status,
+            'branches_seconds': self.branches_seconds,
+            'analysis_seconds': self.analysis_seconds,
+            'permissions_seconds': self.permissions_seconds,
+            'branch_count': self.branch_count,
+            'error': self.error,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f"<SyncRunRepository(run_id={self.run_id}, repository_id={self.repository_id})>"
+
+# 定时任务执行记录 - 记录调度器每次执行的开始/结束时间、耗时和结果，多个副本共享
+class ScheduledJobRun(Base):
+    __tablename__ = 'scheduled_job_run'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(100), nullable=False)  # 调度器任务 ID，如 gitlab_incremental_sync
+    status = Column(String(20), nullable=False, default='running')  # running/completed/failed/cancelled/skipped/timeout/interrupted
+    host = Column(String(100), nullable=True)  # 执行的进程，如 hostname:pid
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    message = Column(Text, nullable=True)
+    details = Column(JSON, nullable=True)  # 各步骤（后台任务）的 ID、状态和耗时
+    
+    __table_args__ = (
+        Index('idx_scheduled_job_run_job_started', 'job_id', 'started_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_id': self.job_id,
+            'status': self.status,
+            'host': self.host,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'duration_seconds': self.duration_seconds,
+            'message': self.message,
+            'details': self.details
+        }
+    
+    def __repr__(self):
+        return f"<ScheduledJobRun(job_id='{self.job_id}', status='{self.status}', started_at='{self.started_at}')>"
+
 def create_tables(engine):
     """创建数据库表"""
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -40,16 +40,31 @@ class CountableResult(BaseResult):
 class SyncResult(CountableResult):
     """同步操作结果 DTO"""
     total_found: int = 0
+    inserted: int = 0  # 新增行数
+    updated: int = 0  # 内容有变化而更新的行数
+    unchanged: int = 0  # 内容未变化、未写入的行数
+    deleted: int = 0  # 源端已不存在而删除的行数
     
     @classmethod
-    def create_success(cls, synced_count: int, total_found: int, message: str = None) -> 'SyncResult':
+    def create_success(cls, synced_count: int, total_found: int, message: str = None,
+                       inserted: int = 0, updated: int = 0, unchanged: int = 0,
+                       deleted: int = 0) -> 'SyncResult':
         """创建成功的同步结果"""
         default_message = f"Successfully synced {synced_count}/{total_found} items"
+        if inserted or updated or unchanged or deleted:
+            default_message += f" (inserted {inserted}, updated {updated}, unchanged {unchanged}"
+            if deleted:
+                default_message += f", deleted {deleted}"
+            default_message += ")"
         return cls(
             success=True,
             count=synced_count,
             total_found=total_found,
-            message=message or default_message
+            message=message or default_message,
+            inserted=inserted,
+            updated=updated,
+            unchanged=unchanged,
+            deleted=deleted
         )
 
 @dataclass
@@ -92,11 +92,16 @@ class GitlabBranchData(DataTransformMixin):
     
     @classmethod
     def from_model(cls, branch, commit=None) -> 'GitlabBranchData':
-        """从 GitLab 分支对象创建 DTO"""
+        """从 GitLab 分支对象创建 DTO
+        
+        分支列表接口返回的 branch.commit 已内嵌提交 id、提交时间、作者和提交信息，
+        默认直接使用这些数据；仅当传入 commit（深度同步时单独拉取的提交详情）时以其为准。
+        """
+        payload = branch.commit or {}
         if commit:
             return cls(
                 branch_name=branch.name,
-                commit_id=branch.commit['id'],
+                commit_id=payload.get('id') or commit.id,
                 commit_message=commit.message,
                 commit_author_name=commit.author_name,
                 commit_author_email=commit.author_email,
@@ -106,11 +111,11 @@ class GitlabBranchData(DataTransformMixin):
         else:
             return cls(
                 branch_name=branch.name,
-                commit_id=branch.commit['id'],
-                commit_message=branch.commit.get('message', ''),
-                commit_author_name=branch.commit.get('author_name', ''),
-                commit_author_email=branch.commit.get('author_email', ''),
-                last_commit_date=branch.commit.get('committed_date'),
+                commit_id=payload.get('id'),
+                commit_message=payload.get('message', ''),
+                commit_author_name=payload.get('author_name', ''),
+                commit_author_email=payload.get('author_email', ''),
+                last_commit_date=payload.get('committed_date') or payload.get('created_at'),
                 protected=branch.protected
             )
 
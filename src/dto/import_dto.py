@@ -1,5 +1,5 @@
 from datetime import datetime, date
-from typing import List, Optional
+from typing import Dict, List, Optional
 from dataclasses import dataclass
 from .base_dto import BaseResult, CountableResult
 
@@ -37,12 +37,16 @@ class ImportResult(CountableResult):
     """导入结果 DTO"""
     imported_dates: List[date] = None
     already_imported_dates: List[date] = None
+    total_found: int = 0  # 解析出的日志行数（含因日期已导入而跳过的行）
+    date_counts: Dict[date, int] = None  # 各日期导入的行数
     
     def __post_init__(self):
         if self.imported_dates is None:
             self.imported_dates = []
         if self.already_imported_dates is None:
             self.already_imported_dates = []
+        if self.date_counts is None:
+            self.date_counts = {}
     
     @classmethod
     def create_success(cls, imported_count: int, total_found: int, imported_dates: List[date]) -> 'ImportResult':
@@ -50,6 +54,7 @@ class ImportResult(CountableResult):
         return cls(
             success=True,
             count=imported_count,
+            total_found=total_found,
             imported_dates=imported_dates,
             message=f"Successfully imported {imported_count} records from {len(imported_dates)} dates"
         )
@@ -60,6 +65,7 @@ class ImportResult(CountableResult):
         return cls(
             success=False,
             count=0,
+            total_found=total_records,
             already_imported_dates=already_imported_dates,
             message=f"Data for {len(already_imported_dates)} dates already imported ({total_records} records)"
         )
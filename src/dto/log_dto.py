@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from typing import Optional
 from dataclasses import dataclass
@@ -15,6 +16,8 @@ class ApiAccessLogData(DataTransformMixin):
     response_size: Optional[int]
     user_agent: Optional[str]
     response_time: Optional[float]
+    api_template: Optional[str] = None
+    extra: Optional[dict] = None
     
     @classmethod
     def from_model(cls, log_model) -> 'ApiAccessLogData':
@@ -28,5 +31,24 @@ class ApiAccessLogData(DataTransformMixin):
             http_status=log_model.http_status,
             response_size=log_model.response_size,
             user_agent=log_model.user_agent,
-            response_time=log_model.response_time
+            response_time=log_model.response_time,
+            api_template=log_model.api_template,
+            extra=log_model.extra
+        )
+    
+    @classmethod
+    def from_archive_row(cls, row: dict) -> 'ApiAccessLogData':
+        """从 Parquet 归档中读取的行创建 DTO（extra 以 JSON 文本存储）"""
+        return cls(
+            id=row['id'],
+            access_time=row['access_time'].isoformat(),
+            client_ip=row['client_ip'],
+            http_method=row['http_method'],
+            api_path=row['api_path'],
+            http_status=row['http_status'],
+            response_size=row['response_size'],
+            user_agent=row['user_agent'],
+            response_time=row['response_time'],
+            api_template=row['api_template'],
+            extra=json.loads(row['extra']) if row['extra'] else None
         )
\ No newline at end of file
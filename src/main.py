@@ -22,6 +22,7 @@ from middleware.logging_middleware import LoggingMiddleware
 from utils.logger import get_logger
 from config.settings import settings
 from services.scheduler import monitoring_scheduler
+from services.task_service import task_service
 
 # 初始化日志系统（在应用创建之前）
 init_logging()
@@ -84,6 +85,13 @@ def create_app():
         logger.error(f"启动监控调度器失败: {e}")
         # 即使调度器启动失败，也继续运行应用
     
+    # 启动后台任务工作线程（TASK_WORKER_ENABLED=false 时由 scripts/run_task_worker.py 执行任务）
+    if settings.task.worker_enabled:
+        try:
+            task_service.start_workers()
+        except Exception as e:
+            logger.error(f"启动任务工作线程失败: {e}")
+    
     # Serve frontend static files
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
@@ -0,0 +1,135 @@
+"""
+数据库迁移脚本 - 为访问日志增加接口模板列
+
+    1. gitlab_api_access_log 增加 api_template 列
+    2. 按 id 分批回填已有数据：api_template 为接口模板，api_path 去掉查询字符串和协议部分，
+       查询字符串移入 extra（与 AccessLogLineParser 导入新数据的处理一致）
+    3. 创建 (api_template, access_time) 索引（PostgreSQL 非分区表使用 CONCURRENTLY）
+
+回填完成后可运行 scripts/rebuild_access_rollups.py 按新模板重建访问统计预聚合数据。
+
+运行方式:
+    python scripts/add_access_log_template.py
+    python scripts/add_access_log_template.py --batch-size 20000
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import bindparam, inspect, text, update
+from database.connection import engine
+from database.models import GitlabApiAccessLog
+from services.api_path_normalizer import ApiPathNormalizer, default_normalizer
+from services.log_line_parser import AccessLogLineParser
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TABLE = GitlabApiAccessLog.__tablename__
+INDEX_NAME = 'idx_access_log_template_time'
+
+
+def add_column():
+    """增加 api_template 列（已存在时跳过）"""
+    columns = {column['name'] for column in inspect(engine).get_columns(TABLE)}
+    if 'api_template' in columns:
+        logger.info("api_template 列已存在")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN api_template VARCHAR(500)"))
+    logger.info("✅ 已增加 api_template 列")
+
+
+def backfill(batch_size: int) -> int:
+    """按 id 分批回填 api_template、api_path 和 extra，返回更新的行数"""
+    statement = update(GitlabApiAccessLog).where(
+        GitlabApiAccessLog.id == bindparam('row_id')
+    ).values(
+        api_path=bindparam('new_path'),
+        api_template=bindparam('new_template'),
+        extra=bindparam('new_extra')
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, api_path, extra FROM {TABLE} "
+                f"WHERE id > :last_id AND api_template IS NULL ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+            if not rows:
+                break
+
+            params = []
+            for row_id, api_path, extra in rows:
+                path, query, protocol = ApiPathNormalizer.split_target(api_path)
+                new_extra = AccessLogLineParser._build_extra(query, protocol)
+                if isinstance(extra, dict):
+                    new_extra = dict(extra, **(new_extra or {}))
+                params.append({
+                    'row_id': row_id,
+                    'new_path': path,
+                    'new_template': default_normalizer.template(path),
+                    'new_extra': new_extra
+                })
+            conn.execute(statement, params)
+
+        updated += len(rows)
+        last_id = rows[-1][0]
+        logger.info(f"   - 已回填 {updated} 行（id <= {last_id}）")
+    return updated
+
+
+def create_index():
+    """创建接口模板索引"""
+    postgresql = engine.dialect.name == 'postgresql'
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        concurrently = postgresql and conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :table"
+        ), {'table': TABLE}).first() is None
+        concurrently_sql = 'CONCURRENTLY ' if concurrently else ''
+        conn.execute(text(
+            f"CREATE INDEX {concurrently_sql}IF NOT EXISTS {INDEX_NAME} ON {TABLE} (api_template, access_time)"
+        ))
+        conn.execute(text(f"ANALYZE {TABLE}"))
+    logger.info(f"✅ 索引 {INDEX_NAME} 已就绪")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='为访问日志增加接口模板列并回填已有数据')
+    parser.add_argument('--batch-size', type=int, default=10000, help='每批回填的行数')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("访问日志接口模板迁移脚本")
+    print("=" * 60)
+    print()
+
+    try:
+        add_column()
+        updated = backfill(args.batch_size)
+        create_index()
+    except Exception as e:
+        logger.error(f"❌ 迁移失败: {e}")
+        logger.exception(e)
+        print("\n❌ 迁移失败，请检查日志")
+        return 1
+
+    print("=" * 60)
+    print(f"✅ 迁移完成！共回填 {updated} 行")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,72 @@
+"""
+数据库迁移脚本 - 记录导入状态所属的导入
+
+    1. 创建 log_import_run 表（导入运行记录和心跳）
+    2. log_import_status 增加 import_run_id 列
+
+已有的未完成导入状态没有所属导入，下次导入时视为中断的导入清除后重新导入。
+
+运行方式:
+    python scripts/add_log_import_run.py
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import inspect, text
+from database.connection import engine
+from database.models import LogImportRun, LogImportStatus
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TABLE = LogImportStatus.__tablename__
+
+
+def create_run_table():
+    """创建 log_import_run 表（已存在时跳过）"""
+    LogImportRun.__table__.create(bind=engine, checkfirst=True)
+    logger.info(f"✅ {LogImportRun.__tablename__} 表已就绪")
+
+
+def add_column():
+    """增加 import_run_id 列（已存在时跳过）"""
+    columns = {column['name'] for column in inspect(engine).get_columns(TABLE)}
+    if 'import_run_id' in columns:
+        logger.info("import_run_id 列已存在")
+        return
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN import_run_id VARCHAR(36)"))
+    logger.info("✅ 已增加 import_run_id 列")
+
+
+def main():
+    """主函数"""
+    print("=" * 60)
+    print("日志导入运行记录迁移脚本")
+    print("=" * 60)
+    print()
+
+    try:
+        create_run_table()
+        add_column()
+    except Exception as e:
+        logger.error(f"❌ 迁移失败: {e}")
+        logger.exception(e)
+        print("\n❌ 迁移失败，请检查日志")
+        return 1
+
+    print("=" * 60)
+    print("✅ 迁移完成！")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
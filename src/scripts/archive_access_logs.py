@@ -0,0 +1,83 @@
+"""
+访问日志归档脚本 - 把 gitlab_api_access_log 按天导出为 Parquet 文件
+
+文件写入 LOG_ARCHIVE_DIR（或 --archive-dir）下的 access_date=YYYY-MM-DD 目录，需安装 pyarrow。
+重复运行只导出尚未归档的日志；指定 --delete 时归档后删除数据库中已归档的日志
+（分区表上整个分区都已归档时直接删除分区）。
+
+运行方式:
+    python scripts/archive_access_logs.py --older-than-days 90 --delete
+    python scripts/archive_access_logs.py --start-date 2024-01-01 --end-date 2024-01-31
+    python scripts/archive_access_logs.py --list
+"""
+
+import sys
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.log_archive_service import ARCHIVE_BATCH_SIZE, LogArchiveService
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='把访问日志归档为 Parquet 文件')
+    parser.add_argument('--start-date', help='开始日期 YYYY-MM-DD（默认数据库中最早的日志）')
+    parser.add_argument('--end-date', help='结束日期 YYYY-MM-DD（默认昨天）')
+    parser.add_argument('--older-than-days', type=int, help='归档 N 天之前的日志（代替 --end-date）')
+    parser.add_argument('--delete', action='store_true', help='归档后删除数据库中已归档的日志')
+    parser.add_argument('--archive-dir', help='归档目录（默认 LOG_ARCHIVE_DIR）')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='每批读取的行数')
+    parser.add_argument('--list', action='store_true', help='只列出已有的归档')
+    args = parser.parse_args()
+
+    archive_service = LogArchiveService(args.archive_dir)
+    if not archive_service.available:
+        print("❌ 未安装 pyarrow，请先执行 pip install pyarrow")
+        return 1
+
+    print("=" * 60)
+    print("访问日志归档脚本")
+    print("=" * 60)
+    print()
+
+    if args.list:
+        archives = archive_service.list_archives()
+        for archive in archives:
+            print(f"{archive['date']}  文件 {archive['files']:>3}  行数 {archive['rows']:>12}  "
+                  f"大小 {archive['size_bytes'] / 1024 / 1024:>10.2f} MB")
+        print(f"\n共 {len(archives)} 天，{sum(archive['rows'] for archive in archives)} 行")
+        return 0
+
+    start_date = datetime.strptime(args.start_date, '%Y-%m-%d').date() if args.start_date else None
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else None
+    if args.older_than_days is not None:
+        end_date = date.today() - timedelta(days=args.older_than_days + 1)
+
+    try:
+        result = archive_service.archive(start_date, end_date, delete=args.delete, batch_size=args.batch_size)
+    except Exception as e:
+        logger.error(f"❌ 归档失败: {e}")
+        logger.exception(e)
+        print("\n❌ 归档失败，请检查日志")
+        return 1
+
+    print("=" * 60)
+    print(f"✅ 归档完成！共归档 {result['archived_rows']} 行到 {len(result['files'])} 个文件")
+    if args.delete:
+        print(f"   删除分区 {len(result['dropped_partitions'])} 个，删除记录 {result['deleted_rows']} 条")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,167 @@
+"""
+基准测试脚本 - 分支规则分析的查询次数
+
+在临时 SQLite 数据库中生成仓库、分支和规则，分别运行：
+    - 旧实现：逐个分支新建会话、重新查询规则和分支（N+1）
+    - 新实现：GitlabService._analyze_repository_branches（规则加载一次，批量写回）
+并统计执行的 SQL 语句数和耗时。
+
+运行方式:
+    python scripts/benchmark_branch_analysis.py --branches 2000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 使用独立的临时数据库，必须在导入数据库模块之前设置
+_db_file = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_file}'
+os.environ.setdefault('GITLAB_URL', 'http://gitlab.local')
+os.environ.setdefault('GITLAB_TOKEN', 'benchmark')
+
+from sqlalchemy import event
+from database.connection import engine, get_db_session
+from database.models import create_tables, GitlabRepository, GitlabRepositoryBranch, GitlabBranchRule
+from services.database_service import DatabaseService
+from services.export_service import ExportService
+from services.gitlab_service import GitlabService
+
+REPOSITORY_ID = 1
+
+BENCHMARK_RULES = [
+    ('main', 'master|main', 'main', False, None, 100),
+    ('develop', 'develop|dev', 'develop', False, None, 90),
+    ('release', 'release/*', 'release', False, 365, 80),
+    ('hotfix', 'hotfix/*', 'hotfix', True, 30, 70),
+    ('feature', 'feature/*', 'feature', True, 90, 60),
+]
+
+
+class QueryCounter:
+    """统计引擎上执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+def seed_data(branch_count: int):
+    """生成测试数据"""
+    create_tables(engine)
+    prefixes = ['feature/', 'hotfix/', 'release/', 'bugfix/', 'test-']
+    with get_db_session() as db:
+        db.add(GitlabRepository(id=REPOSITORY_ID, name='benchmark', name_with_namespace='bench/benchmark'))
+        for rule_name, pattern, branch_type, deletable, retention_days, priority in BENCHMARK_RULES:
+            db.add(GitlabBranchRule(
+                rule_name=rule_name, branch_pattern=pattern, branch_type=branch_type,
+                is_deletable=deletable, retention_days=retention_days, priority=priority
+            ))
+        db.add(GitlabRepositoryBranch(repository_id=REPOSITORY_ID, branch_name='master', protected=True))
+        for index in range(branch_count - 1):
+            db.add(GitlabRepositoryBranch(
+                repository_id=REPOSITORY_ID,
+                branch_name=f'{prefixes[index % len(prefixes)]}{index}',
+                commit_id=f'{index:040x}',
+                last_commit_date=datetime.now() - timedelta(days=index % 400),
+                protected=False
+            ))
+
+
+def clear_analysis():
+    """清除分析结果，保证两种实现都需要写回全部分支"""
+    with get_db_session() as db:
+        db.query(GitlabRepositoryBranch).update({
+            GitlabRepositoryBranch.branch_type: None,
+            GitlabRepositoryBranch.is_deletable: None,
+            GitlabRepositoryBranch.matched_rule_id: None,
+            GitlabRepositoryBranch.retention_deadline: None,
+            GitlabRepositoryBranch.deletion_reason: None,
+        })
+
+
+def legacy_analyze(repository_id: int):
+    """旧实现：每个分支单独查询规则、新建会话并重新查询分支"""
+    with get_db_session() as db:
+        branches = db.query(GitlabRepositoryBranch).filter(
+            GitlabRepositoryBranch.repository_id == repository_id
+        ).all()
+        rules = db.query(GitlabBranchRule).filter(
+            GitlabBranchRule.is_active == True
+        ).order_by(GitlabBranchRule.priority.desc()).all()
+        db.expunge_all()
+
+    export_service = ExportService()
+    with get_db_session() as db:
+        for branch in branches:
+            with get_db_session() as rule_db:
+                active_rules = rule_db.query(GitlabBranchRule).filter(
+                    GitlabBranchRule.is_active == True
+                ).order_by(GitlabBranchRule.priority.desc()).all()
+                rule = next(
+                    (r for r in active_rules if export_service._branch_matches_pattern(branch.branch_name, r.branch_pattern)),
+                    None
+                )
+                rule_db.expunge_all()
+            db_branch = db.query(GitlabRepositoryBranch).filter(
+                GitlabRepositoryBranch.id == branch.id
+            ).first()
+            if db_branch and rule:
+                db_branch.branch_type = rule.branch_type
+                db_branch.is_deletable = rule.is_deletable and not branch.protected
+                db_branch.matched_rule_id = next((r.id for r in rules if r.rule_name == rule.rule_name), None)
+
+
+def build_service() -> GitlabService:
+    """创建不连接 GitLab 的服务实例，只用于分析"""
+    service = GitlabService.__new__(GitlabService)
+    service.db_service = DatabaseService()
+    return service
+
+
+def run(label: str, func, counter: QueryCounter):
+    clear_analysis()
+    counter.reset()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} queries={counter.count:<8} time={elapsed:.3f}s")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='分支规则分析查询次数基准测试')
+    parser.add_argument('--branches', type=int, default=2000, help='生成的分支数量')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"分支规则分析基准测试 ({args.branches} 个分支)")
+    print("=" * 60)
+
+    seed_data(args.branches)
+    counter = QueryCounter()
+    service = build_service()
+
+    run('legacy', lambda: legacy_analyze(REPOSITORY_ID), counter)
+    run('set-based', lambda: service._analyze_repository_branches(REPOSITORY_ID), counter)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,274 @@
+"""
+数据库迁移脚本 - 为热点查询创建索引和唯一约束
+
+为分支、权限、组成员和访问日志表创建 models.py 中声明的索引：
+    - gitlab_repository_branch: (repository_id, branch_name) 唯一、matched_rule_id、
+      (is_deletable, last_commit_date)
+    - gitlab_repository_permission: repository_id
+    - gitlab_group_member: (group_id, user_id) 唯一
+    - gitlab_api_access_log: access_time
+
+PostgreSQL 下使用 CREATE INDEX CONCURRENTLY 在线创建，不阻塞同步和日志写入
+（分区表不支持 CONCURRENTLY，使用普通 CREATE INDEX）。
+
+创建唯一索引前需要清理重复数据（保留 id 最大的一行）：有重复数据时默认只报告并跳过该索引，
+加 --yes 确认后才删除。删除在锁表（SHARE ROW EXCLUSIVE）的事务中进行；
+之后并发的同步又写入重复数据导致唯一索引创建失败时，删除遗留的无效索引，重新清理后重试。
+
+运行方式:
+    python scripts/create_query_indexes.py --dry-run  # 只报告重复数据和将要创建的索引
+    python scripts/create_query_indexes.py            # 创建索引（有重复数据的唯一索引跳过）
+    python scripts/create_query_indexes.py --yes      # 确认删除重复数据并创建全部索引
+    python scripts/create_query_indexes.py --explain  # 创建前后分别输出查询计划
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from database.connection import engine
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# (索引名, 表名, 列, 是否唯一)
+QUERY_INDEXES = [
+    ('uq_branch_repository_name', 'gitlab_repository_branch', ('repository_id', 'branch_name'), True),
+    ('idx_branch_matched_rule', 'gitlab_repository_branch', ('matched_rule_id',), False),
+    ('idx_branch_deletable_commit_date', 'gitlab_repository_branch', ('is_deletable', 'last_commit_date'), False),
+    ('idx_permission_repository', 'gitlab_repository_permission', ('repository_id',), False),
+    ('uq_group_member_group_user', 'gitlab_group_member', ('group_id', 'user_id'), True),
+    ('idx_access_log_time', 'gitlab_api_access_log', ('access_time',), False),
+]
+
+# 用于对比查询计划的代表性查询（对应各服务中的热点查询）
+BENCHMARK_QUERIES = [
+    ('按仓库查询分支',
+     "SELECT * FROM gitlab_repository_branch WHERE repository_id = :repository_id"),
+    ('按仓库和名称查询分支',
+     "SELECT * FROM gitlab_repository_branch WHERE repository_id = :repository_id AND branch_name = :branch_name"),
+    ('统计规则使用的分支数',
+     "SELECT COUNT(*) FROM gitlab_repository_branch WHERE matched_rule_id = :rule_id"),
+    ('查询过期的可删除分支',
+     "SELECT id, branch_name FROM gitlab_repository_branch "
+     "WHERE is_deletable = :deletable AND last_commit_date < :before"),
+    ('按仓库查询权限',
+     "SELECT * FROM gitlab_repository_permission WHERE repository_id = :repository_id"),
+    ('按组查询成员',
+     "SELECT * FROM gitlab_group_member WHERE group_id = :group_id"),
+    ('最新访问日志',
+     "SELECT * FROM gitlab_api_access_log ORDER BY access_time DESC LIMIT 100"),
+]
+
+# 创建唯一索引时，并发写入在清理后又产生重复数据导致失败的最多尝试次数
+UNIQUE_INDEX_ATTEMPTS = 3
+
+BENCHMARK_PARAMS = {
+    'repository_id': 1,
+    'branch_name': 'master',
+    'rule_id': 1,
+    'deletable': True,
+    'before': '2024-01-01 00:00:00',
+    'group_id': 1,
+}
+
+
+def is_postgresql() -> bool:
+    return engine.dialect.name == 'postgresql'
+
+
+def _duplicates_condition(table: str, columns: tuple) -> str:
+    """唯一键重复、且不是该组 id 最大的行"""
+    return f"id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {', '.join(columns)})"
+
+
+def count_duplicates(conn, table: str, columns: tuple) -> int:
+    """统计唯一键重复、创建唯一索引前需要删除的行数"""
+    return conn.execute(text(
+        f"SELECT COUNT(*) FROM {table} WHERE {_duplicates_condition(table, columns)}"
+    )).scalar() or 0
+
+
+def remove_duplicates(table: str, columns: tuple) -> int:
+    """删除唯一键重复的行，保留 id 最大的一行
+
+    在独立事务中执行，PostgreSQL 下先以 SHARE ROW EXCLUSIVE 锁表，
+    删除期间同步写入等待，统计和删除之间不会插入新的重复行。
+    """
+    with engine.begin() as conn:
+        if is_postgresql():
+            conn.execute(text(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE"))
+        result = conn.execute(text(f"DELETE FROM {table} WHERE {_duplicates_condition(table, columns)}"))
+        return result.rowcount or 0
+
+
+def drop_invalid_index(conn, name: str):
+    """删除之前 CONCURRENTLY 创建失败遗留的无效索引"""
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).first()
+    if invalid:
+        logger.warning(f"发现无效索引 {name}，重新创建")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def is_partitioned_table(conn, table: str) -> bool:
+    """是否为分区表（见 scripts/partition_access_log.py），分区表不支持 CREATE INDEX CONCURRENTLY"""
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': table}).first() is not None
+
+
+def attach_unique_constraint(conn, name: str, table: str):
+    """将唯一索引挂为唯一约束，与 models.py 中的 UniqueConstraint 保持一致"""
+    exists = conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = :name"
+    ), {'name': name}).first()
+    if not exists:
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"))
+
+
+def create_index(conn, name: str, table: str, columns: tuple, unique: bool, remove_duplicate_rows: bool):
+    """创建索引，唯一索引先清理重复数据
+
+    清理后并发写入又产生重复数据时唯一索引创建失败（CONCURRENTLY 失败会留下无效索引），
+    删除无效索引后重新清理并重试，最多 UNIQUE_INDEX_ATTEMPTS 次。
+    """
+    postgresql = is_postgresql()
+    unique_sql = 'UNIQUE ' if unique else ''
+    concurrently = postgresql and not is_partitioned_table(conn, table)
+    concurrently_sql = 'CONCURRENTLY ' if concurrently else ''
+
+    for attempt in range(1, UNIQUE_INDEX_ATTEMPTS + 1):
+        if unique and remove_duplicate_rows:
+            removed = remove_duplicates(table, columns)
+            if removed:
+                logger.warning(f"   - 清理 {table} 中 {removed} 行重复数据")
+        if postgresql:
+            drop_invalid_index(conn, name)
+
+        try:
+            conn.execute(text(
+                f"CREATE {unique_sql}INDEX {concurrently_sql}IF NOT EXISTS {name} "
+                f"ON {table} ({', '.join(columns)})"
+            ))
+            break
+        except IntegrityError as e:
+            if postgresql:
+                drop_invalid_index(conn, name)
+            if not (unique and remove_duplicate_rows) or attempt == UNIQUE_INDEX_ATTEMPTS:
+                raise
+            logger.warning(f"   - 创建唯一索引 {name} 时出现新的重复数据（第 {attempt} 次）: {e.orig}，重新清理后重试")
+
+    if unique and postgresql:
+        attach_unique_constraint(conn, name, table)
+
+
+def create_query_indexes(dry_run: bool = False, confirm: bool = False) -> bool:
+    """创建所有查询索引
+
+    Args:
+        dry_run: 只报告重复数据和将要创建的索引，不做任何修改
+        confirm: 确认删除唯一键重复的数据；未确认时有重复数据的唯一索引跳过并返回失败
+    """
+    try:
+        success = True
+        # CONCURRENTLY 不能在事务中执行，使用自动提交连接
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for name, table, columns, unique in QUERY_INDEXES:
+                logger.info(f"创建索引 {name} ON {table} ({', '.join(columns)})...")
+
+                if unique and not confirm:
+                    duplicates = count_duplicates(conn, table, columns)
+                    if duplicates:
+                        logger.warning(
+                            f"   - {table} 中有 {duplicates} 行 ({', '.join(columns)}) 重复的数据，"
+                            f"创建唯一索引前需要删除（保留 id 最大的一行），使用 --yes 确认"
+                        )
+                        if not dry_run:
+                            logger.error(f"❌ 跳过索引 {name}")
+                            success = False
+                            continue
+
+                if dry_run:
+                    logger.info(f"   - [dry-run] 将创建索引 {name}")
+                    continue
+
+                create_index(conn, name, table, columns, unique, remove_duplicate_rows=confirm)
+                logger.info(f"✅ 索引 {name} 已就绪")
+
+            if not dry_run:
+                # 更新统计信息，让查询计划立即使用新索引
+                for table in sorted({table for _, table, _, _ in QUERY_INDEXES}):
+                    conn.execute(text(f"ANALYZE {table}"))
+
+        return success
+
+    except Exception as e:
+        logger.error(f"❌ 创建索引失败: {e}")
+        logger.exception(e)
+        return False
+
+
+def explain_queries(title: str):
+    """输出代表性查询的执行计划"""
+    print(f"---------- {title} ----------")
+    explain_sql = 'EXPLAIN (ANALYZE, BUFFERS) ' if is_postgresql() else 'EXPLAIN QUERY PLAN '
+    with engine.connect() as conn:
+        for label, query in BENCHMARK_QUERIES:
+            print(f"\n[{label}]")
+            print(f"  {query}")
+            try:
+                rows = conn.execute(text(explain_sql + query), BENCHMARK_PARAMS).fetchall()
+                for row in rows:
+                    print(f"    {row[-1]}")
+            except Exception as e:
+                print(f"    ❌ 无法获取执行计划: {e}")
+    print()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='为热点查询创建索引和唯一约束')
+    parser.add_argument('--explain', action='store_true', help='创建索引前后输出查询计划')
+    parser.add_argument('--dry-run', action='store_true', help='只报告重复数据和将要创建的索引，不做修改')
+    parser.add_argument('--yes', action='store_true', help='确认删除唯一键重复的数据（保留 id 最大的一行）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("GitLab 查询索引创建脚本")
+    print("=" * 60)
+    print()
+
+    if args.explain:
+        explain_queries("创建索引前的执行计划")
+
+    if not create_query_indexes(dry_run=args.dry_run, confirm=args.yes):
+        print("\n❌ 索引创建失败，请检查日志")
+        return 1
+
+    if args.dry_run:
+        print("\n（dry-run，未做任何修改）")
+        return 0
+
+    if args.explain:
+        explain_queries("创建索引后的执行计划")
+
+    print("=" * 60)
+    print("✅ 迁移完成！")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
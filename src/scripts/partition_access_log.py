@@ -0,0 +1,176 @@
+"""
+数据库迁移脚本 - 将访问日志表转换为按 access_time 范围分区的分区表（仅 PostgreSQL）
+
+步骤（在一个事务中完成，失败时整体回滚）：
+    1. 将现有 gitlab_api_access_log 改名为 gitlab_api_access_log_unpartitioned
+    2. 按原表结构创建分区表 gitlab_api_access_log（PARTITION BY RANGE (access_time)），
+       主键改为 (id, access_time)（分区表的主键必须包含分区键），继续使用原 id 序列
+    3. 按 LOG_PARTITION_INTERVAL 为已有数据和今天创建日/月分区，并逐个分区复制数据
+    4. 删除原表（--keep-old 时保留，确认无误后手动删除）
+
+转换后由 LogPartitionService 在导入前自动创建分区、按 LOG_RETENTION_DAYS 删除过期分区。
+转换期间请停止日志导入，完成后重启服务。
+
+运行方式:
+    python scripts/partition_access_log.py
+    python scripts/partition_access_log.py --keep-old
+"""
+
+import sys
+import argparse
+from datetime import date
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import text
+from config.settings import settings
+from database.connection import engine
+from services.log_partition_service import ACCESS_LOG_TABLE, partition_bounds, partition_name
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+OLD_TABLE = f'{ACCESS_LOG_TABLE}_unpartitioned'
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': ACCESS_LOG_TABLE}).first() is not None
+
+
+def rename_old_table(conn) -> str:
+    """改名原表及其索引，返回 id 使用的序列名"""
+    sequence = conn.execute(text(
+        "SELECT pg_get_serial_sequence(:table, 'id')"
+    ), {'table': ACCESS_LOG_TABLE}).scalar()
+
+    conn.execute(text(f"ALTER TABLE {ACCESS_LOG_TABLE} RENAME TO {OLD_TABLE}"))
+    # 索引名在 schema 内唯一，原表的索引改名后新表才能使用相同的名称
+    indexes = conn.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    ), {'table': OLD_TABLE}).scalars().all()
+    for index_name in indexes:
+        conn.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_unpartitioned"))
+
+    if sequence:
+        # 解除序列与原表的从属关系，删除原表时保留序列
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    return sequence
+
+
+def create_partitioned_table(conn, sequence: str):
+    """按原表结构创建分区表"""
+    conn.execute(text(
+        f"CREATE TABLE {ACCESS_LOG_TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS) "
+        f"PARTITION BY RANGE (access_time)"
+    ))
+    if not sequence:
+        sequence = f'{ACCESS_LOG_TABLE}_id_seq'
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {sequence}"))
+        conn.execute(text(f"ALTER TABLE {ACCESS_LOG_TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')"))
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {ACCESS_LOG_TABLE}.id"))
+    conn.execute(text(f"ALTER TABLE {ACCESS_LOG_TABLE} ADD PRIMARY KEY (id, access_time)"))
+    conn.execute(text(f"CREATE INDEX idx_access_log_time ON {ACCESS_LOG_TABLE} (access_time)"))
+
+
+def copy_partitions(conn, interval: str) -> int:
+    """创建覆盖已有数据和今天的分区，并逐个分区复制数据，返回复制的行数"""
+    min_time, max_time = conn.execute(text(
+        f"SELECT MIN(access_time), MAX(access_time) FROM {OLD_TABLE}"
+    )).first()
+    first_day = min_time.date() if min_time else date.today()
+    last_day = max(max_time.date() if max_time else date.today(), date.today())
+
+    copied = 0
+    start, _ = partition_bounds(first_day, interval)
+    while start <= last_day:
+        start, end = partition_bounds(start, interval)
+        name = partition_name(start, interval)
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {ACCESS_LOG_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        result = conn.execute(text(
+            f"INSERT INTO {ACCESS_LOG_TABLE} SELECT * FROM {OLD_TABLE} "
+            f"WHERE access_time >= :start AND access_time < :end"
+        ), {'start': start, 'end': end})
+        copied += result.rowcount or 0
+        if result.rowcount:
+            logger.info(f"   - {name}: {result.rowcount} 行")
+        start = end
+    return copied
+
+
+def partition_access_log(keep_old: bool = False) -> bool:
+    """将访问日志表转换为分区表"""
+    try:
+        interval = settings.log_ingest.partition_interval
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                logger.info(f"{ACCESS_LOG_TABLE} 已经是分区表，无需转换")
+                return True
+
+            # 阻止转换期间的写入
+            conn.execute(text(f"LOCK TABLE {ACCESS_LOG_TABLE} IN ACCESS EXCLUSIVE MODE"))
+            old_count = conn.execute(text(f"SELECT COUNT(*) FROM {ACCESS_LOG_TABLE}")).scalar()
+            logger.info(f"转换 {ACCESS_LOG_TABLE}（{old_count} 行），分区粒度: {interval}")
+
+            sequence = rename_old_table(conn)
+            create_partitioned_table(conn, sequence)
+            copied = copy_partitions(conn, interval)
+
+            if copied != old_count:
+                raise RuntimeError(f"复制行数 {copied} 与原表行数 {old_count} 不一致")
+
+            if not keep_old:
+                conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+                logger.info(f"已删除原表 {OLD_TABLE}")
+            else:
+                logger.info(f"保留原表 {OLD_TABLE}，确认无误后请手动删除")
+
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f"ANALYZE {ACCESS_LOG_TABLE}"))
+
+        logger.info(f"✅ 转换完成，共复制 {copied} 行")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ 转换分区表失败: {e}")
+        logger.exception(e)
+        return False
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='将访问日志表转换为按 access_time 范围分区的分区表')
+    parser.add_argument('--keep-old', action='store_true', help='保留原表（改名为 gitlab_api_access_log_unpartitioned）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("访问日志分区表迁移脚本")
+    print("=" * 60)
+    print()
+
+    if engine.dialect.name != 'postgresql':
+        print("❌ 分区表仅支持 PostgreSQL，当前数据库无需转换")
+        return 1
+
+    if not partition_access_log(keep_old=args.keep_old):
+        print("\n❌ 迁移失败，请检查日志")
+        return 1
+
+    print("=" * 60)
+    print("✅ 迁移完成！请重启服务")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
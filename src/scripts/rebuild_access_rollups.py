@@ -0,0 +1,80 @@
+"""
+数据库迁移脚本 - 创建访问统计预聚合表并根据已有日志补建数据
+
+创建 api_access_daily_rollup、api_access_client_rollup 和 api_latency_sketch 表，
+并按天读取 gitlab_api_access_log 重新计算指定日期范围内的预聚合数据。
+原始日志已被过期清理或归档删除的日期保留原有预聚合数据，不会被清空。
+之后导入的日志会在导入时增量更新预聚合表，无需再次运行。
+
+运行方式:
+    python scripts/rebuild_access_rollups.py
+    python scripts/rebuild_access_rollups.py --start-date 2024-01-01 --end-date 2024-01-31
+"""
+
+import sys
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from database.models import ApiAccessDailyRollup, ApiAccessClientRollup, ApiLatencySketch
+from database.connection import engine
+from services.access_rollup_service import access_rollup_service
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def create_rollup_tables() -> bool:
+    """创建预聚合表"""
+    try:
+        for model in (ApiAccessDailyRollup, ApiAccessClientRollup, ApiLatencySketch):
+            model.__table__.create(bind=engine, checkfirst=True)
+            logger.info(f"✅ {model.__tablename__} 表已就绪")
+        return True
+    except Exception as e:
+        logger.error(f"❌ 创建表失败: {e}")
+        logger.exception(e)
+        return False
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='创建访问统计预聚合表并补建数据')
+    parser.add_argument('--start-date', help='开始日期 YYYY-MM-DD（默认全部）')
+    parser.add_argument('--end-date', help='结束日期 YYYY-MM-DD（默认全部）')
+    args = parser.parse_args()
+
+    start_date = datetime.strptime(args.start_date, '%Y-%m-%d').date() if args.start_date else None
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else None
+
+    print("=" * 60)
+    print("访问统计预聚合表迁移脚本")
+    print("=" * 60)
+    print()
+
+    if not create_rollup_tables():
+        print("\n❌ 表创建失败，请检查日志")
+        return 1
+
+    try:
+        processed = access_rollup_service.rebuild(start_date, end_date)
+    except Exception as e:
+        logger.error(f"❌ 重建预聚合数据失败: {e}")
+        logger.exception(e)
+        print("\n❌ 预聚合数据重建失败，请检查日志")
+        return 1
+
+    print("=" * 60)
+    print(f"✅ 迁移完成！共处理 {processed} 条日志")
+    print("=" * 60)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
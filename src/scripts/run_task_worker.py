@@ -0,0 +1,60 @@
+"""
+后台任务工作进程 - 执行 background_task 表中的任务
+
+Web 进程设置 TASK_WORKER_ENABLED=false 时只负责创建任务，由本脚本启动的独立进程执行；
+可以在多台机器上同时运行多个工作进程，任务通过数据库租约分配，不会重复执行。
+
+运行方式:
+    python scripts/run_task_worker.py
+    python scripts/run_task_worker.py --threads 4
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config.logging_config import init_logging
+from config.settings import settings
+from services.task_service import task_service
+from utils.logger import get_logger
+
+init_logging()
+logger = get_logger(__name__)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='后台任务工作进程')
+    parser.add_argument('--threads', type=int, default=settings.task.max_concurrent,
+                        help='工作线程数（默认 MAX_CONCURRENT_TASKS）')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"后台任务工作进程（{args.threads} 个工作线程）")
+    print("=" * 60)
+
+    try:
+        task_service.start_workers(args.threads)
+    except Exception as e:
+        logger.error(f"❌ 启动工作线程失败: {e}")
+        logger.exception(e)
+        return 1
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n正在停止工作线程（执行中的任务完成后退出）...")
+        task_service.stop_workers(wait=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main()
+    sys.exit(exit_code)
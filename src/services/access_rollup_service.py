@@ -0,0 +1,479 @@
+"""
+访问日志预聚合服务
+
+维护以下预聚合表，导入日志时在同一事务中增量更新：
+- api_access_daily_rollup: 日期 × 接口模板 × 方法 × 状态码类别
+- api_access_client_rollup: 日期 × 客户端 IP
+- api_latency_sketch: 小时 × 接口模板的响应时间 DDSketch 草图
+
+按天的表记录请求数、响应大小、响应时间的 count/sum/min/max 和延迟直方图；
+草图用于任意时间窗口的精确到 1% 相对误差的分位数。
+统计接口直接查询预聚合表，不扫描 gitlab_api_access_log 原始数据。
+"""
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database.connection import get_db_session
+from database.models import ApiAccessClientRollup, ApiAccessDailyRollup, ApiLatencySketch, GitlabApiAccessLog
+from services.api_path_normalizer import api_path_template
+from services.latency_sketch import DDSketch
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 延迟直方图各区间的上界（秒），最后一个区间为 > 10s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 按键读取已有预聚合行时每条查询包含的键数
+KEY_LOOKUP_BATCH_SIZE = 500
+
+# 草图的相对误差，修改后已有草图无法与新草图合并，需要重建
+SKETCH_ALPHA = 0.01
+
+ROLLUP_METRIC_FIELDS = ('request_count', 'response_size_sum', 'response_time_count',
+                        'response_time_sum', 'response_time_min', 'response_time_max', 'latency_histogram')
+
+
+def _empty_metrics() -> Dict[str, Any]:
+    return {
+        'request_count': 0,
+        'response_size_sum': 0,
+        'response_time_count': 0,
+        'response_time_sum': 0.0,
+        'response_time_min': None,
+        'response_time_max': None,
+        'latency_histogram': [0] * (len(LATENCY_BUCKETS) + 1)
+    }
+
+
+def _add_entry(metrics: Dict[str, Any], entry: Dict[str, Any]):
+    """把一行日志累加到指标中"""
+    metrics['request_count'] += 1
+    metrics['response_size_sum'] += entry.get('response_size') or 0
+    response_time = entry.get('response_time')
+    if response_time is None:
+        return
+    metrics['response_time_count'] += 1
+    metrics['response_time_sum'] += response_time
+    if metrics['response_time_min'] is None or response_time < metrics['response_time_min']:
+        metrics['response_time_min'] = response_time
+    if metrics['response_time_max'] is None or response_time > metrics['response_time_max']:
+        metrics['response_time_max'] = response_time
+    metrics['latency_histogram'][bisect_left(LATENCY_BUCKETS, response_time)] += 1
+
+
+def merge_metrics(target: Dict[str, Any], source: Dict[str, Any]):
+    """将 source 的指标合并到 target（两者都可来自数据库行或批内聚合）"""
+    for field in ('request_count', 'response_size_sum', 'response_time_count', 'response_time_sum'):
+        target[field] = (target.get(field) or 0) + (source.get(field) or 0)
+    for field, pick in (('response_time_min', min), ('response_time_max', max)):
+        values = [value for value in (target.get(field), source.get(field)) if value is not None]
+        target[field] = pick(values) if values else None
+    target_histogram = target.get('latency_histogram') or [0] * (len(LATENCY_BUCKETS) + 1)
+    source_histogram = source.get('latency_histogram') or [0] * (len(LATENCY_BUCKETS) + 1)
+    target['latency_histogram'] = [a + b for a, b in zip(target_histogram, source_histogram)]
+
+
+def histogram_quantile(histogram: List[int], quantile: float,
+                       minimum: Optional[float] = None, maximum: Optional[float] = None) -> Optional[float]:
+    """根据延迟直方图估算分位数（区间内线性插值，结果限制在 [minimum, maximum] 内）"""
+    total = sum(histogram or [])
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+            upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else (maximum or lower)
+            value = lower + (upper - lower) * (rank - cumulative) / count
+            if minimum is not None:
+                value = max(value, minimum)
+            if maximum is not None:
+                value = min(value, maximum)
+            return round(value, 6)
+        cumulative += count
+    return maximum
+
+
+class AccessRollupService:
+    """访问日志预聚合表的维护和查询"""
+
+    def aggregate(self, rows: Iterable[Dict[str, Any]]) -> Tuple[Dict[tuple, Dict], Dict[tuple, Dict], Dict[tuple, DDSketch]]:
+        """将一批日志聚合为 (接口维度, 客户端维度, 小时 × 接口模板的草图) 的 {键: 指标}"""
+        daily, clients, sketches = {}, {}, {}
+        for entry in rows:
+            access_time = entry.get('access_time')
+            if not isinstance(access_time, datetime):
+                continue
+            rollup_date = access_time.date()
+            status = entry.get('http_status') or 0
+
+            # 旧数据没有 api_template 列的值时按 api_path 计算
+            template = entry.get('api_template') or api_path_template(entry.get('api_path'))
+            daily_key = (rollup_date, template,
+                         (entry.get('http_method') or '')[:10], status // 100)
+            metrics = daily.get(daily_key)
+            if metrics is None:
+                metrics = daily[daily_key] = _empty_metrics()
+            _add_entry(metrics, entry)
+
+            client_key = (rollup_date, entry.get('client_ip') or '')
+            metrics = clients.get(client_key)
+            if metrics is None:
+                metrics = clients[client_key] = dict(_empty_metrics(), error_count=0)
+            _add_entry(metrics, entry)
+            if status >= 400:
+                metrics['error_count'] += 1
+
+            response_time = entry.get('response_time')
+            if response_time is not None and response_time >= 0:
+                sketch_key = (access_time.replace(minute=0, second=0, microsecond=0), template)
+                sketch = sketches.get(sketch_key)
+                if sketch is None:
+                    sketch = sketches[sketch_key] = DDSketch(SKETCH_ALPHA)
+                sketch.add(response_time)
+        return daily, clients, sketches
+
+    def apply(self, db, rows: List[Dict[str, Any]]):
+        """在当前事务中把一批新导入的日志合并到预聚合表"""
+        if not rows:
+            return
+        daily, clients, sketches = self.aggregate(rows)
+        self._merge_into(db, ApiAccessDailyRollup, ('rollup_date', 'api_template', 'http_method', 'status_class'), daily)
+        self._merge_into(db, ApiAccessClientRollup, ('rollup_date', 'client_ip'), clients,
+                         extra_fields=('error_count',))
+        self._merge_sketches(db, sketches)
+
+    def _load_keyed_rows(self, db, model, key_fields: Tuple[str, ...], aggregated: Dict[tuple, Any],
+                         placeholder: Dict[str, Any]) -> Dict[tuple, Any]:
+        """读取批内各键已有的行，返回 {键: 行}
+
+        PostgreSQL 下并行导入的进程可能同时合并同一个键：先按键排序 upsert 这些键（缺少的键插入占位行，
+        已有的行只更新 updated_at），由此锁定本批涉及的行，只有键重叠的事务相互等待，
+        各事务按相同顺序加锁，不会死锁。
+        """
+        keys = sorted(aggregated)
+        postgresql = db.get_bind().dialect.name == 'postgresql'
+        columns = [getattr(model, name) for name in key_fields]
+        existing = {}
+        for start in range(0, len(keys), KEY_LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + KEY_LOOKUP_BATCH_SIZE]
+            query = db.query(model).filter(tuple_(*columns).in_(batch))
+            if postgresql:
+                rows = [dict(placeholder, **dict(zip(key_fields, key)), updated_at=datetime.now()) for key in batch]
+                statement = pg_insert(model).values(rows)
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=list(key_fields), set_={'updated_at': statement.excluded.updated_at}
+                ))
+            for record in query:
+                existing[tuple(getattr(record, name) for name in key_fields)] = record
+        return existing
+
+    def _merge_sketches(self, db, sketches: Dict[tuple, DDSketch]):
+        """读取已有草图，与批内草图合并后写回"""
+        if not sketches:
+            return
+        existing = self._load_keyed_rows(db, ApiLatencySketch, ('bucket_start', 'api_template'), sketches, {
+            'sample_count': 0,
+            'sketch': DDSketch(SKETCH_ALPHA).to_bytes()
+        })
+
+        new_rows = []
+        for (bucket_start, api_template), sketch in sketches.items():
+            record = existing.get((bucket_start, api_template))
+            if record is None:
+                new_rows.append({
+                    'bucket_start': bucket_start,
+                    'api_template': api_template,
+                    'sample_count': sketch.count,
+                    'sketch': sketch.to_bytes(),
+                    'updated_at': datetime.now()
+                })
+                continue
+            merged = DDSketch.from_bytes(record.sketch)
+            merged.merge(sketch)
+            record.sample_count = merged.count
+            record.sketch = merged.to_bytes()
+
+        if new_rows:
+            db.bulk_insert_mappings(ApiLatencySketch, new_rows)
+        db.flush()
+
+    def _merge_into(self, db, model, key_fields: Tuple[str, ...], aggregated: Dict[tuple, Dict],
+                    extra_fields: Tuple[str, ...] = ()):
+        """读取已有行，合并批内聚合结果后写回（新键插入，已有键更新）"""
+        if not aggregated:
+            return
+        existing = self._load_keyed_rows(db, model, key_fields, aggregated,
+                                         dict(_empty_metrics(), **{name: 0 for name in extra_fields}))
+
+        new_rows = []
+        for key, metrics in aggregated.items():
+            record = existing.get(key)
+            if record is None:
+                row = dict(zip(key_fields, key))
+                row.update(metrics)
+                row['updated_at'] = datetime.now()
+                new_rows.append(row)
+                continue
+
+            current = {name: getattr(record, name) for name in ROLLUP_METRIC_FIELDS + extra_fields}
+            merge_metrics(current, metrics)
+            for name in extra_fields:
+                current[name] = (getattr(record, name) or 0) + metrics[name]
+            for name, value in current.items():
+                setattr(record, name, value)
+
+        if new_rows:
+            db.bulk_insert_mappings(model, new_rows)
+        db.flush()
+
+    def delete_days(self, db, days: Iterable[date]):
+        """在当前事务中删除指定日期的预聚合数据（这些日期的原始日志被清除后重新导入时使用）"""
+        days = sorted(set(days))
+        if not days:
+            return
+        for model in (ApiAccessDailyRollup, ApiAccessClientRollup):
+            db.query(model).filter(model.rollup_date.in_(days)).delete(synchronize_session=False)
+        for day in days:
+            day_start = datetime.combine(day, datetime.min.time())
+            db.query(ApiLatencySketch).filter(
+                ApiLatencySketch.bucket_start >= day_start,
+                ApiLatencySketch.bucket_start < day_start + timedelta(days=1)
+            ).delete(synchronize_session=False)
+
+    def rebuild(self, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                chunk_size: int = 50000) -> int:
+        """根据原始日志重建预聚合数据（包含 start_date 和 end_date），返回处理的日志行数
+
+        用于为启用预聚合之前导入的历史数据补建，或在数据修复后重新计算。
+        只清除并重新计算仍有原始日志的日期：原始日志已被过期清理或归档删除的日期，
+        预聚合数据是这些日期仅存的统计，保持不变。
+        """
+        processed = 0
+        with get_db_session() as db:
+            days = self._raw_log_days(db, start_date, end_date)
+            self.delete_days(db, days)
+
+            columns = (GitlabApiAccessLog.access_time, GitlabApiAccessLog.client_ip, GitlabApiAccessLog.http_method,
+                       GitlabApiAccessLog.api_path, GitlabApiAccessLog.api_template, GitlabApiAccessLog.http_status,
+                       GitlabApiAccessLog.response_size, GitlabApiAccessLog.response_time)
+            query = db.query(*columns)
+            if start_date:
+                query = query.filter(GitlabApiAccessLog.access_time >= datetime.combine(start_date, datetime.min.time()))
+            if end_date:
+                query = query.filter(GitlabApiAccessLog.access_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+
+            chunk = []
+            for row in query.execution_options(yield_per=chunk_size):
+                chunk.append(row._asdict())
+                if len(chunk) >= chunk_size:
+                    self.apply(db, chunk)
+                    processed += len(chunk)
+                    chunk = []
+            if chunk:
+                self.apply(db, chunk)
+                processed += len(chunk)
+
+        logger.info(f"重建访问日志预聚合数据完成，{len(days)} 天，处理 {processed} 行")
+        return processed
+
+    @staticmethod
+    def _raw_log_days(db, start_date: Optional[date], end_date: Optional[date]) -> List[date]:
+        """范围内（包含两端）有原始日志的日期"""
+        query = db.query(func.date(GitlabApiAccessLog.access_time)).distinct()
+        if start_date:
+            query = query.filter(GitlabApiAccessLog.access_time >= datetime.combine(start_date, datetime.min.time()))
+        if end_date:
+            query = query.filter(GitlabApiAccessLog.access_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+        # SQLite 的 date() 返回字符串
+        return sorted(day if isinstance(day, date) else date.fromisoformat(day) for (day,) in query.all())
+
+    def get_endpoint_stats(self, start_date: date, end_date: date, order_by: str = 'request_count',
+                           http_method: Optional[str] = None, status_class: Optional[int] = None,
+                           limit: int = 50) -> List[Dict[str, Any]]:
+        """按接口模板和方法汇总日期范围内的访问统计
+
+        order_by: request_count / avg / p50 / p95 / p99 / max / error_count
+        """
+        query_filters = [ApiAccessDailyRollup.rollup_date >= start_date, ApiAccessDailyRollup.rollup_date <= end_date]
+        if http_method:
+            query_filters.append(ApiAccessDailyRollup.http_method == http_method.upper())
+        if status_class:
+            query_filters.append(ApiAccessDailyRollup.status_class == status_class)
+
+        with get_db_session() as db:
+            records = db.query(ApiAccessDailyRollup).filter(*query_filters).all()
+            grouped = {}
+            for record in records:
+                key = (record.api_template, record.http_method)
+                metrics = grouped.get(key)
+                if metrics is None:
+                    metrics = grouped[key] = dict(_empty_metrics(), error_count=0)
+                merge_metrics(metrics, {name: getattr(record, name) for name in ROLLUP_METRIC_FIELDS})
+                if record.status_class >= 4:
+                    metrics['error_count'] += record.request_count
+
+        results = [
+            dict(self._summarize(metrics), api_template=api_template, http_method=http_method,
+                 error_count=metrics['error_count'])
+            for (api_template, http_method), metrics in grouped.items()
+        ]
+        return self._sort_and_limit(results, order_by, limit)
+
+    def get_endpoint_daily(self, api_template: str, start_date: date, end_date: date,
+                           http_method: Optional[str] = None) -> List[Dict[str, Any]]:
+        """单个接口模板按天的访问统计"""
+        query_filters = [
+            ApiAccessDailyRollup.api_template == api_template,
+            ApiAccessDailyRollup.rollup_date >= start_date,
+            ApiAccessDailyRollup.rollup_date <= end_date
+        ]
+        if http_method:
+            query_filters.append(ApiAccessDailyRollup.http_method == http_method.upper())
+
+        with get_db_session() as db:
+            records = db.query(ApiAccessDailyRollup).filter(*query_filters).all()
+            grouped = {}
+            for record in records:
+                metrics = grouped.get(record.rollup_date)
+                if metrics is None:
+                    metrics = grouped[record.rollup_date] = dict(_empty_metrics(), error_count=0)
+                merge_metrics(metrics, {name: getattr(record, name) for name in ROLLUP_METRIC_FIELDS})
+                if record.status_class >= 4:
+                    metrics['error_count'] += record.request_count
+
+        return [
+            dict(self._summarize(metrics), date=rollup_date.isoformat(), error_count=metrics['error_count'])
+            for rollup_date, metrics in sorted(grouped.items())
+        ]
+
+    def get_client_stats(self, start_date: date, end_date: date, order_by: str = 'request_count',
+                         limit: int = 50) -> List[Dict[str, Any]]:
+        """按客户端 IP 汇总日期范围内的访问统计"""
+        with get_db_session() as db:
+            records = db.query(ApiAccessClientRollup).filter(
+                ApiAccessClientRollup.rollup_date >= start_date,
+                ApiAccessClientRollup.rollup_date <= end_date
+            ).all()
+            grouped = {}
+            for record in records:
+                metrics = grouped.get(record.client_ip)
+                if metrics is None:
+                    metrics = grouped[record.client_ip] = dict(_empty_metrics(), error_count=0)
+                merge_metrics(metrics, {name: getattr(record, name) for name in ROLLUP_METRIC_FIELDS})
+                metrics['error_count'] += record.error_count or 0
+
+        results = [
+            dict(self._summarize(metrics), client_ip=client_ip, error_count=metrics['error_count'])
+            for client_ip, metrics in grouped.items()
+        ]
+        return self._sort_and_limit(results, order_by, limit)
+
+    def get_daily_totals(self, start_date: date, end_date: date) -> List[Dict[str, Any]]:
+        """按天汇总的请求数和错误数"""
+        with get_db_session() as db:
+            rows = db.query(
+                ApiAccessDailyRollup.rollup_date,
+                ApiAccessDailyRollup.status_class,
+                func.sum(ApiAccessDailyRollup.request_count)
+            ).filter(
+                ApiAccessDailyRollup.rollup_date >= start_date,
+                ApiAccessDailyRollup.rollup_date <= end_date
+            ).group_by(ApiAccessDailyRollup.rollup_date, ApiAccessDailyRollup.status_class).all()
+
+        totals = {}
+        for rollup_date, status_class, count in rows:
+            day = totals.setdefault(rollup_date, {'date': rollup_date.isoformat(), 'request_count': 0, 'error_count': 0})
+            day['request_count'] += int(count or 0)
+            if status_class >= 4:
+                day['error_count'] += int(count or 0)
+        return [totals[day] for day in sorted(totals)]
+
+    def get_latency_percentiles(self, start_time: datetime, end_time: datetime,
+                                api_template: Optional[str] = None, group_by: str = 'api_template',
+                                quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99),
+                                order_by: str = 'p95', limit: int = 50) -> List[Dict[str, Any]]:
+        """合并 [start_time, end_time) 内各小时的草图，返回分位数
+
+        Args:
+            api_template: 只统计指定接口模板
+            group_by: api_template 按接口模板汇总整个时间窗口；hour 按小时汇总（按时间排序）
+            quantiles: 需要计算的分位数，结果字段名为 p50/p95/p99 这样的形式
+            order_by: group_by 为 api_template 时的排序字段（sample_count、avg、max 或分位数字段）
+        """
+        if group_by not in ('api_template', 'hour'):
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        # 小时草图只能整体合并，起止时间对齐到小时
+        start_bucket = start_time.replace(minute=0, second=0, microsecond=0)
+        query_filters = [ApiLatencySketch.bucket_start >= start_bucket, ApiLatencySketch.bucket_start < end_time]
+        if api_template:
+            query_filters.append(ApiLatencySketch.api_template == api_template)
+
+        merged: Dict[Any, DDSketch] = {}
+        with get_db_session() as db:
+            for bucket_start, template, data in db.query(
+                ApiLatencySketch.bucket_start, ApiLatencySketch.api_template, ApiLatencySketch.sketch
+            ).filter(*query_filters):
+                key = template if group_by == 'api_template' else bucket_start
+                sketch = merged.get(key)
+                if sketch is None:
+                    sketch = merged[key] = DDSketch(SKETCH_ALPHA)
+                sketch.merge(DDSketch.from_bytes(data))
+
+        results = []
+        for key, sketch in merged.items():
+            item = {
+                'sample_count': sketch.count,
+                'avg': round(sketch.avg, 6) if sketch.avg is not None else None,
+                'min': sketch.min,
+                'max': sketch.max
+            }
+            for quantile in quantiles:
+                value = sketch.quantile(quantile)
+                item[f'p{quantile * 100:g}'] = round(value, 6) if value is not None else None
+            if group_by == 'api_template':
+                item['api_template'] = key
+            else:
+                item['hour'] = key.isoformat()
+            results.append(item)
+
+        if group_by == 'hour':
+            return sorted(results, key=lambda item: item['hour'])
+        if results and order_by not in results[0]:
+            raise ValueError(f"Unsupported order_by: {order_by}")
+        results.sort(key=lambda item: item[order_by] if item[order_by] is not None else -1, reverse=True)
+        return results[:limit]
+
+    @staticmethod
+    def _summarize(metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """由合并后的指标计算平均值和分位数"""
+        histogram = metrics['latency_histogram']
+        minimum, maximum = metrics['response_time_min'], metrics['response_time_max']
+        timed = metrics['response_time_count']
+        return {
+            'request_count': metrics['request_count'],
+            'response_size_sum': metrics['response_size_sum'],
+            'avg': round(metrics['response_time_sum'] / timed, 6) if timed else None,
+            'min': minimum,
+            'max': maximum,
+            'p50': histogram_quantile(histogram, 0.50, minimum, maximum),
+            'p95': histogram_quantile(histogram, 0.95, minimum, maximum),
+            'p99': histogram_quantile(histogram, 0.99, minimum, maximum)
+        }
+
+    @staticmethod
+    def _sort_and_limit(results: List[Dict[str, Any]], order_by: str, limit: int) -> List[Dict[str, Any]]:
+        if order_by not in ('request_count', 'error_count', 'avg', 'p50', 'p95', 'p99', 'max'):
+            raise ValueError(f"Unsupported order_by: {order_by}")
+        results.sort(key=lambda item: item[order_by] if item[order_by] is not None else -1, reverse=True)
+        return results[:limit]
+
+
+# 创建全局预聚合服务实例
+access_rollup_service = AccessRollupService()
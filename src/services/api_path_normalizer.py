@@ -0,0 +1,348 @@
+"""
+访问日志接口路径归一化
+
+将具体请求路径转换为接口模板，用于按接口聚合访问日志，避免同一接口的不同参数
+被统计为不同的键，例如：
+    /api/v4/projects/123/repository/branches?page=4
+    -> /api/v4/projects/:id/repository/branches
+
+GitLab API v4 的常用路由编译为按路径段匹配的前缀树（字面段优先于参数段），
+未收录的路径按通用规则归一化（数字段替换为 :id，提交 SHA 替换为 :sha）。
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+# 接口模板列的最大长度（与数据库列长度一致）
+MAX_TEMPLATE_LENGTH = 500
+
+NUMERIC_SEGMENT = re.compile(r'^\d+$')
+SHA_SEGMENT = re.compile(r'^[0-9a-f]{40}$|^[0-9a-f]{64}$')
+
+# GitLab API v4 路由模板，:name 为参数段，末尾的 *name 匹配剩余所有段
+GITLAB_API_V4_ROUTES = (
+    # 项目
+    '/api/v4/projects',
+    '/api/v4/projects/:id',
+    '/api/v4/projects/:id/archive',
+    '/api/v4/projects/:id/unarchive',
+    '/api/v4/projects/:id/star',
+    '/api/v4/projects/:id/unstar',
+    '/api/v4/projects/:id/fork',
+    '/api/v4/projects/:id/forks',
+    '/api/v4/projects/:id/languages',
+    '/api/v4/projects/:id/events',
+    '/api/v4/projects/:id/share',
+    '/api/v4/projects/:id/uploads',
+    '/api/v4/projects/:id/search',
+    '/api/v4/projects/:id/users',
+    '/api/v4/projects/:id/statistics',
+    # 仓库
+    '/api/v4/projects/:id/repository/branches',
+    '/api/v4/projects/:id/repository/branches/:branch',
+    '/api/v4/projects/:id/repository/merged_branches',
+    '/api/v4/projects/:id/repository/tags',
+    '/api/v4/projects/:id/repository/tags/:tag_name',
+    '/api/v4/projects/:id/repository/commits',
+    '/api/v4/projects/:id/repository/commits/:sha',
+    '/api/v4/projects/:id/repository/commits/:sha/diff',
+    '/api/v4/projects/:id/repository/commits/:sha/comments',
+    '/api/v4/projects/:id/repository/commits/:sha/statuses',
+    '/api/v4/projects/:id/repository/commits/:sha/refs',
+    '/api/v4/projects/:id/repository/commits/:sha/merge_requests',
+    '/api/v4/projects/:id/repository/commits/:sha/cherry_pick',
+    '/api/v4/projects/:id/repository/commits/:sha/revert',
+    '/api/v4/projects/:id/repository/compare',
+    '/api/v4/projects/:id/repository/contributors',
+    '/api/v4/projects/:id/repository/tree',
+    '/api/v4/projects/:id/repository/archive',
+    '/api/v4/projects/:id/repository/archive.zip',
+    '/api/v4/projects/:id/repository/archive.tar.gz',
+    '/api/v4/projects/:id/repository/blobs/:sha',
+    '/api/v4/projects/:id/repository/blobs/:sha/raw',
+    '/api/v4/projects/:id/repository/files/:file_path',
+    '/api/v4/projects/:id/repository/files/:file_path/raw',
+    '/api/v4/projects/:id/repository/files/:file_path/blame',
+    '/api/v4/projects/:id/protected_branches',
+    '/api/v4/projects/:id/protected_branches/:name',
+    '/api/v4/projects/:id/protected_tags',
+    '/api/v4/projects/:id/protected_tags/:name',
+    '/api/v4/projects/:id/statuses/:sha',
+    # 成员与权限
+    '/api/v4/projects/:id/members',
+    '/api/v4/projects/:id/members/all',
+    '/api/v4/projects/:id/members/:user_id',
+    '/api/v4/projects/:id/members/all/:user_id',
+    '/api/v4/projects/:id/deploy_keys',
+    '/api/v4/projects/:id/deploy_keys/:key_id',
+    '/api/v4/projects/:id/access_tokens',
+    '/api/v4/projects/:id/hooks',
+    '/api/v4/projects/:id/hooks/:hook_id',
+    '/api/v4/projects/:id/variables',
+    '/api/v4/projects/:id/variables/:key',
+    # 合并请求
+    '/api/v4/projects/:id/merge_requests',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/changes',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/diffs',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/commits',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/notes',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/notes/:note_id',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/discussions',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/discussions/:discussion_id',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/discussions/:discussion_id/notes',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/approvals',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/approve',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/unapprove',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/approval_state',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/pipelines',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/merge',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/rebase',
+    '/api/v4/projects/:id/merge_requests/:merge_request_iid/participants',
+    # 议题、标签、里程碑
+    '/api/v4/projects/:id/issues',
+    '/api/v4/projects/:id/issues/:issue_iid',
+    '/api/v4/projects/:id/issues/:issue_iid/notes',
+    '/api/v4/projects/:id/issues/:issue_iid/notes/:note_id',
+    '/api/v4/projects/:id/issues/:issue_iid/discussions',
+    '/api/v4/projects/:id/issues/:issue_iid/links',
+    '/api/v4/projects/:id/labels',
+    '/api/v4/projects/:id/labels/:label_id',
+    '/api/v4/projects/:id/milestones',
+    '/api/v4/projects/:id/milestones/:milestone_id',
+    '/api/v4/projects/:id/snippets',
+    '/api/v4/projects/:id/snippets/:snippet_id',
+    '/api/v4/projects/:id/wikis',
+    '/api/v4/projects/:id/wikis/:slug',
+    # CI/CD
+    '/api/v4/projects/:id/pipelines',
+    '/api/v4/projects/:id/pipelines/latest',
+    '/api/v4/projects/:id/pipelines/:pipeline_id',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/jobs',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/bridges',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/variables',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/test_report',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/retry',
+    '/api/v4/projects/:id/pipelines/:pipeline_id/cancel',
+    '/api/v4/projects/:id/pipeline',
+    '/api/v4/projects/:id/pipeline_schedules',
+    '/api/v4/projects/:id/pipeline_schedules/:pipeline_schedule_id',
+    '/api/v4/projects/:id/trigger/pipeline',
+    '/api/v4/projects/:id/triggers',
+    '/api/v4/projects/:id/jobs',
+    '/api/v4/projects/:id/jobs/:job_id',
+    '/api/v4/projects/:id/jobs/:job_id/trace',
+    '/api/v4/projects/:id/jobs/:job_id/retry',
+    '/api/v4/projects/:id/jobs/:job_id/cancel',
+    '/api/v4/projects/:id/jobs/:job_id/play',
+    '/api/v4/projects/:id/jobs/:job_id/artifacts',
+    '/api/v4/projects/:id/jobs/:job_id/artifacts/*artifact_path',
+    '/api/v4/projects/:id/jobs/artifacts/:ref_name/download',
+    '/api/v4/projects/:id/jobs/artifacts/:ref_name/raw/*artifact_path',
+    '/api/v4/projects/:id/runners',
+    '/api/v4/projects/:id/environments',
+    '/api/v4/projects/:id/environments/:environment_id',
+    '/api/v4/projects/:id/deployments',
+    '/api/v4/projects/:id/deployments/:deployment_id',
+    '/api/v4/projects/:id/releases',
+    '/api/v4/projects/:id/releases/:tag_name',
+    '/api/v4/projects/:id/releases/:tag_name/assets/links',
+    # 制品库
+    '/api/v4/projects/:id/packages',
+    '/api/v4/projects/:id/packages/:package_id',
+    '/api/v4/projects/:id/packages/:package_id/package_files',
+    '/api/v4/projects/:id/packages/generic/:package_name/:package_version/:file_name',
+    '/api/v4/projects/:id/packages/maven/*file_path',
+    '/api/v4/projects/:id/packages/npm/*package_name',
+    '/api/v4/projects/:id/packages/pypi/simple/*package_name',
+    '/api/v4/projects/:id/packages/pypi/files/:sha256/:file_name',
+    '/api/v4/projects/:id/packages/pypi',
+    '/api/v4/projects/:id/packages/nuget/*file_path',
+    '/api/v4/projects/:id/packages/helm/*file_path',
+    '/api/v4/projects/:id/registry/repositories',
+    '/api/v4/projects/:id/registry/repositories/:repository_id/tags',
+    '/api/v4/projects/:id/registry/repositories/:repository_id/tags/:tag_name',
+    # 组
+    '/api/v4/groups',
+    '/api/v4/groups/:id',
+    '/api/v4/groups/:id/projects',
+    '/api/v4/groups/:id/projects/shared',
+    '/api/v4/groups/:id/subgroups',
+    '/api/v4/groups/:id/descendant_groups',
+    '/api/v4/groups/:id/members',
+    '/api/v4/groups/:id/members/all',
+    '/api/v4/groups/:id/members/:user_id',
+    '/api/v4/groups/:id/members/all/:user_id',
+    '/api/v4/groups/:id/variables',
+    '/api/v4/groups/:id/variables/:key',
+    '/api/v4/groups/:id/labels',
+    '/api/v4/groups/:id/milestones',
+    '/api/v4/groups/:id/issues',
+    '/api/v4/groups/:id/merge_requests',
+    '/api/v4/groups/:id/hooks',
+    '/api/v4/groups/:id/search',
+    '/api/v4/groups/:id/packages',
+    '/api/v4/groups/:id/access_tokens',
+    '/api/v4/groups/:id/runners',
+    '/api/v4/namespaces',
+    '/api/v4/namespaces/:id',
+    # 用户
+    '/api/v4/users',
+    '/api/v4/users/:id',
+    '/api/v4/users/:id/projects',
+    '/api/v4/users/:id/starred_projects',
+    '/api/v4/users/:id/keys',
+    '/api/v4/users/:id/gpg_keys',
+    '/api/v4/users/:id/events',
+    '/api/v4/users/:id/memberships',
+    '/api/v4/users/:id/status',
+    '/api/v4/users/:id/impersonation_tokens',
+    '/api/v4/users/:id/block',
+    '/api/v4/users/:id/unblock',
+    '/api/v4/user',
+    '/api/v4/user/keys',
+    '/api/v4/user/gpg_keys',
+    '/api/v4/user/emails',
+    '/api/v4/user/status',
+    '/api/v4/user/preferences',
+    '/api/v4/user/activities',
+    '/api/v4/personal_access_tokens',
+    '/api/v4/personal_access_tokens/self',
+    '/api/v4/personal_access_tokens/:id',
+    # 全局资源
+    '/api/v4/events',
+    '/api/v4/issues',
+    '/api/v4/merge_requests',
+    '/api/v4/todos',
+    '/api/v4/todos/:id/mark_as_done',
+    '/api/v4/search',
+    '/api/v4/snippets',
+    '/api/v4/snippets/:id',
+    '/api/v4/snippets/:id/raw',
+    '/api/v4/version',
+    '/api/v4/metadata',
+    '/api/v4/license',
+    '/api/v4/features',
+    '/api/v4/application/settings',
+    '/api/v4/application/statistics',
+    '/api/v4/broadcast_messages',
+    '/api/v4/keys/:id',
+    '/api/v4/hooks',
+    '/api/v4/hooks/:id',
+    # Runner
+    '/api/v4/runners',
+    '/api/v4/runners/all',
+    '/api/v4/runners/verify',
+    '/api/v4/runners/:id',
+    '/api/v4/runners/:id/jobs',
+    '/api/v4/jobs/request',
+    '/api/v4/jobs/:id',
+    '/api/v4/jobs/:id/trace',
+    '/api/v4/jobs/:id/artifacts',
+    '/api/v4/job',
+    # 内部接口（Git over SSH、Shell）
+    '/api/v4/internal/allowed',
+    '/api/v4/internal/authorized_keys',
+    '/api/v4/internal/discover',
+    '/api/v4/internal/check',
+    '/api/v4/internal/lfs_authenticate',
+    '/api/v4/internal/post_receive',
+    '/api/v4/internal/pre_receive',
+)
+
+
+class _RouteNode:
+    """前缀树节点"""
+    __slots__ = ('literals', 'param', 'wildcard', 'template')
+
+    def __init__(self):
+        self.literals: Dict[str, '_RouteNode'] = {}
+        self.param: Optional['_RouteNode'] = None
+        self.wildcard: Optional[str] = None  # 匹配剩余所有段时的模板
+        self.template: Optional[str] = None  # 在此节点结束时的模板
+
+
+class ApiPathNormalizer:
+    """按路由前缀树把请求路径归一化为接口模板，结果按路径缓存"""
+
+    def __init__(self, routes=GITLAB_API_V4_ROUTES, cache_size: int = 65536):
+        self.root = _RouteNode()
+        self.cache_size = cache_size
+        self._cache: Dict[str, str] = {}
+        for route in routes:
+            self.add_route(route)
+
+    def add_route(self, template: str):
+        node = self.root
+        for segment in template.strip('/').split('/'):
+            if segment.startswith('*'):
+                node.wildcard = template
+                return
+            if segment.startswith(':'):
+                if node.param is None:
+                    node.param = _RouteNode()
+                node = node.param
+            else:
+                node = node.literals.setdefault(segment, _RouteNode())
+        node.template = template
+
+    @staticmethod
+    def split_target(target: Optional[str]) -> Tuple[str, Optional[str], Optional[str]]:
+        """拆分请求行中的目标：'/path?query HTTP/1.1' -> ('/path', 'query', 'HTTP/1.1')"""
+        if not target:
+            return '/', None, None
+        target, _, protocol = target.partition(' ')
+        path, _, query = target.partition('?')
+        return path or '/', query or None, protocol or None
+
+    def template(self, path: str) -> str:
+        """返回路径（不含查询字符串）对应的接口模板"""
+        cached = self._cache.get(path)
+        if cached is not None:
+            return cached
+
+        segments = path.strip('/').split('/') if path.strip('/') else []
+        value = self._match(self.root, segments, 0) or self._generic_template(segments)
+        value = value[:MAX_TEMPLATE_LENGTH]
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[path] = value
+        return value
+
+    def _match(self, node: _RouteNode, segments, index: int) -> Optional[str]:
+        """字面段优先、参数段其次、通配段最后，失败时回溯"""
+        if index == len(segments):
+            return node.template
+        segment = segments[index]
+        child = node.literals.get(segment)
+        if child is not None:
+            matched = self._match(child, segments, index + 1)
+            if matched:
+                return matched
+        if node.param is not None and segment:
+            matched = self._match(node.param, segments, index + 1)
+            if matched:
+                return matched
+        return node.wildcard
+
+    @staticmethod
+    def _generic_template(segments) -> str:
+        """未收录路由的通用归一化：数字段替换为 :id，提交 SHA 替换为 :sha"""
+        normalized = []
+        for segment in segments:
+            if NUMERIC_SEGMENT.match(segment):
+                normalized.append(':id')
+            elif SHA_SEGMENT.match(segment):
+                normalized.append(':sha')
+            else:
+                normalized.append(segment)
+        return '/' + '/'.join(normalized)
+
+
+default_normalizer = ApiPathNormalizer()
+
+
+def api_path_template(api_path: Optional[str]) -> str:
+    """返回请求路径对应的接口模板，api_path 可包含查询字符串和协议部分"""
+    path, _, _ = ApiPathNormalizer.split_target(api_path)
+    return default_normalizer.template(path)
@@ -0,0 +1,175 @@
+"""
+分支规则匹配器
+
+将所有启用的分支规则按优先级预编译为一个正则表达式（每条规则一个命名分组），
+对一个分支名只需一次匹配即可得到优先级最高的命中规则。
+
+编译结果在进程内缓存：规则增删改时由 BranchRuleService 主动失效，
+同时每次获取时比对规则表的 (数量, 最大ID, 最后更新时间) 指纹，
+以感知其他进程对规则的修改。
+
+CompiledRuleSet.fingerprint 是规则内容的哈希，分支同步据此判断规则是否在上次分析后发生变化。
+"""
+import hashlib
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from database.connection import get_db_session
+from database.models import GitlabBranchRule
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """规则快照，脱离数据库会话后仍可安全使用"""
+    id: int
+    rule_name: str
+    branch_pattern: str
+    branch_type: str
+    is_deletable: bool
+    retention_days: Optional[int]
+    priority: int
+
+    @classmethod
+    def from_model(cls, rule: GitlabBranchRule) -> 'CompiledRule':
+        return cls(
+            id=rule.id,
+            rule_name=rule.rule_name,
+            branch_pattern=rule.branch_pattern,
+            branch_type=rule.branch_type,
+            is_deletable=rule.is_deletable,
+            retention_days=rule.retention_days,
+            priority=rule.priority
+        )
+
+
+def wildcard_to_regex(pattern: str) -> str:
+    """将通配符模式转换为正则表达式（不含首尾锚点）
+
+    支持多个模式用|分隔，* 匹配任意字符，? 匹配单个字符。
+    """
+    if pattern == '*':
+        return '.*'
+    return '|'.join(
+        p.strip().replace('*', '.*').replace('?', '.')
+        for p in pattern.split('|')
+    )
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str) -> 're.Pattern':
+    """编译单个通配符模式（带缓存）"""
+    return re.compile(f'(?:{wildcard_to_regex(pattern)})', re.IGNORECASE)
+
+
+def pattern_matches(branch_name: str, pattern: str) -> bool:
+    """检查分支名称是否完整匹配通配符模式"""
+    return compile_pattern(pattern).fullmatch(branch_name) is not None
+
+
+class CompiledRuleSet:
+    """按优先级预编译的规则集合"""
+
+    def __init__(self, rules: Iterable[CompiledRule]):
+        self.rules: List[CompiledRule] = list(rules)
+        # 规则内容（含优先级顺序）的哈希，规则未变化时跨进程、跨重启保持一致
+        self.fingerprint = hashlib.sha256(repr(self.rules).encode('utf-8')).hexdigest()
+        self._rules_by_group = {f'r{index}': rule for index, rule in enumerate(self.rules)}
+        self._combined = None
+        self._single: List[Tuple[CompiledRule, 're.Pattern']] = []
+
+        try:
+            # 每条规则一个命名分组，按优先级排列；fullmatch 回溯时按顺序尝试分支，
+            # 第一个能完整匹配的分组即为优先级最高的规则
+            self._combined = re.compile(
+                '|'.join(
+                    f'(?P<{name}>{wildcard_to_regex(rule.branch_pattern)})'
+                    for name, rule in self._rules_by_group.items()
+                ),
+                re.IGNORECASE
+            )
+        except re.error as e:
+            logger.warning(f'Failed to compile combined branch rule pattern, falling back to per-rule matching: {e}')
+
+        for rule in self.rules:
+            try:
+                self._single.append((rule, compile_pattern(rule.branch_pattern)))
+            except re.error as e:
+                logger.warning(f"Invalid branch pattern '{rule.branch_pattern}' in rule '{rule.rule_name}': {e}")
+
+    def match(self, branch_name: str) -> Optional[CompiledRule]:
+        """返回分支命中的优先级最高的规则，没有命中时返回 None"""
+        if self._combined is not None:
+            match = self._combined.fullmatch(branch_name)
+            if match is None:
+                return None
+            rule = self._rules_by_group.get(match.lastgroup)
+            if rule is not None:
+                return rule
+
+        # 组合表达式不可用，或规则模式中自带分组导致无法定位命中规则
+        for rule, regex in self._single:
+            if regex.fullmatch(branch_name):
+                return rule
+        return None
+
+    @classmethod
+    def from_models(cls, rules: Iterable[GitlabBranchRule]) -> 'CompiledRuleSet':
+        return cls(CompiledRule.from_model(rule) for rule in rules)
+
+
+_cache_lock = threading.Lock()
+_cached_rule_set: Optional[CompiledRuleSet] = None
+_cached_fingerprint: Optional[Tuple[int, Optional[int], Optional[datetime]]] = None
+
+
+def _rules_fingerprint(db) -> Tuple[int, Optional[int], Optional[datetime]]:
+    count, max_id, last_updated = db.query(
+        func.count(GitlabBranchRule.id),
+        func.max(GitlabBranchRule.id),
+        func.max(GitlabBranchRule.updated_at)
+    ).one()
+    return count, max_id, last_updated
+
+
+def _load_rule_set(db) -> CompiledRuleSet:
+    rules = db.query(GitlabBranchRule).filter(
+        GitlabBranchRule.is_active == True
+    ).order_by(GitlabBranchRule.priority.desc(), GitlabBranchRule.id).all()
+    return CompiledRuleSet.from_models(rules)
+
+
+def get_compiled_rule_set(db=None) -> CompiledRuleSet:
+    """获取当前启用规则的编译结果，规则未变化时复用缓存"""
+    global _cached_rule_set, _cached_fingerprint
+
+    if db is None:
+        with get_db_session() as session:
+            return get_compiled_rule_set(session)
+
+    fingerprint = _rules_fingerprint(db)
+    with _cache_lock:
+        if _cached_rule_set is not None and _cached_fingerprint == fingerprint:
+            return _cached_rule_set
+
+    rule_set = _load_rule_set(db)
+    with _cache_lock:
+        _cached_rule_set = rule_set
+        _cached_fingerprint = fingerprint
+    return rule_set
+
+
+def invalidate_compiled_rule_set():
+    """规则发生变化后清除缓存"""
+    global _cached_rule_set, _cached_fingerprint
+    with _cache_lock:
+        _cached_rule_set = None
+        _cached_fingerprint = None
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from database.connection import get_db_session
 from database.models import GitlabBranchRule, GitlabRepositoryBranch, GitlabRepository
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, text
 from dto.base_dto import BaseResult, CountableResult
 from dto.branch_rule_dto import (
     BranchRuleData, BranchRuleTestResult, 
@@ -13,12 +13,19 @@ from dto.branch_deletion_dto import (
     BranchDeletionReport, DeletableBranchDetail
 )
 from dto.statistics_dto import BranchDeletionSummary, DeletionStatistics
+from services.branch_rule_matcher import (
+    CompiledRule, compile_pattern, get_compiled_rule_set, invalidate_compiled_rule_set,
+    pattern_matches, wildcard_to_regex
+)
 
 # 使用基础结果类型
 BranchRuleOperationResult = BaseResult
 RuleApplicationResult = CountableResult
 
 class BranchRuleService:
+    # 核心分支，无论规则如何均不建议删除
+    CORE_BRANCH_NAMES = ('master', 'main', 'develop', 'dev')
+    
     def __init__(self):
         pass
     
@@ -50,6 +57,7 @@ class BranchRuleService:
                 
                 db.add(new_rule)
                 db.commit()
+                invalidate_compiled_rule_set()
                 
                 return BranchRuleOperationResult.create_success(
                     f"Rule '{rule_data['rule_name']}' created successfully"
@@ -97,6 +105,7 @@ class BranchRuleService:
                 
                 rule.updated_at = datetime.now()
                 db.commit()
+                invalidate_compiled_rule_set()
                 
                 return BranchRuleOperationResult.create_success(
                     f"Rule '{rule.rule_name}' updated successfully"
@@ -133,6 +142,7 @@ class BranchRuleService:
                 
                 db.delete(rule)
                 db.commit()
+                invalidate_compiled_rule_set()
                 
                 return BranchRuleOperationResult.create_success(
                     f"Rule '{rule_name}' deleted successfully"
@@ -185,20 +195,12 @@ class BranchRuleService:
             print(f"Error getting rules: {e}")
             return []
     
-    def match_branch_rule(self, branch_name: str) -> Optional[GitlabBranchRule]:
-        """根据分支名称匹配规则"""
+    def match_branch_rule(self, branch_name: str, rule_set=None) -> Optional[CompiledRule]:
+        """根据分支名称匹配规则（使用预编译的规则集合）"""
         try:
-            with get_db_session() as db:
-                # 获取所有启用的规则，按优先级排序
-                rules = db.query(GitlabBranchRule).filter(
-                    GitlabBranchRule.is_active == True
-                ).order_by(GitlabBranchRule.priority.desc()).all()
-                
-                for rule in rules:
-                    if self._match_pattern(branch_name, rule.branch_pattern):
-                        return rule
-                
-                return None
+            if rule_set is None:
+                rule_set = get_compiled_rule_set()
+            return rule_set.match(branch_name)
                 
         except Exception as e:
             print(f"Error matching branch rule for {branch_name}: {e}")
@@ -206,20 +208,7 @@ class BranchRuleService:
     
     def _match_pattern(self, branch_name: str, pattern: str) -> bool:
         """匹配分支名称和模式"""
-        # 支持通配符匹配
-        if pattern == '*':
-            return True
-        
-        # 支持多个模式用|分隔
-        patterns = pattern.split('|')
-        for p in patterns:
-            p = p.strip()
-            # 将通配符模式转换为正则表达式
-            regex_pattern = p.replace('*', '.*').replace('?', '.')
-            if re.match(f'^{regex_pattern}$', branch_name, re.IGNORECASE):
-                return True
-        
-        return False
+        return pattern_matches(branch_name, pattern)
     
     def test_rule_pattern(self, pattern: str, test_branches: List[str]) -> BranchRuleTestResult:
         """测试规则模式是否匹配指定的分支名称"""
@@ -237,73 +226,173 @@ class BranchRuleService:
         except Exception as e:
             return BranchRuleTestResult.create_failure(str(e))
     
-    def apply_rules_to_branches(self, repository_id: int = None) -> RuleApplicationResult:
-        """将规则应用到分支，标识哪些分支可删除"""
+    def apply_rules_to_branches(self, repository_id: int = None, pushdown: Optional[bool] = None) -> RuleApplicationResult:
+        """将规则应用到分支，标识哪些分支可删除
+        
+        Args:
+            repository_id: 只处理指定仓库的分支，为 None 时处理全部分支
+            pushdown: 是否将规则匹配和结果计算下推到数据库（仅支持 PostgreSQL），
+                为 None 时 PostgreSQL 自动启用，其他数据库在 Python 中逐分支计算
+        """
         try:
             with get_db_session() as db:
-                # 获取需要处理的分支
-                query = db.query(GitlabRepositoryBranch)
-                if repository_id:
-                    query = query.filter(GitlabRepositoryBranch.repository_id == repository_id)
+                rule_set = get_compiled_rule_set(db)
+                is_postgresql = db.get_bind().dialect.name == 'postgresql'
+                if pushdown is None:
+                    pushdown = is_postgresql
                 
-                branches = query.all()
-                
-                updated_count = 0
-                for branch in branches:
-                    # 匹配规则
-                    rule = self.match_branch_rule(branch.branch_name)
-                    
-                    if rule:
-                        # 应用规则
-                        branch.matched_rule_id = rule.id
-                        branch.branch_type = rule.branch_type
-                        
-                        # 设置删除建议原因
-                        deletion_reasons = []
-                        
-                        # 如果分支受保护，不建议删除
-                        if branch.protected:
-                            branch.is_deletable = False
-                            deletion_reasons.append("分支受保护")
-                        else:
-                            # 根据规则判断是否可删除
-                            branch.is_deletable = rule.is_deletable
-                            
-                            # 计算保留截止时间
-                            if rule.retention_days and branch.last_commit_date:
-                                branch.retention_deadline = branch.last_commit_date + timedelta(days=rule.retention_days)
-                                
-                                # 检查是否已过期
-                                if datetime.now() > branch.retention_deadline:
-                                    branch.is_deletable = True
-                                    deletion_reasons.append(f"超过保留期限({rule.retention_days}天)")
-                                else:
-                                    days_left = (branch.retention_deadline - datetime.now()).days
-                                    deletion_reasons.append(f"还有{days_left}天到期")
-                            else:
-                                branch.retention_deadline = None
-                                if rule.is_deletable:
-                                    deletion_reasons.append(f"根据规则'{rule.rule_name}'建议删除")
-                        
-                        # 添加额外的检查逻辑
-                        if branch.branch_name in ['master', 'main', 'develop', 'dev']:
-                            branch.is_deletable = False
-                            deletion_reasons = ["核心分支，不建议删除"]
-                        
-                        branch.deletion_reason = "; ".join(deletion_reasons) if deletion_reasons else None
-                        updated_count += 1
+                if pushdown and is_postgresql:
+                    updated_count, total_count = self._apply_rules_pushdown(db, rule_set, repository_id)
+                else:
+                    updated_count, total_count = self._apply_rules_in_python(db, rule_set, repository_id)
                 
                 db.commit()
                 
                 return RuleApplicationResult.create_success(
-                    updated_count, 
-                    f"Successfully applied rules to {updated_count}/{len(branches)} branches"
+                    updated_count,
+                    f"Successfully applied rules to {updated_count}/{total_count} branches"
                 )
-                
+        
         except Exception as e:
             print(f"Error applying rules to branches: {e}")
             return RuleApplicationResult.create_failure(str(e))
     
+    def _apply_rules_in_python(self, db, rule_set, repository_id: int = None):
+        """在 Python 中逐分支匹配规则并计算结果，返回 (更新数, 分支总数)"""
+        # 获取需要处理的分支
+        query = db.query(GitlabRepositoryBranch)
+        if repository_id:
+            query = query.filter(GitlabRepositoryBranch.repository_id == repository_id)
+        
+        branches = query.all()
+        
+        updated_count = 0
+        for branch in branches:
+            # 匹配规则
+            rule = self.match_branch_rule(branch.branch_name, rule_set)
+            
+            if rule:
+                # 应用规则
+                branch.matched_rule_id = rule.id
+                branch.branch_type = rule.branch_type
+                
+                # 设置删除建议原因
+                deletion_reasons = []
+                
+                # 如果分支受保护，不建议删除
+                if branch.protected:
+                    branch.is_deletable = False
+                    deletion_reasons.append("分支受保护")
+                else:
+                    # 根据规则判断是否可删除
+                    branch.is_deletable = rule.is_deletable
+                    
+                    # 计算保留截止时间
+                    if rule.retention_days and branch.last_commit_date:
+                        branch.retention_deadline = branch.last_commit_date + timedelta(days=rule.retention_days)
+                        
+                        # 检查是否已过期
+                        if datetime.now() > branch.retention_deadline:
+                            branch.is_deletable = True
+                            deletion_reasons.append(f"超过保留期限({rule.retention_days}天)")
+                        else:
+                            days_left = (branch.retention_deadline - datetime.now()).days
+                            deletion_reasons.append(f"还有{days_left}天到期")
+                    else:
+                        branch.retention_deadline = None
+                        if rule.is_deletable:
+                            deletion_reasons.append(f"根据规则'{rule.rule_name}'建议删除")
+                
+                # 添加额外的检查逻辑
+                if branch.branch_name in self.CORE_BRANCH_NAMES:
+                    branch.is_deletable = False
+                    deletion_reasons = ["核心分支，不建议删除"]
+                
+                branch.deletion_reason = "; ".join(deletion_reasons) if deletion_reasons else None
+                updated_count += 1
+        
+        return updated_count, len(branches)
+    
+    def _apply_rules_pushdown(self, db, rule_set, repository_id: int = None):
+        """在 PostgreSQL 中用一条 UPDATE 完成规则匹配和结果计算，返回 (更新数, 分支总数)
+        
+        每条规则的通配符模式转换为 ~* 正则，按优先级为每个分支取第一个命中的规则
+        （DISTINCT ON），保留期限和删除原因的计算与 _apply_rules_in_python 一致。
+        """
+        rule_ids, patterns = [], []
+        for rule in rule_set.rules:
+            try:
+                compile_pattern(rule.branch_pattern)
+            except re.error:
+                # 与 Python 实现一致：无效的模式不参与匹配
+                continue
+            rule_ids.append(rule.id)
+            patterns.append(f'^(?:{wildcard_to_regex(rule.branch_pattern)})$')
+        
+        params = {
+            'rule_ids': rule_ids,
+            'patterns': patterns,
+            'ranks': list(range(len(rule_ids))),
+            'core_names': list(self.CORE_BRANCH_NAMES),
+            'now': datetime.now()
+        }
+        repository_filter = ''
+        if repository_id:
+            repository_filter = 'WHERE b2.repository_id = :repository_id'
+            params['repository_id'] = repository_id
+        
+        result = db.execute(text(f"""
+            UPDATE gitlab_repository_branch AS b
+            SET matched_rule_id = m.rule_id,
+                branch_type = m.branch_type,
+                is_deletable = CASE
+                    WHEN b.branch_name = ANY(CAST(:core_names AS text[])) THEN false
+                    WHEN b.protected THEN false
+                    WHEN m.deadline IS NOT NULL AND :now > m.deadline THEN true
+                    ELSE m.is_deletable
+                END,
+                retention_deadline = CASE
+                    WHEN b.protected THEN b.retention_deadline
+                    ELSE m.deadline
+                END,
+                deletion_reason = CASE
+                    WHEN b.branch_name = ANY(CAST(:core_names AS text[])) THEN '核心分支，不建议删除'
+                    WHEN b.protected THEN '分支受保护'
+                    WHEN m.deadline IS NOT NULL AND :now > m.deadline
+                        THEN '超过保留期限(' || m.retention_days || '天)'
+                    WHEN m.deadline IS NOT NULL
+                        THEN '还有' || CAST(FLOOR(EXTRACT(EPOCH FROM (m.deadline - :now)) / 86400) AS integer) || '天到期'
+                    WHEN m.is_deletable THEN '根据规则''' || m.rule_name || '''建议删除'
+                    ELSE NULL
+                END
+            FROM (
+                SELECT DISTINCT ON (b2.id)
+                    b2.id AS branch_id,
+                    r.id AS rule_id,
+                    r.rule_name,
+                    r.branch_type,
+                    r.is_deletable,
+                    r.retention_days,
+                    CASE
+                        WHEN r.retention_days <> 0 AND b2.last_commit_date IS NOT NULL
+                        THEN b2.last_commit_date + r.retention_days * INTERVAL '1 day'
+                    END AS deadline
+                FROM gitlab_repository_branch AS b2
+                JOIN unnest(CAST(:rule_ids AS integer[]), CAST(:patterns AS text[]), CAST(:ranks AS integer[]))
+                    AS p(rule_id, regex, rank) ON b2.branch_name ~* p.regex
+                JOIN gitlab_branch_rule AS r ON r.id = p.rule_id
+                {repository_filter}
+                ORDER BY b2.id, p.rank
+            ) AS m
+            WHERE b.id = m.branch_id
+        """), params)
+        
+        total_query = db.query(func.count(GitlabRepositoryBranch.id))
+        if repository_id:
+            total_query = total_query.filter(GitlabRepositoryBranch.repository_id == repository_id)
+        
+        return result.rowcount, total_query.scalar()
+    
     def get_branch_deletion_report(self, repository_id: int = None) -> BranchDeletionReport:
         """获取分支删除建议报告"""
         try:
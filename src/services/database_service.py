@@ -2,21 +2,72 @@ from database.connection import get_db_session
 from database.models import (
     GitlabApiAccessLog, LogImportStatus, GitlabRepository, 
     GitlabGroup, GitlabGroupMember, GitlabRepositoryBranch, 
-    GitlabRepositoryPermission
+    GitlabRepositoryPermission, GitlabSyncWatermark, LogIngestCheckpoint, LogImportRun
 )
-from sqlalchemy import func, and_
-from datetime import datetime, date
-from typing import List, Dict, Optional, Any
+from sqlalchemy import func, and_, insert, update, values, column, cast
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, timezone
+import os
+import socket
+import threading
+import uuid
+from typing import List, Dict, Optional, Any, Iterable, Callable, Tuple
+from config.settings import settings
 from dto.import_dto import ImportStatusSummary, ImportDetail, ImportResult
 from dto.log_dto import ApiAccessLogData
 from dto.sync_dto import SyncResult, RepositoryId
+from services.log_partition_service import log_partition_service
+from services.access_rollup_service import access_rollup_service
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 导入进行期间更新 log_import_run 心跳的间隔（秒）
+IMPORT_HEARTBEAT_SECONDS = 30
+# 心跳超过该秒数未更新的导入视为已退出，其未完成的日期可以被其他导入清除后重新导入
+IMPORT_RUN_STALE_SECONDS = 120
+
+
+class ImportDateClaims:
+    """一次导入逐批认领日志行所属的日期（见 DatabaseService.claim_import_dates）"""
+    
+    def __init__(self, db_service: 'DatabaseService', import_run_id: str, imported_before: Iterable[date] = ()):
+        self.db_service = db_service
+        self.import_run_id = import_run_id
+        self.claimed = set()
+        # 已完整导入或正被其他导入写入的日期
+        self.busy = set(imported_before)
+    
+    def filter(self, rows: List[Dict]) -> Tuple[List[Dict], set]:
+        """返回 (可以写入的日志行, 跳过的日期)，首次遇到的日期先认领"""
+        entry_dates = [self.db_service._get_entry_date(entry) for entry in rows]
+        new_dates = set(entry_dates) - self.claimed - self.busy - {None}
+        if new_dates:
+            busy = self.db_service.claim_import_dates(new_dates, self.import_run_id)
+            self.busy |= busy
+            self.claimed |= new_dates - busy
+        kept = [entry for entry, entry_date in zip(rows, entry_dates) if entry_date not in self.busy]
+        return kept, set(entry_dates) & self.busy
+
+
 class DatabaseService:
+    # 仓库同步时参与变更比较和写入的字段
+    REPOSITORY_SYNC_FIELDS = (
+        'name', 'name_with_namespace', 'description', 'web_url', 'ssh_url_to_repo',
+        'http_url_to_repo', 'default_branch', 'visibility', 'created_at', 'last_activity_at'
+    )
+    REPOSITORY_UPSERT_CHUNK_SIZE = 1000
+    # 分支同步只比较提交和保护状态，提交相同则其余提交信息也相同
+    BRANCH_SYNC_FIELDS = ('commit_id', 'protected')
+    GROUP_MEMBER_SYNC_FIELDS = ('username', 'name', 'email', 'access_level')
+    # 分支规则分析写回的字段
+    BRANCH_ANALYSIS_FIELDS = ('branch_type', 'is_deletable', 'matched_rule_id', 'retention_deadline', 'deletion_reason')
+    BRANCH_ANALYSIS_CHUNK_SIZE = 1000
+    
     def __init__(self):
-        pass
+        self._import_heartbeats: Dict[str, threading.Event] = {}
     
     def is_date_already_imported(self, target_date):
         """检查指定日期的数据是否已经导入"""
@@ -62,72 +113,351 @@ class DatabaseService:
             print(f"Error recording import status: {e}")
     
     def insert_logs(self, log_entries, log_file_path=None) -> ImportResult:
-        """批量插入日志数据"""
+        """批量插入日志数据（按 LOG_INGEST_CHUNK_SIZE 分批写入）"""
         if not log_entries:
             return ImportResult.create_no_data()
         
-        # 获取日志数据中的日期
-        log_dates = set()
-        for entry in log_entries:
-            if 'access_time' in entry:
-                if isinstance(entry['access_time'], datetime):
-                    log_dates.add(entry['access_time'].date())
-                elif isinstance(entry['access_time'], str):
-                    try:
-                        dt = datetime.fromisoformat(entry['access_time'].replace('Z', '+00:00'))
-                        log_dates.add(dt.date())
-                    except:
-                        pass
+        chunk_size = settings.log_ingest.chunk_size
+        chunks = (log_entries[i:i + chunk_size] for i in range(0, len(log_entries), chunk_size))
+        return self.insert_log_stream(chunks, log_file_path)
+    
+    def insert_log_stream(self, chunks: Iterable[List[Dict]], log_file_path=None,
+                          progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                          imported_before: Optional[set] = None,
+                          mark_complete: bool = True,
+                          import_run_id: Optional[str] = None) -> ImportResult:
+        """流式分批导入日志
+        
+        开始时读取一次已完整导入日期的快照，属于这些日期的行直接跳过，其余行逐批导入。
+        每批在一个事务中用 executemany 批量插入，并合并到访问统计预聚合表、累加该批各日期的导入状态；
+        状态在导入过程中标记为未完成，全部批次写入后再标记为完成。
+        
+        每个日期第一次写入前先认领（见 claim_import_dates）：正被其他导入写入的日期跳过；
+        中断导入（导入已结束或心跳过期）留下的未完成日期先清除该日期已导入的行，再重新导入整天的数据。
         
-        # 检查是否已经导入过这些日期的数据
-        already_imported_dates = []
-        for log_date in log_dates:
-            if self.is_date_already_imported(log_date):
-                already_imported_dates.append(log_date)
+        Args:
+            chunks: 日志行字典的批次迭代器（通常由 LogParser 流式生成）
+            log_file_path: 日志文件路径，记录到导入状态表
+            progress_callback: 每批完成后调用，参数为进度字典
+                {'chunk', 'processed', 'inserted', 'skipped'}
+            imported_before: 已导入日期快照，为 None 时从状态表读取
+            mark_complete: 全部批次写入后是否把导入状态标记为完成；并行导入时各分片只逐批累加行数，
+                由父进程在所有分片成功后统一标记（见 mark_import_complete），
+                任一分片失败时已提交的日期保持未完成，重试时重新导入
+            import_run_id: 本次导入的运行记录（见 start_import_run），为 None 时自动创建；
+                并行导入时由父进程统一创建，各分片共用，同一日期只清除一次
+        """
+        if import_run_id is None:
+            with self.import_run(log_file_path) as import_run_id:
+                return self.insert_log_stream(chunks, log_file_path, progress_callback,
+                                              imported_before, mark_complete, import_run_id)
+        
+        if imported_before is None:
+            imported_before = self.get_imported_dates()
+        claims = ImportDateClaims(self, import_run_id, imported_before)
+        processed_count = 0
+        inserted_count = 0
+        total_date_counts = {}
+        skipped_dates = set()
+        
+        for chunk_index, chunk in enumerate(chunks, 1):
+            processed_count += len(chunk)
+            rows, chunk_skipped = claims.filter(chunk)
+            skipped_dates |= chunk_skipped
+            date_counts = {}
+            for entry in rows:
+                entry_date = self._get_entry_date(entry)
+                if entry_date:
+                    date_counts[entry_date] = date_counts.get(entry_date, 0) + 1
+            
+            if rows:
+                def write_chunk():
+                    with get_db_session() as db:
+                        db.execute(insert(GitlabApiAccessLog), rows)
+                        access_rollup_service.apply(db, rows)
+                        # 导入状态行已在认领日期时创建，并行分片只锁定各自更新的状态行
+                        self._add_import_counts(db, date_counts, log_file_path, import_run_id=import_run_id)
+                
+                log_partition_service.write_with_partitions(date_counts, write_chunk)
+                inserted_count += len(rows)
+                for entry_date, count in date_counts.items():
+                    total_date_counts[entry_date] = total_date_counts.get(entry_date, 0) + count
+            
+            print(f"Imported chunk {chunk_index}: {len(rows)} rows "
+                  f"(processed {processed_count}, inserted {inserted_count})")
+            if progress_callback:
+                progress_callback({
+                    'chunk': chunk_index,
+                    'processed': processed_count,
+                    'inserted': inserted_count,
+                    'skipped': processed_count - inserted_count
+                })
+        
+        if total_date_counts and mark_complete:
+            self._mark_import_complete(total_date_counts, import_run_id)
+        
+        return self.build_import_result(processed_count, inserted_count, total_date_counts, skipped_dates)
+    
+    def build_import_result(self, processed_count: int, inserted_count: int,
+                            date_counts: Dict[date, int], skipped_dates: set) -> ImportResult:
+        """根据导入统计创建导入结果"""
+        if processed_count == 0:
+            return ImportResult.create_no_data()
+        if inserted_count == 0 and skipped_dates:
+            return ImportResult.create_already_imported(processed_count, sorted(skipped_dates))
         
-        if already_imported_dates:
-            return ImportResult.create_already_imported(len(log_entries), already_imported_dates)
+        print(f"Successfully inserted {inserted_count} log entries")
+        result = ImportResult.create_success(inserted_count, processed_count, sorted(date_counts))
+        result.already_imported_dates = sorted(skipped_dates)
+        result.date_counts = date_counts
+        return result
+    
+    def mark_import_complete(self, import_dates, import_run_id: Optional[str] = None):
+        """将并行导入的日期标记为完成（所有分片成功后由父进程调用）"""
+        if import_dates:
+            self._mark_import_complete(import_dates, import_run_id)
+    
+    def start_import_run(self, log_file_path=None) -> str:
+        """登记一次导入并在后台线程中定期更新心跳，返回运行 ID（导入结束后调用 finish_import_run）"""
+        run_id = str(uuid.uuid4())
+        now = datetime.now()
+        with get_db_session() as db:
+            db.add(LogImportRun(
+                run_id=run_id,
+                owner=f"{socket.gethostname()}:{os.getpid()}",
+                log_file_path=log_file_path,
+                started_at=now,
+                heartbeat_at=now
+            ))
         
-        # 执行插入
+        stop_event = threading.Event()
+        self._import_heartbeats[run_id] = stop_event
+        threading.Thread(
+            target=self._heartbeat_import_run, args=(run_id, stop_event),
+            name=f"import-heartbeat-{run_id[:8]}", daemon=True
+        ).start()
+        return run_id
+    
+    def finish_import_run(self, run_id: str):
+        """停止心跳并记录导入结束，之后该导入未完成的日期可以被其他导入清除"""
+        stop_event = self._import_heartbeats.pop(run_id, None)
+        if stop_event:
+            stop_event.set()
+        with get_db_session() as db:
+            db.query(LogImportRun).filter(LogImportRun.run_id == run_id).update(
+                {LogImportRun.finished_at: datetime.now()}, synchronize_session=False
+            )
+    
+    @contextmanager
+    def import_run(self, log_file_path=None):
+        """在导入期间登记运行记录并保持心跳，生成运行 ID"""
+        run_id = self.start_import_run(log_file_path)
         try:
-            with get_db_session() as db:
-                inserted_count = 0
-                for entry in log_entries:
-                    try:
-                        log_record = GitlabApiAccessLog(**entry)
-                        db.add(log_record)
-                        inserted_count += 1
-                    except Exception as e:
-                        print(f"Error inserting single record: {e}")
+            yield run_id
+        finally:
+            self.finish_import_run(run_id)
+    
+    def _heartbeat_import_run(self, run_id: str, stop_event: threading.Event):
+        while not stop_event.wait(IMPORT_HEARTBEAT_SECONDS):
+            try:
+                with get_db_session() as db:
+                    db.query(LogImportRun).filter(LogImportRun.run_id == run_id).update(
+                        {LogImportRun.heartbeat_at: datetime.now()}, synchronize_session=False
+                    )
+            except Exception as e:
+                logger.warning(f"更新导入心跳失败: {e}")
+    
+    def _is_import_run_active(self, db, run_id: Optional[str]) -> bool:
+        """导入尚未结束且心跳未过期"""
+        if not run_id:
+            return False
+        run = db.query(LogImportRun).filter(LogImportRun.run_id == run_id).first()
+        return bool(
+            run and run.finished_at is None
+            and run.heartbeat_at >= datetime.now() - timedelta(seconds=IMPORT_RUN_STALE_SECONDS)
+        )
+    
+    def claim_import_dates(self, import_dates: Iterable[date], import_run_id: str) -> set:
+        """认领本次导入要写入的日期，返回不能写入的日期（已完整导入或正被其他导入写入）
+        
+        每个日期在独立的事务中认领：
+        - 没有导入状态时插入一条属于本次导入的未完成状态
+        - 状态属于本次导入（并行导入的其他分片已认领）时直接写入
+        - 已完成，或属于仍在进行的其他导入时跳过
+        - 属于已结束或心跳过期的导入（中断的导入）时，按原属导入条件更新状态为本次导入，
+          更新成功的事务清除该日期已导入的行和预聚合，更新不到说明被其他导入抢先认领，重新判断
+        """
+        busy = set()
+        for import_date in import_dates:
+            if not self._claim_import_date(import_date, import_run_id):
+                busy.add(import_date)
+        return busy
+    
+    def _claim_import_date(self, import_date: date, import_run_id: str) -> bool:
+        while True:
+            try:
+                with get_db_session() as db:
+                    status = db.query(LogImportStatus).filter(LogImportStatus.import_date == import_date).first()
+                    if status is None:
+                        db.add(LogImportStatus(
+                            import_date=import_date,
+                            record_count=0,
+                            import_time=datetime.now(),
+                            is_complete=False,
+                            import_run_id=import_run_id
+                        ))
+                        db.flush()
+                        return True
+                    if status.import_run_id == import_run_id:
+                        return True
+                    if status.is_complete or self._is_import_run_active(db, status.import_run_id):
+                        return False
+                    
+                    previous_run_id = status.import_run_id
+                    owner_filter = (LogImportStatus.import_run_id.is_(None) if previous_run_id is None
+                                    else LogImportStatus.import_run_id == previous_run_id)
+                    claimed = db.query(LogImportStatus).filter(
+                        LogImportStatus.import_date == import_date,
+                        LogImportStatus.is_complete == False,
+                        owner_filter
+                    ).update({
+                        LogImportStatus.record_count: 0,
+                        LogImportStatus.import_time: datetime.now(),
+                        LogImportStatus.import_run_id: import_run_id
+                    }, synchronize_session=False)
+                    if not claimed:
                         continue
-                
-                db.commit()
-                
-                # 记录每个日期的导入状态
-                date_counts = {}
-                for entry in log_entries:
-                    if 'access_time' in entry:
-                        if isinstance(entry['access_time'], datetime):
-                            entry_date = entry['access_time'].date()
-                        else:
-                            try:
-                                dt = datetime.fromisoformat(entry['access_time'].replace('Z', '+00:00'))
-                                entry_date = dt.date()
-                            except:
-                                continue
-                        
-                        date_counts[entry_date] = date_counts.get(entry_date, 0) + 1
-                
-                # 记录到状态表
-                for import_date, count in date_counts.items():
-                    self.record_import_status(import_date, count, log_file_path)
-                
-                print(f"Successfully inserted {inserted_count} log entries")
-                return ImportResult.create_success(inserted_count, len(log_entries), list(log_dates))
-                
-        except Exception as e:
-            print(f"Error inserting logs: {e}")
-            raise
+                    
+                    day_start = datetime.combine(import_date, datetime.min.time())
+                    deleted = db.query(GitlabApiAccessLog).filter(
+                        GitlabApiAccessLog.access_time >= day_start,
+                        GitlabApiAccessLog.access_time < day_start + timedelta(days=1)
+                    ).delete(synchronize_session=False)
+                    access_rollup_service.delete_days(db, [import_date])
+                    print(f"Reset interrupted import of {import_date}: removed {deleted} rows, re-importing the whole day")
+                    return True
+            except IntegrityError:
+                # 其他导入同时插入了该日期的状态，重新判断
+                continue
+    
+    def get_log_checkpoint(self, source_key: str) -> Optional[Dict[str, Any]]:
+        """获取日志导入断点（跟随导入按文件路径，按文件导入按内容标识）"""
+        with get_db_session() as db:
+            checkpoint = db.query(LogIngestCheckpoint).filter(
+                LogIngestCheckpoint.source_key == source_key
+            ).first()
+            if not checkpoint:
+                return None
+            return {
+                'source_key': checkpoint.source_key,
+                'log_file_path': checkpoint.log_file_path,
+                'inode': checkpoint.inode,
+                'offset': checkpoint.offset,
+                'fingerprint': checkpoint.fingerprint,
+                'updated_at': checkpoint.updated_at.isoformat() if checkpoint.updated_at else None
+            }
+    
+    def insert_logs_with_checkpoint(self, rows: List[Dict], source_key: str, log_file_path: str,
+                                    inode: Optional[int], offset: int, fingerprint: Optional[str],
+                                    import_run_id: Optional[str] = None) -> int:
+        """在同一事务中插入一批日志、累加导入状态并推进断点，保证断点与数据一致
+        
+        跟随导入不检查日期是否已导入（同一天的数据会持续追加）。
+        日志、导入状态和断点一起提交，中断后从断点继续不会重复或遗漏，
+        因此写入的日期直接标记为完成，不会被其他导入当作中断的导入清除。
+        需要跳过已导入日期时，调用方先用 ImportDateClaims 过滤并传入 import_run_id。
+        """
+        date_counts = {}
+        for entry in rows:
+            entry_date = self._get_entry_date(entry)
+            if entry_date:
+                date_counts[entry_date] = date_counts.get(entry_date, 0) + 1
+        
+        def write_batch():
+            with get_db_session() as db:
+                if rows:
+                    db.execute(insert(GitlabApiAccessLog), rows)
+                    access_rollup_service.apply(db, rows)
+            
+                if rows:
+                    self._add_import_counts(db, date_counts, log_file_path, is_complete=True,
+                                            import_run_id=import_run_id)
+            
+                checkpoint = db.query(LogIngestCheckpoint).filter(
+                    LogIngestCheckpoint.source_key == source_key
+                ).first()
+                if not checkpoint:
+                    checkpoint = LogIngestCheckpoint(source_key=source_key)
+                    db.add(checkpoint)
+                checkpoint.log_file_path = log_file_path
+                checkpoint.inode = inode
+                checkpoint.offset = offset
+                checkpoint.fingerprint = fingerprint
+                checkpoint.updated_at = datetime.now()
+        
+        log_partition_service.write_with_partitions(date_counts, write_batch)
+        return len(rows)
+    
+    def get_imported_dates(self) -> set:
+        """获取已完整导入的日期集合（未完成的日期来自中断或正在进行的导入，不计入）"""
+        with get_db_session() as db:
+            return {
+                row.import_date for row in db.query(LogImportStatus.import_date).filter(
+                    LogImportStatus.is_complete == True
+                ).all()
+            }
+    
+    def _get_entry_date(self, entry: Dict) -> Optional[date]:
+        """获取日志行的日期"""
+        access_time = entry.get('access_time')
+        if isinstance(access_time, datetime):
+            return access_time.date()
+        if isinstance(access_time, str):
+            try:
+                return datetime.fromisoformat(access_time.replace('Z', '+00:00')).date()
+            except ValueError:
+                return None
+        return None
+    
+    def _add_import_counts(self, db, date_counts: Dict[date, int], log_file_path=None, is_complete: bool = False,
+                           import_run_id: Optional[str] = None):
+        """在当前事务中累加各日期的导入行数，导入完成前标记为未完成（is_complete 为 True 时直接标记为完成）"""
+        if not date_counts:
+            return
+        existing = {
+            status.import_date: status
+            for status in db.query(LogImportStatus).filter(
+                LogImportStatus.import_date.in_(list(date_counts))
+            )
+        }
+        for import_date, count in date_counts.items():
+            status = existing.get(import_date)
+            if status:
+                status.record_count += count
+                status.import_time = datetime.now()
+                status.log_file_path = log_file_path
+                status.is_complete = is_complete
+                if import_run_id:
+                    status.import_run_id = import_run_id
+            else:
+                db.add(LogImportStatus(
+                    import_date=import_date,
+                    record_count=count,
+                    import_time=datetime.now(),
+                    log_file_path=log_file_path,
+                    is_complete=is_complete,
+                    import_run_id=import_run_id
+                ))
+    
+    def _mark_import_complete(self, import_dates, import_run_id: Optional[str] = None):
+        """将导入的日期标记为完成（指定 import_run_id 时只标记仍属于该导入的日期）"""
+        with get_db_session() as db:
+            query = db.query(LogImportStatus).filter(
+                LogImportStatus.import_date.in_(list(import_dates))
+            )
+            if import_run_id:
+                query = query.filter(LogImportStatus.import_run_id == import_run_id)
+            query.update({LogImportStatus.is_complete: True}, synchronize_session=False)
     
     def get_import_status_summary(self) -> ImportStatusSummary:
         """从状态表获取导入状态摘要"""
@@ -179,11 +509,21 @@ class DatabaseService:
             print(f"Error getting import details: {e}")
             return []
     
-    def get_logs(self, limit=100) -> List[ApiAccessLogData]:
-        """获取日志数据"""
+    def get_logs(self, limit=100, start_date: Optional[date] = None,
+                 end_date: Optional[date] = None) -> List[ApiAccessLogData]:
+        """获取日志数据
+        
+        start_date/end_date（均包含）转换为 access_time 的半开区间条件，
+        分区表上查询只扫描范围内的分区。
+        """
         try:
             with get_db_session() as db:
-                logs = db.query(GitlabApiAccessLog).order_by(GitlabApiAccessLog.access_time.desc()).limit(limit).all()
+                query = db.query(GitlabApiAccessLog)
+                if start_date:
+                    query = query.filter(GitlabApiAccessLog.access_time >= datetime.combine(start_date, datetime.min.time()))
+                if end_date:
+                    query = query.filter(GitlabApiAccessLog.access_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+                logs = query.order_by(GitlabApiAccessLog.access_time.desc()).limit(limit).all()
                 return [ApiAccessLogData.from_model(log) for log in logs]  # 修正：使用 from_model
         except Exception as e:
             print(f"Error fetching logs: {e}")
@@ -199,62 +539,93 @@ class DatabaseService:
             return 0
     
     def sync_repositories(self, repositories: List[Dict]) -> SyncResult:
-        """同步仓库数据到数据库"""
+        """同步仓库数据到数据库（按批次 upsert）
+        
+        每批先用一条 SELECT 取出已有行进行比对，只写入新增或内容有变化的行：
+        PostgreSQL 使用一条 INSERT ... ON CONFLICT (id) DO UPDATE，
+        其他数据库（如测试使用的 SQLite）使用批量 INSERT 加按主键的批量 UPDATE。
+        """
         try:
+            rows = {}
+            for repo_data in repositories:
+                try:
+                    row = self._build_repository_row(repo_data)
+                    rows[row['id']] = row
+                except Exception as e:
+                    print(f"Error syncing repository {repo_data.get('id', 'unknown')}: {e}")
+                    continue
+            
+            inserted = updated = unchanged = 0
+            row_list = list(rows.values())
+            
             with get_db_session() as db:
-                synced_count = 0
+                use_pg_upsert = db.get_bind().dialect.name == 'postgresql'
+                columns = [getattr(GitlabRepository, name) for name in self.REPOSITORY_SYNC_FIELDS]
                 
-                for repo_data in repositories:
-                    try:
-                        # 检查仓库是否已存在
-                        existing_repo = db.query(GitlabRepository).filter(
-                            GitlabRepository.id == repo_data['id']
-                        ).first()
-                        
-                        if existing_repo:
-                            # 更新现有仓库
-                            existing_repo.name = repo_data.get('name', '')
-                            existing_repo.name_with_namespace = repo_data.get('name_with_namespace', '')
-                            existing_repo.description = repo_data.get('description', '')
-                            existing_repo.web_url = repo_data.get('web_url', '')
-                            existing_repo.ssh_url_to_repo = repo_data.get('ssh_url_to_repo', '')
-                            existing_repo.http_url_to_repo = repo_data.get('http_url_to_repo', '')
-                            existing_repo.default_branch = repo_data.get('default_branch', '')
-                            existing_repo.visibility = repo_data.get('visibility', '')
-                            existing_repo.created_at = self._parse_datetime(repo_data.get('created_at'))
-                            existing_repo.last_activity_at = self._parse_datetime(repo_data.get('last_activity_at'))
-                            existing_repo.sync_time = datetime.now()
+                for offset in range(0, len(row_list), self.REPOSITORY_UPSERT_CHUNK_SIZE):
+                    chunk = row_list[offset:offset + self.REPOSITORY_UPSERT_CHUNK_SIZE]
+                    existing = {
+                        record.id: record
+                        for record in db.query(GitlabRepository.id, *columns).filter(
+                            GitlabRepository.id.in_([row['id'] for row in chunk])
+                        )
+                    }
+                    
+                    new_rows = []
+                    changed_rows = []
+                    for row in chunk:
+                        current = existing.get(row['id'])
+                        if current is None:
+                            new_rows.append(row)
+                        elif any(getattr(current, name) != row[name] for name in self.REPOSITORY_SYNC_FIELDS):
+                            changed_rows.append(row)
                         else:
-                            # 创建新仓库记录
-                            new_repo = GitlabRepository(
-                                id=repo_data['id'],
-                                name=repo_data.get('name', ''),
-                                name_with_namespace=repo_data.get('name_with_namespace', ''),
-                                description=repo_data.get('description', ''),
-                                web_url=repo_data.get('web_url', ''),
-                                ssh_url_to_repo=repo_data.get('ssh_url_to_repo', ''),
-                                http_url_to_repo=repo_data.get('http_url_to_repo', ''),
-                                default_branch=repo_data.get('default_branch', ''),
-                                visibility=repo_data.get('visibility', ''),
-                                created_at=self._parse_datetime(repo_data.get('created_at')),
-                                last_activity_at=self._parse_datetime(repo_data.get('last_activity_at')),
-                                sync_time=datetime.now()
-                            )
-                            db.add(new_repo)
-                        
-                        synced_count += 1
-                        
-                    except Exception as e:
-                        print(f"Error syncing repository {repo_data.get('id', 'unknown')}: {e}")
-                        continue
+                            unchanged += 1
+                    
+                    if use_pg_upsert and (new_rows or changed_rows):
+                        stmt = pg_insert(GitlabRepository).values(new_rows + changed_rows)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[GitlabRepository.id],
+                            set_={name: stmt.excluded[name] for name in self.REPOSITORY_SYNC_FIELDS + ('sync_time',)}
+                        )
+                        db.execute(stmt)
+                    else:
+                        if new_rows:
+                            db.execute(insert(GitlabRepository), new_rows)
+                        if changed_rows:
+                            db.execute(update(GitlabRepository), changed_rows)
+                    
+                    inserted += len(new_rows)
+                    updated += len(changed_rows)
                 
                 db.commit()
-                return SyncResult.create_success(synced_count, len(repositories))  # 修正：添加 total_found 参数
+            
+            return SyncResult.create_success(
+                len(row_list), len(repositories),
+                inserted=inserted, updated=updated, unchanged=unchanged
+            )
                 
         except Exception as e:
             print(f"Error in sync_repositories: {e}")
             return SyncResult.create_failure(str(e))
     
+    def _build_repository_row(self, repo_data: Dict) -> Dict[str, Any]:
+        """将仓库 DTO 字典转换为 gitlab_repository 表的行数据（时间统一为不带时区的 UTC）"""
+        return {
+            'id': repo_data['id'],
+            'name': repo_data.get('name', ''),
+            'name_with_namespace': repo_data.get('name_with_namespace', ''),
+            'description': repo_data.get('description', ''),
+            'web_url': repo_data.get('web_url', ''),
+            'ssh_url_to_repo': repo_data.get('ssh_url_to_repo', ''),
+            'http_url_to_repo': repo_data.get('http_url_to_repo', ''),
+            'default_branch': repo_data.get('default_branch', ''),
+            'visibility': repo_data.get('visibility', ''),
+            'created_at': self._to_naive_utc(self._parse_datetime(repo_data.get('created_at'))),
+            'last_activity_at': self._to_naive_utc(self._parse_datetime(repo_data.get('last_activity_at'))),
+            'sync_time': datetime.now()
+        }
+    
     def sync_group(self, group_data: Dict) -> SyncResult:
         """同步单个组织数据"""
         try:
@@ -294,78 +665,184 @@ class DatabaseService:
             return SyncResult.create_failure(str(e))
     
     def sync_group_members(self, group_id: int, members: List[Dict]) -> SyncResult:
-        """同步组织成员数据"""
+        """同步组织成员数据（按 user_id 比对差异，只写入新增/变化/消失的成员）"""
         try:
+            incoming = {}
+            for member_data in members:
+                try:
+                    access_level = member_data.get('access_level', 0)
+                    incoming[member_data['id']] = {
+                        'group_id': group_id,
+                        'user_id': member_data['id'],
+                        'username': member_data.get('username', ''),
+                        'name': member_data.get('name', ''),
+                        'email': member_data.get('email', ''),
+                        'access_level': access_level,
+                        'access_level_name': self._get_access_level_name(access_level),
+                        'sync_time': datetime.now()
+                    }
+                except Exception as e:
+                    print(f"Error syncing member {member_data.get('id', 'unknown')}: {e}")
+                    continue
+            
             with get_db_session() as db:
-                # 删除现有成员记录
-                db.query(GitlabGroupMember).filter(
+                existing = db.query(GitlabGroupMember).filter(
                     GitlabGroupMember.group_id == group_id
-                ).delete()
-                
-                synced_count = 0
-                for member_data in members:
-                    try:
-                        new_member = GitlabGroupMember(
-                            group_id=group_id,
-                            user_id=member_data['id'],
-                            username=member_data.get('username', ''),
-                            name=member_data.get('name', ''),
-                            email=member_data.get('email', ''),
-                            access_level=member_data.get('access_level', 0),
-                            access_level_name=self._get_access_level_name(member_data.get('access_level', 0)),
-                            sync_time=datetime.now()
-                        )
-                        db.add(new_member)
-                        synced_count += 1
-                        
-                    except Exception as e:
-                        print(f"Error syncing member {member_data.get('id', 'unknown')}: {e}")
-                        continue
-                
+                ).all()
+                delta = self._apply_row_diff(
+                    db, GitlabGroupMember,
+                    {member.user_id: member for member in existing},
+                    incoming,
+                    self.GROUP_MEMBER_SYNC_FIELDS
+                )
                 db.commit()
-                return SyncResult.create_success(synced_count, len(members))  # 修正：添加 total_found 参数
+            
+            return self._create_diff_sync_result(delta, len(incoming), len(members))
                 
         except Exception as e:
             print(f"Error syncing group members for group {group_id}: {e}")
             return SyncResult.create_failure(str(e))
     
     def sync_repository_branches(self, repository_id: int, branches: List[Dict]) -> SyncResult:
-        """同步仓库分支数据"""
+        """同步仓库分支数据
+        
+        以 (repository_id, branch_name) 为键与现有记录比对：新分支插入，
+        commit_id 或保护状态变化的分支更新，GitLab 上已不存在的分支删除，
+        未变化的分支保留原有行及规则分析结果。
+        
+        返回结果的 data 中包含 inserted/updated/deleted 三个分支名列表，
+        供后续规则分析只处理有变化的分支。
+        """
         try:
+            incoming = {}
+            for branch_data in branches:
+                try:
+                    branch_name = branch_data.get('branch_name', '')
+                    incoming[branch_name] = {
+                        'repository_id': repository_id,
+                        'branch_name': branch_name,
+                        'commit_id': branch_data.get('commit_id', ''),
+                        'commit_message': branch_data.get('commit_message', ''),
+                        'commit_author_name': branch_data.get('commit_author_name', ''),
+                        'commit_author_email': branch_data.get('commit_author_email', ''),
+                        'last_commit_date': self._to_naive_utc(self._parse_datetime(branch_data.get('last_commit_date'))),
+                        'protected': branch_data.get('protected', False),
+                        'sync_time': datetime.now()
+                    }
+                except Exception as e:
+                    print(f"Error syncing branch {branch_data.get('branch_name', 'unknown')}: {e}")
+                    continue
+            
             with get_db_session() as db:
-                # 删除现有分支记录
-                db.query(GitlabRepositoryBranch).filter(
+                existing = db.query(GitlabRepositoryBranch).filter(
                     GitlabRepositoryBranch.repository_id == repository_id
-                ).delete()
-                
-                synced_count = 0
-                for branch_data in branches:
-                    try:
-                        new_branch = GitlabRepositoryBranch(
-                            repository_id=repository_id,
-                            branch_name=branch_data.get('branch_name', ''),
-                            commit_id=branch_data.get('commit_id', ''),
-                            commit_message=branch_data.get('commit_message', ''),
-                            commit_author_name=branch_data.get('commit_author_name', ''),
-                            commit_author_email=branch_data.get('commit_author_email', ''),
-                            last_commit_date=self._parse_datetime(branch_data.get('last_commit_date')),
-                            protected=branch_data.get('protected', False),
-                            sync_time=datetime.now()
-                        )
-                        db.add(new_branch)
-                        synced_count += 1
-                        
-                    except Exception as e:
-                        print(f"Error syncing branch {branch_data.get('branch_name', 'unknown')}: {e}")
-                        continue
-                
+                ).all()
+                delta = self._apply_row_diff(
+                    db, GitlabRepositoryBranch,
+                    {branch.branch_name: branch for branch in existing},
+                    incoming,
+                    self.BRANCH_SYNC_FIELDS
+                )
                 db.commit()
-                return SyncResult.create_success(synced_count, len(branches))  # 修正：添加 total_found 参数
+            
+            return self._create_diff_sync_result(delta, len(incoming), len(branches))
                 
         except Exception as e:
             print(f"Error syncing branches for repository {repository_id}: {e}")
             return SyncResult.create_failure(str(e))
     
+    def _apply_row_diff(self, db, model, existing: Dict[Any, Any], incoming: Dict[Any, Dict],
+                        compare_fields: tuple) -> Dict[str, List]:
+        """比对现有行与新数据并批量写入差异
+        
+        Args:
+            db: 数据库会话
+            model: ORM 模型类
+            existing: 业务键 -> 现有 ORM 对象
+            incoming: 业务键 -> 新的行数据
+            compare_fields: 用于判断行是否变化的字段
+            
+        Returns:
+            {'inserted': [...], 'updated': [...], 'deleted': [...]}，元素为业务键
+        """
+        new_rows = []
+        changed_rows = []
+        delta = {'inserted': [], 'updated': [], 'deleted': []}
+        
+        for key, row in incoming.items():
+            current = existing.get(key)
+            if current is None:
+                new_rows.append(row)
+                delta['inserted'].append(key)
+            elif any(getattr(current, name) != row[name] for name in compare_fields):
+                changed_rows.append(dict(row, id=current.id))
+                delta['updated'].append(key)
+        
+        deleted_ids = []
+        for key, current in existing.items():
+            if key not in incoming:
+                deleted_ids.append(current.id)
+                delta['deleted'].append(key)
+        
+        if new_rows:
+            db.execute(insert(model), new_rows)
+        if changed_rows:
+            db.execute(update(model), changed_rows)
+        if deleted_ids:
+            db.query(model).filter(model.id.in_(deleted_ids)).delete(synchronize_session=False)
+        
+        return delta
+    
+    def _create_diff_sync_result(self, delta: Dict[str, List], synced_count: int, total_found: int) -> SyncResult:
+        """根据差异结果创建同步结果，差异明细放在 data 中"""
+        inserted = len(delta['inserted'])
+        updated = len(delta['updated'])
+        result = SyncResult.create_success(
+            synced_count, total_found,
+            inserted=inserted,
+            updated=updated,
+            unchanged=synced_count - inserted - updated,
+            deleted=len(delta['deleted'])
+        )
+        result.data = delta
+        return result
+    
+    def update_branch_analysis(self, db, rows: List[Dict]) -> int:
+        """批量写回分支规则分析结果
+        
+        rows 中每项包含 id 及 BRANCH_ANALYSIS_FIELDS 字段。PostgreSQL 下每批使用一条
+        UPDATE ... FROM (VALUES ...) 语句，其他数据库使用按主键的批量 UPDATE。
+        
+        Args:
+            db: 数据库会话（由调用方提交）
+            rows: 需要更新的分支行
+            
+        Returns:
+            更新的行数
+        """
+        if not rows:
+            return 0
+        
+        if db.get_bind().dialect.name != 'postgresql':
+            db.execute(update(GitlabRepositoryBranch), rows)
+            return len(rows)
+        
+        table = GitlabRepositoryBranch.__table__
+        fields = ('id',) + self.BRANCH_ANALYSIS_FIELDS
+        for offset in range(0, len(rows), self.BRANCH_ANALYSIS_CHUNK_SIZE):
+            chunk = rows[offset:offset + self.BRANCH_ANALYSIS_CHUNK_SIZE]
+            data = values(
+                *[column(name, table.c[name].type) for name in fields],
+                name='analysis'
+            ).data([tuple(row[name] for name in fields) for row in chunk])
+            db.execute(
+                update(table)
+                .where(table.c.id == data.c.id)
+                # VALUES 中全为 NULL 的列会被推断为 text，显式转换为目标列类型
+                .values({name: cast(data.c[name], table.c[name].type) for name in self.BRANCH_ANALYSIS_FIELDS})
+            )
+        return len(rows)
+    
     def sync_repository_permissions(self, repository_id: int, permissions: List[Dict]) -> SyncResult:
         """同步仓库权限数据"""
         try:
@@ -411,6 +888,65 @@ class DatabaseService:
             print(f"Error getting repository IDs: {e}")
             return []
     
+    def get_repository_ids_active_since(self, since: datetime) -> List[RepositoryId]:
+        """获取 last_activity_at 晚于指定时间的仓库ID（增量同步使用）"""
+        try:
+            with get_db_session() as db:
+                repositories = db.query(GitlabRepository.id).filter(
+                    GitlabRepository.last_activity_at > since
+                ).all()
+                return RepositoryId.from_list(repositories)
+        except Exception as e:
+            print(f"Error getting active repository IDs: {e}")
+            return []
+    
+    def get_max_repository_activity(self) -> Optional[datetime]:
+        """获取数据库中所有仓库最大的 last_activity_at"""
+        try:
+            with get_db_session() as db:
+                return db.query(func.max(GitlabRepository.last_activity_at)).scalar()
+        except Exception as e:
+            print(f"Error getting max repository activity: {e}")
+            return None
+    
+    def get_sync_watermark(self, resource: str) -> Optional[datetime]:
+        """获取指定资源的增量同步水位，不存在时返回 None"""
+        try:
+            with get_db_session() as db:
+                record = db.query(GitlabSyncWatermark).filter(
+                    GitlabSyncWatermark.resource == resource
+                ).first()
+                return record.watermark if record else None
+        except Exception as e:
+            print(f"Error getting sync watermark for {resource}: {e}")
+            return None
+    
+    def set_sync_watermark(self, resource: str, watermark: Optional[datetime], sync_mode: str) -> bool:
+        """更新指定资源的增量同步水位"""
+        try:
+            with get_db_session() as db:
+                record = db.query(GitlabSyncWatermark).filter(
+                    GitlabSyncWatermark.resource == resource
+                ).first()
+                
+                if record:
+                    record.watermark = watermark
+                    record.sync_mode = sync_mode
+                    record.last_sync_time = datetime.now()
+                else:
+                    db.add(GitlabSyncWatermark(
+                        resource=resource,
+                        watermark=watermark,
+                        sync_mode=sync_mode,
+                        last_sync_time=datetime.now()
+                    ))
+                
+                db.commit()
+                return True
+        except Exception as e:
+            print(f"Error setting sync watermark for {resource}: {e}")
+            return False
+    
     def _parse_datetime(self, datetime_str: str) -> datetime:
         """解析日期时间字符串"""
         if not datetime_str:
@@ -423,6 +959,12 @@ class DatabaseService:
         except Exception:
             return None
     
+    def _to_naive_utc(self, value: Optional[datetime]) -> Optional[datetime]:
+        """带时区的时间转换为不带时区的 UTC 时间，便于与数据库中的值直接比较"""
+        if value is None or value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    
     def _get_access_level_name(self, access_level: int) -> str:
         """将访问级别数字转换为名称"""
         level_names = {
@@ -8,52 +8,52 @@ from openpyxl.utils import get_column_letter
 from database.connection import get_db_session
 from database.models import GitlabRepositoryBranch, GitlabRepository, GitlabBranchRule
 from dto.branch_dto import BranchExportData 
+from services.branch_rule_matcher import get_compiled_rule_set, pattern_matches
 from sqlalchemy.orm import joinedload
 
 class ExportService:
     def __init__(self):
         pass
     
-    def _apply_branch_rules(self, branch: GitlabRepositoryBranch, db) -> Dict[str, Any]:
-        """根据分支规则计算分支属性"""
-        # 获取所有启用的分支规则，按优先级排序
-        rules = db.query(GitlabBranchRule).filter(
-            GitlabBranchRule.is_active == True
-        ).order_by(GitlabBranchRule.priority.desc()).all()
+    def _apply_branch_rules(self, branch: GitlabRepositoryBranch, db, rule_set=None) -> Dict[str, Any]:
+        """根据分支规则计算分支属性，批量计算时可传入已加载的 rule_set"""
+        # 获取预编译的启用规则（按优先级排序）
+        if rule_set is None:
+            rule_set = get_compiled_rule_set(db)
         
         result = {
             'branch_type': branch.branch_type,  # 默认使用数据库中的值
             'is_deletable': False,
             'retention_deadline': None,
             'deletion_reason': None,
-            'matched_rule_name': None
+            'matched_rule_name': None,
+            'matched_rule_id': None
         }
         
-        # 遍历规则，找到第一个匹配的规则
-        for rule in rules:
-            if self._branch_matches_pattern(branch.branch_name, rule.branch_pattern):
-                result['branch_type'] = rule.branch_type
-                result['is_deletable'] = rule.is_deletable and not branch.protected
-                result['matched_rule_name'] = rule.rule_name
-                
-                # 计算保留截止时间
-                if rule.retention_days and branch.last_commit_date:
-                    result['retention_deadline'] = branch.last_commit_date + timedelta(days=rule.retention_days)
+        # 找到第一个匹配的规则
+        rule = rule_set.match(branch.branch_name)
+        if rule:
+            result['branch_type'] = rule.branch_type
+            result['is_deletable'] = rule.is_deletable and not branch.protected
+            result['matched_rule_name'] = rule.rule_name
+            result['matched_rule_id'] = rule.id
+            
+            # 计算保留截止时间
+            if rule.retention_days and branch.last_commit_date:
+                result['retention_deadline'] = branch.last_commit_date + timedelta(days=rule.retention_days)
                     
-                    # 检查是否已过期
-                    if result['retention_deadline'] and datetime.now() > result['retention_deadline']:
-                        result['deletion_reason'] = f"根据规则'{rule.rule_name}'，分支已超过{rule.retention_days}天保留期限"
-                    elif result['is_deletable']:
-                        result['deletion_reason'] = f"根据规则'{rule.rule_name}'，该类型分支可删除"
+                # 检查是否已过期
+                if result['retention_deadline'] and datetime.now() > result['retention_deadline']:
+                    result['deletion_reason'] = f"根据规则'{rule.rule_name}'，分支已超过{rule.retention_days}天保留期限"
                 elif result['is_deletable']:
                     result['deletion_reason'] = f"根据规则'{rule.rule_name}'，该类型分支可删除"
-                
-                # 受保护的分支不可删除
-                if branch.protected:
-                    result['is_deletable'] = False
-                    result['deletion_reason'] = "分支受保护，不可删除"
-                
-                break  # 找到第一个匹配的规则后退出
+            elif result['is_deletable']:
+                result['deletion_reason'] = f"根据规则'{rule.rule_name}'，该类型分支可删除"
+            
+            # 受保护的分支不可删除
+            if branch.protected:
+                result['is_deletable'] = False
+                result['deletion_reason'] = "分支受保护，不可删除"
         
         # 如果没有匹配的规则但分支受保护
         if branch.protected and not result['matched_rule_name']:
@@ -63,20 +63,7 @@ class ExportService:
     
     def _branch_matches_pattern(self, branch_name: str, pattern: str) -> bool:
         """检查分支名称是否匹配规则模式"""
-        # 支持通配符匹配
-        if pattern == '*':
-            return True
-        
-        # 支持多个模式用|分隔
-        patterns = pattern.split('|')
-        for p in patterns:
-            p = p.strip()
-            # 将通配符模式转换为正则表达式
-            regex_pattern = p.replace('*', '.*').replace('?', '.')
-            if re.match(f'^{regex_pattern}$', branch_name, re.IGNORECASE):
-                return True
-        
-        return False
+        return pattern_matches(branch_name, pattern)
     
     def export_branch_deletion_report_to_excel(self, repository_id: int = None) -> io.BytesIO:
         """导出分支删除报告为 Excel 文件"""
@@ -324,12 +324,14 @@ class GitlabQueryService:
             logger.exception(f'Failed to find repository by name {name}')
             return None
     
-    def get_repository_branches_and_rules(self, repository_id: int) -> Dict[str, Any]:
+    def get_repository_branches_and_rules(self, repository_id: int,
+                                          branch_names: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         获取仓库的分支和规则（用于分支分析）
         
         Args:
             repository_id: 仓库ID
+            branch_names: 只获取这些分支，为 None 时获取全部分支
             
         Returns:
             包含分支和规则的字典
@@ -337,9 +339,12 @@ class GitlabQueryService:
         try:
             with get_db_session() as db:
                 # 获取该仓库的所有分支
-                branches = db.query(GitlabRepositoryBranch).filter(
+                query = db.query(GitlabRepositoryBranch).filter(
                     GitlabRepositoryBranch.repository_id == repository_id
-                ).all()
+                )
+                if branch_names is not None:
+                    query = query.filter(GitlabRepositoryBranch.branch_name.in_(branch_names))
+                branches = query.all()
                 
                 # 获取所有启用的规则
                 rules = db.query(GitlabBranchRule).filter(
@@ -3,15 +3,21 @@ import re
 import shutil
 import subprocess
 import tempfile
+import threading
+import time
 import traceback
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
 
 import gitlab
+from requests.adapters import HTTPAdapter
 
 from config.settings import settings
 from database.connection import get_db_session
 from database.models import (
+    GitlabBranchAnalysisState,
     GitlabBranchRule,
     GitlabRepository,
     GitlabRepositoryBranch,
@@ -27,7 +33,10 @@ from dto.gitlab_data_dto import (
 )
 from dto.sync_dto import AllSyncResult, BranchSyncResult, GroupSyncResult, SyncResult
 from dto.tag_create_dto import TagCreateDTO
+from services.branch_rule_matcher import get_compiled_rule_set
 from services.database_service import DatabaseService
+from services.sync_context import SyncCancelledError, SyncContext
+from services.sync_run_service import STAGE_DONE, STAGE_FAILED, SyncCheckpoint, sync_run_service
 from utils.logger import get_logger
 
 logger = get_logger(__name__, 'gitlab')
@@ -241,6 +250,8 @@ class GitlabService:
         self.gitlab_url = gitlab_url or settings.gitlab.url
         self.gitlab_token = gitlab_token or settings.gitlab.token
         self.db_service = DatabaseService()
+        # 同一次 sync_all 中 sync_repositories 已列出的项目对象，供分支/权限同步复用
+        self._listed_projects: Dict[int, Any] = {}
         
         # 延迟导入以避免循环依赖
         from services.gitlab_query_service import GitlabQueryService
@@ -252,7 +263,9 @@ class GitlabService:
         # 配置已在 settings 中验证，初始化 GitLab 客户端
         try:
             logger.info(f"正在连接 GitLab: {self.gitlab_url}")
-            self.gl = gitlab.Gitlab(self.gitlab_url, private_token=self.gitlab_token)
+            # 设置请求超时，取消同步时卡住的请求最多等待 GITLAB_TIMEOUT 秒
+            self.gl = gitlab.Gitlab(self.gitlab_url, private_token=self.gitlab_token,
+                                    timeout=settings.gitlab.timeout)
             self.gl.auth()  # 验证连接
             logger.info("GitLab 连接成功")
         except gitlab.exceptions.GitlabAuthenticationError as e:
@@ -271,18 +284,36 @@ class GitlabService:
             logger.error(f"{error_msg}. GitLab URL: {self.gitlab_url}. 请检查配置和网络连接", exc_info=True)
             raise ValueError(error_msg) from e
     
-    def sync_repositories(self) -> SyncResult:
-        """同步所有仓库信息"""
+    def sync_repositories(self, incremental: bool = False, context: Optional[SyncContext] = None) -> SyncResult:
+        """同步仓库信息
+        
+        Args:
+            incremental: 增量同步，只拉取 last_activity_at 晚于上次水位的项目；
+                         首次运行（没有水位）时自动退化为全量同步
+            context: 进度/取消上下文，按已拉取的项目数上报进度，每页之间检查取消
+        """
         logger.info("开始同步仓库信息...")
+        context = context or SyncContext()
         
         try:
-            print("Starting repository sync...")
+            print(f"Starting repository sync ({'incremental' if incremental else 'full'})...")
+            context.begin_stage('同步仓库')
+            
+            list_kwargs = {'statistics': True}
+            watermark = self.db_service.get_sync_watermark('repositories') if incremental else None
+            if watermark:
+                since = watermark - timedelta(minutes=settings.sync.incremental_overlap_minutes)
+                list_kwargs.update(
+                    last_activity_after=self._format_watermark(since),
+                    order_by='last_activity_at',
+                    sort='asc'
+                )
+                print(f"Fetching projects with activity after {since}")
             
-            # 获取所有项目
-            projects = self.gl.projects.list(
-                statistics=True,
-                all=True
-            )
+            # 获取项目
+            projects = self._list_all(self.gl.projects, context, track_progress=True, **list_kwargs)
+            
+            self._listed_projects.update({project.id: project for project in projects})
             
             logger.info(f"从 GitLab 获取到 {len(projects)} 个项目")
             print(f"Found {len(projects)} projects from GitLab")
@@ -303,10 +334,18 @@ class GitlabService:
             sync_result = self.db_service.sync_repositories(repositories)
             
             if sync_result.success:
+                self.db_service.set_sync_watermark(
+                    'repositories',
+                    self.db_service.get_max_repository_activity(),
+                    'incremental' if watermark else 'full'
+                )
                 print(f"Successfully synced {sync_result.count} repositories")  # 修正：使用 count 属性
                 return SyncResult.create_success(
                     sync_result.count,  # 修正：使用 count 属性
-                    len(repositories)
+                    len(repositories),
+                    inserted=sync_result.inserted,
+                    updated=sync_result.updated,
+                    unchanged=sync_result.unchanged
                 )
             else:
                 return SyncResult.create_failure(sync_result.error)  # 修正：使用 error 属性
@@ -316,18 +355,26 @@ class GitlabService:
             traceback.print_exc()
             return SyncResult.create_failure(str(e))
     
-    def sync_groups(self) -> GroupSyncResult:
-        """同步所有组织及其用户信息"""
+    def sync_groups(self, context: Optional[SyncContext] = None) -> GroupSyncResult:
+        """同步所有组织及其用户信息
+        
+        Args:
+            context: 进度/取消上下文，按已处理的组织数上报进度，组织之间和分页之间检查取消
+        """
+        context = context or SyncContext()
         try:
             print("Starting groups sync...")
+            context.begin_stage('同步组织')
             
             # 获取所有组织
-            groups = self.gl.groups.list(all=True, statistics=True)
+            groups = self._list_all(self.gl.groups, context, statistics=True)
+            context.set_total(len(groups))
             
             synced_groups = 0
             synced_members = 0
             
             for group in groups:
+                context.check_cancelled()
                 try:
                     # 转换组织数据为 DTO
                     group_dto = GitlabGroupData.from_model(group)  # 修正：使用 from_model
@@ -339,7 +386,7 @@ class GitlabService:
                     
                     # 同步组织成员
                     try:
-                        members = group.members.list(all=True)
+                        members = self._list_all(group.members, context)
                         members_data = []
                         for member in members:
                             member_dto = GitlabMemberData.from_model(member)  # 修正：使用 from_model
@@ -355,7 +402,8 @@ class GitlabService:
                 
                 except Exception as e:
                     print(f"Error processing group {group.id}: {e}")
-                    continue
+                
+                context.advance()
             
             print(f"Successfully synced {synced_groups} groups and {synced_members} members")
             return GroupSyncResult.create_success(
@@ -368,72 +416,75 @@ class GitlabService:
             print(f"Error syncing groups: {e}")
             return GroupSyncResult.create_failure(str(e))
     
-    def sync_repository_branches(self, repository_id: int = None) -> BranchSyncResult:
-        """同步仓库分支信息"""
+    def sync_repository_branches(self, repository_id: int = None, concurrent: bool = None,
+                                 max_workers: int = None, deep: bool = False,
+                                 incremental: bool = False,
+                                 context: Optional[SyncContext] = None,
+                                 checkpoint: Optional[SyncCheckpoint] = None) -> BranchSyncResult:
+        """同步仓库分支信息
+        
+        Args:
+            repository_id: 仅同步指定仓库，None 表示同步数据库中的全部仓库
+            concurrent: 是否使用线程池并发同步，None 表示使用 SYNC_CONCURRENT 配置
+            max_workers: 并发线程数，None 表示使用 SYNC_MAX_WORKERS 配置
+            deep: 深度同步，为每个分支单独调用 commits.get() 获取提交详情；
+                  默认直接使用分支列表中内嵌的提交信息，请求数从 O(分支数) 降为 O(分页数)
+            incremental: 增量同步，只处理 last_activity_at 晚于分支水位的仓库
+            context: 进度/取消上下文，按已处理的仓库数上报进度，仓库之间和分页之间检查取消
+            checkpoint: sync_all 的检查点，记录每个仓库分支和规则分析的状态和耗时，跳过已完成的仓库
+        """
+        context = context or SyncContext()
         try:
-            if repository_id:
-                try:
-                    project = self.gl.projects.get(repository_id)
-                    repositories = [project]
-                except gitlab.exceptions.GitlabGetError:
-                    return BranchSyncResult.create_failure(
-                        f'Repository {repository_id} not found'
-                    )
-            else:
-                # 从数据库获取已同步的仓库
-                repo_ids = self.db_service.get_all_repository_ids()
-                if not repo_ids:
-                    return BranchSyncResult.create_failure(
-                        'No repositories found in database. Please sync repositories first.'
-                    )
-                
-                repositories = []
-                for repo_id_obj in repo_ids:
-                    try:
-                        project = self.gl.projects.get(repo_id_obj.id)
-                        repositories.append(project)
-                    except Exception as e:
-                        print(f"Error getting project {repo_id_obj.id}: {e}")
-                        continue
+            # 在处理前记录水位候选值，避免同步期间新产生的活动被跳过
+            watermark_candidate = self._watermark_candidate('branches', repository_id, checkpoint)
+            repositories, error = self._resolve_sync_projects(repository_id, 'branches', incremental)
+            if error:
+                return BranchSyncResult.create_failure(error)
+            if checkpoint:
+                repositories = self._skip_completed(
+                    repositories, checkpoint, lambda repo_id: checkpoint.is_done('analysis', repo_id)
+                )
+            context.begin_stage('同步分支', len(repositories))
             
-            print(f"Starting branches sync for {len(repositories)} repositories...")
+            if concurrent is None:
+                concurrent = settings.sync.concurrent
             
-            total_synced = 0
-            processed_repos = 0
+            print(f"Starting branches sync for {len(repositories)} repositories "
+                  f"({'concurrent' if concurrent else 'serial'}{', deep' if deep else ''} mode)...")
             
-            for project in repositories:
-                try:
-                    print(f"Processing branches for repository {project.id} ({project.name})")
-                    
-                    # 获取分支列表
-                    branches = project.branches.list(all=True)
-                    print(f"Found {len(branches)} branches for repository {project.id}")
-                    
-                    branch_data = []
-                    for branch in branches:
-                        try:
-                            # 获取提交详情
-                            commit = project.commits.get(branch.commit['id'])
-                            branch_dto = GitlabBranchData.from_model(branch, commit)  # 修正：使用 from_model
-                        except Exception as e:
-                            print(f"Error getting commit info for branch {branch.name}: {e}")
-                            # 使用基本信息
-                            branch_dto = GitlabBranchData.from_model(branch)  # 修正：使用 from_model
+            if concurrent and len(repositories) > 1:
+                total_synced, processed_repos = self._sync_branches_concurrently(
+                    repositories, max_workers or settings.sync.max_workers, deep, context, checkpoint
+                )
+            else:
+                total_synced = 0
+                processed_repos = 0
+                
+                for project in repositories:
+                    context.check_cancelled()
+                    try:
+                        print(f"Processing branches for repository {self._project_label(project)}")
+                        started = time.monotonic()
+                        branch_data = self._collect_branch_data(project, deep=deep, context=context)
                         
-                        branch_data.append(branch_dto.to_dict())
-                    
-                    sync_result = self.db_service.sync_repository_branches(project.id, branch_data)
-                    if sync_result.success:
-                        # 同步完成后立即分析分支规则
-                        self._analyze_repository_branches(project.id)
+                        synced = self._store_repository_branches(
+                            project.id, branch_data, checkpoint, time.monotonic() - started
+                        )
+                        if synced is not None:
+                            total_synced += synced
+                            processed_repos += 1
                         
-                        total_synced += sync_result.count
-                        processed_repos += 1
-                        print(f"Synced and analyzed {sync_result.count} branches for repository {project.id}")
+                    except Exception as e:
+                        print(f"Error syncing branches for repository {project.id}: {e}")
+                        if checkpoint:
+                            checkpoint.record(project.id, 'branches', STAGE_FAILED, error=str(e))
                     
-                except Exception as e:
-                    print(f"Error syncing branches for repository {project.id}: {e}")
-                    continue
+                    context.advance()
+            
+            if not repository_id and processed_repos == len(repositories):
+                self.db_service.set_sync_watermark(
+                    'branches', watermark_candidate, 'incremental' if incremental else 'full'
+                )
             
             print(f"Successfully synced {total_synced} branches for {processed_repos} repositories")
             return BranchSyncResult.create_success(
@@ -447,33 +498,208 @@ class GitlabService:
             traceback.print_exc()
             return BranchSyncResult.create_failure(str(e))
     
-    def sync_repository_permissions(self, repository_id: int = None) -> SyncResult:
-        """同步仓库权限信息"""
-        try:
-            if repository_id:
+    def _sync_branches_concurrently(self, repositories: list, max_workers: int, deep: bool = False,
+                                   context: Optional[SyncContext] = None,
+                                   checkpoint: Optional[SyncCheckpoint] = None) -> tuple:
+        """使用线程池并发同步分支
+        
+        仓库级拉取和逐分支的提交查询分别在两个线程池中执行（避免嵌套提交导致线程池死锁），
+        所有 GitLab 请求共享一个全局信号量限制在途请求数；数据库写入和规则分析
+        统一交给单线程 writer 串行执行，保持 DatabaseService.sync_repository_branches 的语义不变。
+        
+        主线程每秒检查一次取消：取消后撤销尚未开始的拉取和写入，只等待正在进行的请求结束。
+        
+        Returns:
+            (同步的分支总数, 成功处理的仓库数)
+        """
+        context = context or SyncContext()
+        max_inflight = settings.sync.max_inflight_requests
+        limiter = threading.BoundedSemaphore(max_inflight)
+        self._ensure_http_pool_size(max_inflight)
+        
+        total_synced = 0
+        processed_repos = 0
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='branch-sync') as repo_pool, \
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='commit-lookup') as commit_pool, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='branch-db-writer') as writer:
+            
+            def fetch_and_enqueue(project):
+                context.check_cancelled()
+                started = time.monotonic()
+                branch_data = self._collect_branch_data(project, limiter, commit_pool, deep, context)
+                return writer.submit(
+                    self._store_repository_branches, project.id, branch_data, checkpoint, time.monotonic() - started
+                )
+            
+            fetch_futures = {repo_pool.submit(fetch_and_enqueue, project): project for project in repositories}
+            
+            write_futures = {}
+            pending = set(fetch_futures)
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        project = fetch_futures[future]
+                        try:
+                            write_futures[future.result()] = project
+                        except Exception as e:
+                            print(f"Error syncing branches for repository {project.id}: {e}")
+                            if checkpoint:
+                                checkpoint.record(project.id, 'branches', STAGE_FAILED, error=str(e))
+                        context.advance()
+                    context.check_cancelled()
+            except SyncCancelledError:
+                for future in list(pending) + list(write_futures):
+                    future.cancel()
+                raise
+            
+            for future, project in write_futures.items():
                 try:
-                    project = self.gl.projects.get(repository_id)
-                    repositories = [project]
-                except gitlab.exceptions.GitlabGetError:
-                    return SyncResult.create_failure(
-                        f'Repository {repository_id} not found'
-                    )
-            else:
-                # 从数据库获取已同步的仓库
-                repo_ids = self.db_service.get_all_repository_ids()
-                if not repo_ids:
-                    return SyncResult.create_failure(
-                        'No repositories found in database. Please sync repositories first.'
-                    )
+                    synced = future.result()
+                except Exception as e:
+                    print(f"Error storing branches for repository {project.id}: {e}")
+                    continue
                 
-                repositories = []
-                for repo_id_obj in repo_ids:
-                    try:
-                        project = self.gl.projects.get(repo_id_obj.id)
-                        repositories.append(project)
-                    except Exception as e:
-                        print(f"Error getting project {repo_id_obj.id}: {e}")
-                        continue
+                if synced is not None:
+                    total_synced += synced
+                    processed_repos += 1
+        
+        return total_synced, processed_repos
+    
+    def _collect_branch_data(self, project, limiter=None, commit_pool: ThreadPoolExecutor = None,
+                             deep: bool = False, context: Optional[SyncContext] = None) -> List[Dict]:
+        """拉取仓库的分支列表并转换为 DTO 字典
+        
+        Args:
+            project: GitLab 项目对象
+            limiter: 限制在途 GitLab 请求数的信号量，None 表示不限制
+            commit_pool: 深度同步时用于并发查询提交详情的线程池，None 表示串行查询
+            deep: 是否为每个分支单独拉取提交详情
+            context: 取消上下文，分页之间和逐分支查询提交之前检查取消
+        """
+        limiter = limiter or nullcontext()
+        context = context or SyncContext()
+        
+        with limiter:
+            branches = self._list_all(project.branches, context)
+        print(f"Found {len(branches)} branches for repository {project.id}")
+        
+        if not deep:
+            # 快速路径：分支列表已内嵌提交信息，无需额外请求
+            return [GitlabBranchData.from_model(branch).to_dict() for branch in branches]
+        
+        if commit_pool is None:
+            return [self._build_branch_dto(project, branch, limiter, context).to_dict() for branch in branches]
+        
+        futures = [commit_pool.submit(self._build_branch_dto, project, branch, limiter, context) for branch in branches]
+        try:
+            return [future.result().to_dict() for future in futures]
+        except SyncCancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+    
+    def _build_branch_dto(self, project, branch, limiter=None,
+                          context: Optional[SyncContext] = None) -> GitlabBranchData:
+        """获取分支的提交详情并构建 DTO，失败时回退到分支自带的基本信息"""
+        if context is not None:
+            context.check_cancelled()
+        try:
+            with limiter or nullcontext():
+                commit = project.commits.get(branch.commit['id'])
+            return GitlabBranchData.from_model(branch, commit)
+        except Exception as e:
+            print(f"Error getting commit info for branch {branch.name}: {e}")
+            # 使用基本信息
+            return GitlabBranchData.from_model(branch)
+    
+    def _store_repository_branches(self, repository_id: int, branch_data: List[Dict],
+                                   checkpoint: Optional[SyncCheckpoint] = None,
+                                   fetch_seconds: float = 0.0) -> Optional[int]:
+        """写入仓库分支并立即分析分支规则，返回同步的分支数，失败时返回 None
+        
+        指定 checkpoint 时记录分支（拉取 fetch_seconds + 写入）和规则分析两个阶段的状态和耗时。
+        """
+        started = time.monotonic()
+        sync_result = self.db_service.sync_repository_branches(repository_id, branch_data)
+        if not sync_result.success:
+            if checkpoint:
+                checkpoint.record(repository_id, 'branches', STAGE_FAILED, error=sync_result.error)
+            return None
+        if checkpoint:
+            checkpoint.record(
+                repository_id, 'branches', STAGE_DONE, fetch_seconds + time.monotonic() - started,
+                branch_count=sync_result.count
+            )
+        
+        # 同步完成后只对新增或有变化的分支重新分析规则（规则变化或上次分析失败时全量分析）
+        started = time.monotonic()
+        changed = sync_result.data['inserted'] + sync_result.data['updated']
+        if checkpoint and checkpoint.needs_full_analysis(repository_id):
+            # 从检查点继续：上次执行写入的分支可能尚未分析，本次不会再被识别为有变化
+            changed = None
+        analyzed = self._analyze_repository_branches(repository_id, changed)
+        if checkpoint:
+            checkpoint.record(
+                repository_id, 'analysis', STAGE_DONE if analyzed else STAGE_FAILED,
+                time.monotonic() - started, error=None if analyzed else 'branch rule analysis failed'
+            )
+        print(f"Synced {sync_result.count} branches for repository {repository_id}, "
+              f"analyzed {'all' if changed is None else len(changed)} changed, deleted {sync_result.deleted}")
+        return sync_result.count
+    
+    def _list_all(self, manager, context: SyncContext, track_progress: bool = False, **kwargs) -> list:
+        """逐页拉取列表，等价于 manager.list(all=True)，但每页之间检查取消
+        
+        Args:
+            manager: python-gitlab 的资源管理器，如 self.gl.projects、project.branches
+            context: 取消上下文
+            track_progress: 是否把响应头中的总数和已拉取数作为当前阶段的进度
+            **kwargs: list() 的查询参数，per_page 默认 100
+        """
+        per_page = kwargs.setdefault('per_page', 100)
+        listing = manager.list(iterator=True, **kwargs)
+        if track_progress:
+            context.set_total(listing.total)
+        
+        items = []
+        for item in listing:
+            items.append(item)
+            if track_progress:
+                context.advance()
+            if len(items) % per_page == 0:
+                context.check_cancelled()
+        return items
+    
+    def _ensure_http_pool_size(self, pool_size: int):
+        """扩大 requests 连接池，避免并发请求超过默认的 10 个连接时被丢弃重建"""
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.gl.session.mount('http://', adapter)
+        self.gl.session.mount('https://', adapter)
+    
+    def sync_repository_permissions(self, repository_id: int = None, incremental: bool = False,
+                                    context: Optional[SyncContext] = None,
+                                    checkpoint: Optional[SyncCheckpoint] = None) -> SyncResult:
+        """同步仓库权限信息
+        
+        Args:
+            repository_id: 仅同步指定仓库，None 表示同步数据库中的全部仓库
+            incremental: 增量同步，只处理 last_activity_at 晚于权限水位的仓库
+            context: 进度/取消上下文，按已处理的仓库数上报进度，仓库之间和分页之间检查取消
+            checkpoint: sync_all 的检查点，记录每个仓库权限同步的状态和耗时，跳过已完成的仓库
+        """
+        context = context or SyncContext()
+        try:
+            watermark_candidate = self._watermark_candidate('permissions', repository_id, checkpoint)
+            repositories, error = self._resolve_sync_projects(repository_id, 'permissions', incremental)
+            if error:
+                return SyncResult.create_failure(error)
+            if checkpoint:
+                repositories = self._skip_completed(
+                    repositories, checkpoint, lambda repo_id: checkpoint.is_done('permissions', repo_id)
+                )
+            context.begin_stage('同步权限', len(repositories))
             
             print(f"Starting permissions sync for {len(repositories)} repositories...")
             
@@ -481,11 +707,13 @@ class GitlabService:
             processed_repos = 0
             
             for project in repositories:
+                context.check_cancelled()
                 try:
-                    print(f"Processing permissions for repository {project.id} ({project.name})")
+                    print(f"Processing permissions for repository {self._project_label(project)}")
+                    started = time.monotonic()
                     
                     # 获取项目成员
-                    members = project.members_all.list(all=True)
+                    members = self._list_all(project.members_all, context)
                     print(f"Found {len(members)} members for repository {project.id}")
                     
                     permission_data = []
@@ -500,11 +728,24 @@ class GitlabService:
                         total_synced += sync_result.count  # 修正：使用 count 属性
                         processed_repos += 1
                         print(f"Synced {sync_result.count} permissions for repository {project.id}")
+                    if checkpoint:
+                        checkpoint.record(
+                            project.id, 'permissions', STAGE_DONE if sync_result.success else STAGE_FAILED,
+                            time.monotonic() - started, error=sync_result.error
+                        )
                     
                 except Exception as e:
                     print(f"Error syncing permissions for repository {project.id}: {e}")
                     traceback.print_exc()
-                    continue
+                    if checkpoint:
+                        checkpoint.record(project.id, 'permissions', STAGE_FAILED, error=str(e))
+                
+                context.advance()
+            
+            if not repository_id and processed_repos == len(repositories):
+                self.db_service.set_sync_watermark(
+                    'permissions', watermark_candidate, 'incremental' if incremental else 'full'
+                )
             
             print(f"Successfully synced {total_synced} permissions for {processed_repos} repositories")
             return SyncResult.create_success(
@@ -517,6 +758,84 @@ class GitlabService:
             traceback.print_exc()
             return SyncResult.create_failure(str(e))
     
+    def _resolve_sync_projects(self, repository_id: Optional[int], resource: str, incremental: bool) -> tuple:
+        """解析本次需要同步的 GitLab 项目
+        
+        Args:
+            repository_id: 指定仓库ID，None 表示使用数据库中的仓库
+            resource: 水位资源名（branches / permissions）
+            incremental: 是否只取 last_activity_at 晚于该资源水位的仓库
+        
+        Returns:
+            (项目列表, 错误信息)，错误信息不为 None 时表示失败
+        """
+        if repository_id:
+            try:
+                return [self.gl.projects.get(repository_id)], None
+            except gitlab.exceptions.GitlabGetError:
+                return None, f'Repository {repository_id} not found'
+        
+        # 从数据库获取已同步的仓库
+        repo_ids = self.db_service.get_all_repository_ids()
+        if not repo_ids:
+            return None, 'No repositories found in database. Please sync repositories first.'
+        
+        if incremental:
+            watermark = self.db_service.get_sync_watermark(resource)
+            if watermark:
+                repo_ids = self.db_service.get_repository_ids_active_since(watermark)
+                print(f"Incremental {resource} sync: {len(repo_ids)} repositories active since {watermark}")
+        
+        repositories = []
+        for repo_id_obj in repo_ids:
+            try:
+                repositories.append(self._get_project_handle(repo_id_obj.id))
+            except Exception as e:
+                print(f"Error getting project {repo_id_obj.id}: {e}")
+                continue
+        
+        return repositories, None
+    
+    def _watermark_candidate(self, resource: str, repository_id: Optional[int],
+                             checkpoint: Optional[SyncCheckpoint]) -> Optional[datetime]:
+        """本次同步完成后写入的水位候选值，从检查点继续时沿用首次执行时的值；同步单个仓库时不更新水位"""
+        if repository_id:
+            return None
+        if checkpoint:
+            return checkpoint.watermark_candidate(resource, self.db_service.get_max_repository_activity)
+        return self.db_service.get_max_repository_activity()
+    
+    def _skip_completed(self, repositories: list, checkpoint: SyncCheckpoint, is_done: Callable[[int], bool]) -> list:
+        """过滤掉检查点中已完成的仓库"""
+        remaining = [project for project in repositories if not is_done(project.id)]
+        if len(remaining) < len(repositories):
+            print(f"Resuming from checkpoint: skipping {len(repositories) - len(remaining)} completed repositories")
+        return remaining
+    
+    def _get_project_handle(self, project_id: int):
+        """获取用于列出子资源（分支、成员）的项目对象
+        
+        优先复用本次 sync_all 中 sync_repositories 已列出的对象；SYNC_LAZY_PROJECTS 开启时
+        构造 lazy 对象（不发请求），子资源列表请求会直接发出，项目不存在时在列子资源时报错。
+        """
+        project = self._listed_projects.get(project_id)
+        if project is not None:
+            return project
+        if settings.sync.lazy_projects:
+            return self.gl.projects.get(project_id, lazy=True)
+        return self.gl.projects.get(project_id)
+    
+    def _project_label(self, project) -> str:
+        """项目的日志展示名，lazy 对象没有 name 属性时只显示 ID"""
+        name = getattr(project, 'name', None)
+        return f"{project.id} ({name})" if name else str(project.id)
+    
+    def _format_watermark(self, watermark: datetime) -> str:
+        """将水位时间格式化为 GitLab API 接受的 ISO 8601 字符串（无时区的值按 UTC 处理）"""
+        if watermark.tzinfo is None:
+            return watermark.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return watermark.isoformat()
+    
     def _get_access_level_name(self, access_level: int) -> str:
         """将访问级别数字转换为名称"""
         level_names = {
@@ -528,78 +847,157 @@ class GitlabService:
         }
         return level_names.get(access_level, 'Unknown')
     
-    def sync_all(self) -> AllSyncResult:
-        """同步所有数据并生成清理汇总"""
-        repositories = self.sync_repositories()
-        groups = self.sync_groups()
-        branches = self.sync_repository_branches()
-        permissions = self.sync_repository_permissions()
-        
-        # 同步完成后生成清理汇总
-        if branches.success:
-            print("Generating branch cleanup summary...")
-            from services.cleanup_history_service import CleanupHistoryService
-            cleanup_service = CleanupHistoryService()
-            summary_result = cleanup_service.generate_daily_cleanup_summary()
-            
-            if summary_result['success']:
-                print("✓ Cleanup summary generated successfully")
-            else:
-                print(f"✗ Failed to generate cleanup summary: {summary_result['error']}")
+    def sync_all(self, incremental: bool = False, context: Optional[SyncContext] = None,
+                 resume: bool = False) -> AllSyncResult:
+        """同步所有数据并生成清理汇总
         
-        return AllSyncResult.create_from_results(
+        每次运行记录在 sync_run / sync_run_repository 表中（各阶段及每个仓库各阶段的状态和耗时）。
+        
+        Args:
+            incremental: 增量同步，仓库按 last_activity_after 拉取，分支和权限只处理有新活动的仓库；
+                         默认 False 为全量对账
+            context: 进度/取消上下文，各阶段按大致耗时占整体进度的不同区间
+            resume: 最近一次同模式的运行未完成时从其检查点继续，跳过已完成的阶段和仓库
+        """
+        context = context or SyncContext()
+        checkpoint = sync_run_service.start_run(incremental, resume)
+        skipped = 'Skipped: completed in a previous attempt'
+        try:
+            with context.span(0, 10):
+                repositories = checkpoint.run_stage(
+                    'repositories', lambda: self.sync_repositories(incremental=incremental, context=context)
+                ) or SyncResult.create_success(0, 0, message=skipped)
+                if self._listed_projects:
+                    checkpoint.record_many(list(self._listed_projects), 'repository', STAGE_DONE)
+            with context.span(10, 20):
+                groups = checkpoint.run_stage(
+                    'groups', lambda: self.sync_groups(context=context)
+                ) or GroupSyncResult(success=True, message=skipped)
+            with context.span(20, 70):
+                branches = checkpoint.run_stage(
+                    'branches',
+                    lambda: self.sync_repository_branches(incremental=incremental, context=context, checkpoint=checkpoint),
+                    repository_stages=('branches', 'analysis')
+                ) or BranchSyncResult(success=True, message=skipped)
+            with context.span(70, 95):
+                permissions = checkpoint.run_stage(
+                    'permissions',
+                    lambda: self.sync_repository_permissions(
+                        incremental=incremental, context=context, checkpoint=checkpoint
+                    ),
+                    repository_stages=('permissions',)
+                ) or SyncResult.create_success(0, 0, message=skipped)
+        
+            # 同步完成后生成清理汇总
+            if branches.success:
+                context.check_cancelled()
+                with context.span(95, 100):
+                    checkpoint.run_stage('summary', lambda: self._generate_cleanup_summary(context))
+        except SyncCancelledError as e:
+            checkpoint.finish('cancelled', str(e))
+            raise
+        except BaseException as e:
+            checkpoint.finish('failed', str(e))
+            raise
+            
+        result = AllSyncResult.create_from_results(
             repositories, groups, branches, permissions
         )
+        failed_stages = checkpoint.failed_stages()
+        if not result.success:
+            checkpoint.finish('failed', result.message)
+        elif failed_stages:
+            checkpoint.finish('partial', f"部分仓库同步失败: {', '.join(failed_stages)}")
+        else:
+            checkpoint.finish('completed')
+        return result
     
-    def _analyze_repository_branches(self, repository_id: int):
-        """分析仓库分支并更新规则匹配结果"""
+    def _generate_cleanup_summary(self, context: SyncContext) -> dict:
+        """生成每日分支清理汇总"""
+        context.begin_stage('生成清理汇总')
+        print("Generating branch cleanup summary...")
+        from services.cleanup_history_service import CleanupHistoryService
+        cleanup_service = CleanupHistoryService()
+        summary_result = cleanup_service.generate_daily_cleanup_summary()
+        
+        if summary_result['success']:
+            print("✓ Cleanup summary generated successfully")
+        else:
+            print(f"✗ Failed to generate cleanup summary: {summary_result['error']}")
+        return summary_result
+    
+    def _analyze_repository_branches(self, repository_id: int, branch_names: Optional[List[str]] = None) -> bool:
+        """分析仓库分支并更新规则匹配结果，指定 branch_names 时只分析这些分支，返回是否成功
+        
+        规则只加载一次（预编译规则集），分支在内存中逐个计算，
+        结果有变化的分支通过一次批量 UPDATE 写回。
+        
+        以下情况忽略 branch_names，重新分析仓库的全部分支（见 gitlab_branch_analysis_state）：
+        - 规则集指纹与上次全量分析时不同（规则新增、修改或删除后，未变化的分支也需要重新匹配）
+        - 上次分析失败，或仓库从未全量分析过
+        - 上次全量分析不是今天（保留期限是否已过按当前时间计算，需要每天刷新）
+        """
         try:
-            # 使用查询服务获取分支和规则
-            data = self.query_service.get_repository_branches_and_rules(repository_id)
-            branches = data['branches']
-            rules = data['rules']
+            from services.export_service import ExportService
+            export_service = ExportService()
             
             with get_db_session() as db:
+                rule_set = get_compiled_rule_set(db)
+                state = db.get(GitlabBranchAnalysisState, repository_id)
+                if branch_names is not None and (
+                    state is None or not state.success
+                    or state.rule_fingerprint != rule_set.fingerprint
+                    or state.analyzed_at is None or state.analyzed_at.date() < datetime.now().date()
+                ):
+                    branch_names = None
+                if branch_names is not None and not branch_names:
+                    return True
+                
+                query = db.query(
+                    GitlabRepositoryBranch.id,
+                    GitlabRepositoryBranch.branch_name,
+                    GitlabRepositoryBranch.protected,
+                    GitlabRepositoryBranch.last_commit_date,
+                    *[getattr(GitlabRepositoryBranch, name) for name in DatabaseService.BRANCH_ANALYSIS_FIELDS]
+                ).filter(GitlabRepositoryBranch.repository_id == repository_id)
+                if branch_names is not None:
+                    query = query.filter(GitlabRepositoryBranch.branch_name.in_(branch_names))
+                branches = query.all()
+                
+                changed_rows = []
                 for branch in branches:
-                    # 使用 export_service 中的规则匹配逻辑
-                    rule_result = self._calculate_branch_rules(branch, rules)
-                    
-                    # 重新获取分支对象（因为 branch 来自不同的 session）
-                    db_branch = db.query(GitlabRepositoryBranch).filter(
-                        GitlabRepositoryBranch.id == branch.id
-                    ).first()
-                    
-                    if db_branch:
-                        # 更新数据库字段
-                        db_branch.branch_type = rule_result['branch_type']
-                        db_branch.is_deletable = rule_result['is_deletable']
-                        db_branch.matched_rule_id = rule_result.get('matched_rule_id')
-                        db_branch.retention_deadline = rule_result['retention_deadline']
-                    branch.deletion_reason = rule_result['deletion_reason']
+                    rule_result = export_service._apply_branch_rules(branch, db, rule_set)
+                    row = {name: rule_result[name] for name in DatabaseService.BRANCH_ANALYSIS_FIELDS}
+                    if any(getattr(branch, name) != value for name, value in row.items()):
+                        row['id'] = branch.id
+                        changed_rows.append(row)
                 
-                db.commit()
-                print(f"Updated rule analysis for {len(branches)} branches in repository {repository_id}")
+                self.db_service.update_branch_analysis(db, changed_rows)
+                if branch_names is None:
+                    self._save_analysis_state(db, repository_id, True, rule_set.fingerprint)
+            
+            print(f"Updated rule analysis for {len(changed_rows)}/{len(branches)} branches in repository {repository_id}")
+            return True
                 
         except Exception as e:
             print(f"Error analyzing branches for repository {repository_id}: {e}")
-
-    def _calculate_branch_rules(self, branch: GitlabRepositoryBranch, rules: list) -> Dict[str, Any]:
-        """计算分支规则（复用 export_service 的逻辑）"""
-        from services.export_service import ExportService
-        export_service = ExportService()
-        
-        # 模拟数据库会话上下文
-        with get_db_session() as db:
-            result = export_service._apply_branch_rules(branch, db)
-            
-            # 添加 matched_rule_id
-            if result.get('matched_rule_name'):
-                for rule in rules:
-                    if rule.rule_name == result['matched_rule_name']:
-                        result['matched_rule_id'] = rule.id
-                        break
-            
-            return result
+            try:
+                with get_db_session() as db:
+                    self._save_analysis_state(db, repository_id, False)
+            except Exception as state_error:
+                logger.warning(f"记录仓库 {repository_id} 分支分析状态失败: {state_error}")
+            return False
+    
+    def _save_analysis_state(self, db, repository_id: int, success: bool, rule_fingerprint: Optional[str] = None):
+        """记录仓库分支规则分析状态，失败时保留上次成功分析的指纹和时间"""
+        state = db.get(GitlabBranchAnalysisState, repository_id)
+        if state is None:
+            state = GitlabBranchAnalysisState(repository_id=repository_id)
+            db.add(state)
+        state.success = success
+        if success:
+            state.rule_fingerprint = rule_fingerprint
+            state.analyzed_at = datetime.now()
 
     def create_tag_and_record(self, tag_dto: TagCreateDTO) -> Dict[str, Any]:
         """在指定仓库的分支上创建tag，并写入GitlabTagRelation表
@@ -1389,10 +1787,12 @@ class GitlabService:
             except Exception:
                 pass
     
-    def generate_branch_summaries(self, force_refresh: bool = False) -> dict:
-        """为所有仓库生成分支汇总统计"""
+    def generate_branch_summaries(self, force_refresh: bool = False,
+                                  context: Optional[SyncContext] = None) -> dict:
+        """为所有仓库生成分支汇总统计（context 用于上报进度，仓库之间检查取消）"""
         from database.models import GitlabBranchSummary
         
+        context = context or SyncContext()
         try:
             # 如果强制刷新，先清空旧数据
             if force_refresh:
@@ -1403,11 +1803,13 @@ class GitlabService:
             # 获取所有仓库
             repo_ids = self.db_service.get_all_repository_ids()
             logger.info(f"开始为 {len(repo_ids)} 个仓库生成分支汇总")
+            context.begin_stage('生成分支汇总', len(repo_ids))
             
             success_count = 0
             error_count = 0
             
             for repo_id_obj in repo_ids:
+                context.check_cancelled()
                 try:
                     result = self.generate_repository_summary(repo_id_obj.id)
                     if result['success']:
@@ -1417,6 +1819,7 @@ class GitlabService:
                 except Exception as e:
                     error_count += 1
                     logger.error(f"生成仓库 {repo_id_obj.id} 的汇总失败: {e}")
+                context.advance()
             
             return {
                 'success': True,
@@ -0,0 +1,163 @@
+"""
+可合并的延迟分位数草图（DDSketch）
+
+按相对误差 alpha 把正数映射到对数区间 ceil(log_gamma(x))，gamma = (1 + alpha) / (1 - alpha)，
+每个区间只记录计数。任意分位数的估计值与真实值的相对误差不超过 alpha，
+两个草图按区间相加即可合并，因此可以按小时预先计算，查询时合并任意时间窗口。
+
+序列化为紧凑的二进制格式（区间下标差值和计数使用 varint 编码），
+1% 精度下常见的 0.1ms ~ 60s 延迟分布通常只有几百字节。
+"""
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+SKETCH_FORMAT_VERSION = 1
+
+# 小于该值的响应时间（秒）计入零值区间
+MIN_INDEXABLE_VALUE = 1e-6
+
+_HEADER = struct.Struct('<BdQQddd')  # 版本、alpha、总数、零值计数、min、max、sum
+
+
+def _write_varint(buffer: bytearray, value: int):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, position: int):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+class DDSketch:
+    """DDSketch 分位数草图，只接受非负值（响应时间）"""
+
+    __slots__ = ('alpha', 'gamma', '_log_gamma', 'bins', 'count', 'zero_count', 'min', 'max', 'sum')
+
+    def __init__(self, alpha: float = 0.01):
+        if not 0 < alpha < 1:
+            raise ValueError(f"alpha must be between 0 and 1, got {alpha}")
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+        self.zero_count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.sum = 0.0
+
+    def add(self, value: float, weight: int = 1):
+        """加入一个值"""
+        if value < 0:
+            raise ValueError(f"DDSketch only accepts non-negative values, got {value}")
+        if value < MIN_INDEXABLE_VALUE:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+        self.sum += value * weight
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add_all(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'DDSketch'):
+        """合并另一个相同精度的草图"""
+        if other.count == 0:
+            return
+        if other.alpha != self.alpha:
+            raise ValueError(f"Cannot merge sketches with different alpha ({self.alpha} != {other.alpha})")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+        self.zero_count += other.zero_count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """估计分位数（0 <= quantile <= 1），草图为空时返回 None"""
+        if self.count == 0:
+            return None
+        if quantile <= 0:
+            return self.min
+        if quantile >= 1:
+            return self.max
+
+        rank = quantile * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                # 区间 (gamma^(i-1), gamma^i] 的代表值，相对误差不超过 alpha
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def avg(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_bytes(self) -> bytes:
+        """序列化为紧凑的二进制格式"""
+        buffer = bytearray(_HEADER.pack(
+            SKETCH_FORMAT_VERSION, self.alpha, self.count, self.zero_count,
+            self.min if self.min is not None else math.nan,
+            self.max if self.max is not None else math.nan,
+            self.sum
+        ))
+        _write_varint(buffer, len(self.bins))
+        previous = 0
+        for index in sorted(self.bins):
+            _write_varint(buffer, _zigzag(index - previous))
+            _write_varint(buffer, self.bins[index])
+            previous = index
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'DDSketch':
+        """从 to_bytes 的结果恢复草图"""
+        version, alpha, count, zero_count, minimum, maximum, total = _HEADER.unpack_from(data, 0)
+        if version != SKETCH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported sketch format version: {version}")
+        sketch = cls(alpha)
+        sketch.count = count
+        sketch.zero_count = zero_count
+        sketch.min = None if math.isnan(minimum) else minimum
+        sketch.max = None if math.isnan(maximum) else maximum
+        sketch.sum = total
+
+        position = _HEADER.size
+        bin_count, position = _read_varint(data, position)
+        index = 0
+        for _ in range(bin_count):
+            delta, position = _read_varint(data, position)
+            index += _unzigzag(delta)
+            sketch.bins[index], position = _read_varint(data, position)
+        return sketch
@@ -0,0 +1,363 @@
+"""
+访问日志归档服务
+
+把 gitlab_api_access_log 按天导出为 Parquet 列式文件（需安装 pyarrow），交给数据团队离线分析，
+并可在归档后删除数据库中的对应日志以释放 PostgreSQL 空间：
+
+    <LOG_ARCHIVE_DIR>/access_date=2024-01-01/part-000000001001-000000009876.parquet
+
+目录按 Hive 分区命名，可直接用 pyarrow.dataset、DuckDB、Spark 等读取；
+文件名记录其中日志的最小和最大 id，再次归档同一天时只导出不在已有文件 id 范围内的行，
+因此重复执行不会产生重复数据，归档后补导入的日志会写入新的文件。
+日志已从数据库删除的文件记录在每天目录下的 _deleted_parts.json 中（下划线开头的文件不会被当作数据读取），
+删除时只核对和删除尚未删除的文件对应的行；这些文件的 id 范围也不再排除，
+数据库复用已删除的 id（未使用 AUTOINCREMENT 的 SQLite 表）时补导入的日志同样会被导出。
+
+导出使用服务端游标按批读取（yield_per），内存占用只与批大小有关，与单日日志量无关。
+归档文件也可以直接回答 /api/logs 的查询（source=archive）。
+"""
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, not_, or_, select, text
+
+from config.settings import settings
+from database.connection import engine, get_db_session
+from database.models import GitlabApiAccessLog
+from dto.log_dto import ApiAccessLogData
+from services.log_partition_service import ACCESS_LOG_TABLE, log_partition_service
+from utils.logger import get_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖，未安装时归档功能不可用
+    pa = None
+    pq = None
+
+logger = get_logger(__name__)
+
+# 每批从数据库读取并写入一个 Parquet row group 的行数
+ARCHIVE_BATCH_SIZE = 50000
+
+DAY_DIR_PATTERN = re.compile(r'^access_date=(\d{4}-\d{2}-\d{2})$')
+DELETED_MANIFEST = '_deleted_parts.json'
+# id 范围与已删除文件相同时（id 被复用）文件名追加序号
+PART_FILE_PATTERN = re.compile(r'^part-(\d+)-(\d+)(?:-\d+)?\.parquet$')
+
+ARCHIVE_COLUMNS = (
+    'id', 'access_time', 'client_ip', 'http_method', 'api_path', 'api_template',
+    'http_status', 'response_size', 'user_agent', 'response_time', 'extra'
+)
+
+
+def _archive_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('access_time', pa.timestamp('us')),
+        ('client_ip', pa.string()),
+        ('http_method', pa.string()),
+        ('api_path', pa.string()),
+        ('api_template', pa.string()),
+        ('http_status', pa.int32()),
+        ('response_size', pa.int64()),
+        ('user_agent', pa.string()),
+        ('response_time', pa.float64()),
+        ('extra', pa.string()),  # JSON 文本
+    ])
+
+
+def _day_range(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+class LogArchiveService:
+    """访问日志 Parquet 归档"""
+
+    def __init__(self, archive_dir: Optional[str] = None):
+        self.archive_dir = archive_dir or settings.log_ingest.archive_dir
+        self._lock = threading.Lock()  # 同一进程内不并发归档，避免同一天写出重复文件
+
+    @property
+    def available(self) -> bool:
+        """是否已安装 pyarrow"""
+        return pa is not None
+
+    def _require_pyarrow(self):
+        if pa is None:
+            raise ValueError("pyarrow is not installed, access log archive is unavailable")
+
+    def _day_dir(self, day: date) -> str:
+        return os.path.join(self.archive_dir, f'access_date={day.isoformat()}')
+
+    def _part_files(self, day: date) -> List[Tuple[int, int, str]]:
+        """某天已归档的文件 [(min_id, max_id, path)]，按 min_id 排序"""
+        day_dir = self._day_dir(day)
+        if not os.path.isdir(day_dir):
+            return []
+        parts = []
+        for name in os.listdir(day_dir):
+            match = PART_FILE_PATTERN.match(name)
+            if match:
+                parts.append((int(match.group(1)), int(match.group(2)), os.path.join(day_dir, name)))
+        return sorted(parts)
+
+    def _deleted_parts(self, day: date) -> set:
+        """某天日志已从数据库删除的文件名"""
+        manifest = os.path.join(self._day_dir(day), DELETED_MANIFEST)
+        if not os.path.exists(manifest):
+            return set()
+        with open(manifest, encoding='utf-8') as manifest_file:
+            return set(json.load(manifest_file))
+
+    def _mark_deleted(self, day: date, names: List[str]):
+        """记录某天日志已从数据库删除的文件（先写临时文件再替换，中途退出不会损坏清单）"""
+        manifest = os.path.join(self._day_dir(day), DELETED_MANIFEST)
+        deleted = sorted(self._deleted_parts(day) | set(names))
+        tmp_path = f'{manifest}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(deleted, manifest_file, indent=2)
+        os.replace(tmp_path, manifest)
+
+    def _pending_parts(self, day: date) -> List[Tuple[int, int, str]]:
+        """某天日志仍在数据库中的归档文件"""
+        deleted = self._deleted_parts(day)
+        return [part for part in self._part_files(day) if os.path.basename(part[2]) not in deleted]
+
+    def _archived_days(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[date]:
+        """已有归档的日期（升序）"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        days = []
+        for name in os.listdir(self.archive_dir):
+            match = DAY_DIR_PATTERN.match(name)
+            if not match:
+                continue
+            day = date.fromisoformat(match.group(1))
+            if (start_date and day < start_date) or (end_date and day > end_date):
+                continue
+            days.append(day)
+        return sorted(days)
+
+    def archive(self, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                delete: bool = False, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, Any]:
+        """归档 [start_date, end_date] 的访问日志（均包含）
+
+        start_date 为空时从数据库中最早的日志开始，end_date 为空时到昨天为止（当天仍在写入）。
+        delete 为 True 时归档完成后删除已归档的日志：分区表上整个分区都已归档时直接删除分区，
+        其余按归档文件逐个删除该天 id 在文件 id 范围内的行。删除前锁表并逐个文件核对行数，
+        与文件行数不一致（归档期间有并发导入提交了更小 id 的行）的文件不删除，其日期记录在 skipped_days 中。
+        导入状态（log_import_status）保留，避免重复导入已归档日期的日志。
+        """
+        self._require_pyarrow()
+        end_date = end_date or date.today() - timedelta(days=1)
+
+        with self._lock:
+            if start_date is None:
+                with get_db_session() as db:
+                    earliest = db.query(func.min(GitlabApiAccessLog.access_time)).scalar()
+                if earliest is None:
+                    return {'archived_days': [], 'archived_rows': 0, 'files': [], 'deleted_rows': 0,
+                            'dropped_partitions': [], 'skipped_days': []}
+                start_date = earliest.date()
+
+            archived_days = []
+            archived_rows = 0
+            files = []
+            day = start_date
+            while day <= end_date:
+                path, rows = self._archive_day(day, batch_size)
+                if path:
+                    archived_days.append(day.isoformat())
+                    archived_rows += rows
+                    files.append(path)
+                day += timedelta(days=1)
+
+            result = {
+                'archived_days': archived_days,
+                'archived_rows': archived_rows,
+                'files': files,
+                'deleted_rows': 0,
+                'dropped_partitions': [],
+                'skipped_days': []
+            }
+            if delete and start_date <= end_date:
+                result.update(self._delete_archived(start_date, end_date))
+
+        logger.info(
+            f"访问日志归档完成: {start_date} ~ {end_date}，归档 {archived_rows} 行到 {len(files)} 个文件，"
+            f"删除分区 {len(result['dropped_partitions'])} 个，删除记录 {result['deleted_rows']} 条"
+        )
+        return result
+
+    def _archive_day(self, day: date, batch_size: int) -> Tuple[Optional[str], int]:
+        """导出某天尚未归档的日志到一个新的 Parquet 文件，返回 (文件路径, 行数)，没有新日志时返回 (None, 0)"""
+        day_start, day_end = _day_range(day)
+        columns = [getattr(GitlabApiAccessLog, name) for name in ARCHIVE_COLUMNS]
+        statement = select(*columns).where(
+            GitlabApiAccessLog.access_time >= day_start,
+            GitlabApiAccessLog.access_time < day_end
+        ).order_by(GitlabApiAccessLog.access_time, GitlabApiAccessLog.id)
+        # 跳过日志仍在数据库中的文件已导出的 id 范围；日志已删除的文件不排除，其范围内的行是之后写入的
+        archived_ranges = [GitlabApiAccessLog.id.between(min_id, max_id)
+                           for min_id, max_id, _ in self._pending_parts(day)]
+        if archived_ranges:
+            statement = statement.where(not_(or_(*archived_ranges)))
+
+        schema = _archive_schema()
+        day_dir = self._day_dir(day)
+        tmp_path = os.path.join(day_dir, f'.part-{os.getpid()}-{threading.get_ident()}.tmp')
+        writer = None
+        rows = 0
+        min_id = max_id = None
+
+        try:
+            with engine.connect() as conn:
+                result = conn.execution_options(yield_per=batch_size).execute(statement)
+                for batch in result.partitions():
+                    values = list(zip(*batch))
+                    arrays = [pa.array(column, type=field.type) for column, field in zip(values[:-1], schema)]
+                    arrays.append(pa.array(
+                        [json.dumps(extra, ensure_ascii=False) if extra is not None else None for extra in values[-1]],
+                        type=pa.string()
+                    ))
+                    if writer is None:
+                        os.makedirs(day_dir, exist_ok=True)
+                        writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+                    batch_min, batch_max = min(values[0]), max(values[0])
+                    min_id = batch_min if min_id is None else min(min_id, batch_min)
+                    max_id = batch_max if max_id is None else max(max_id, batch_max)
+                    rows += len(batch)
+        except Exception:
+            if writer is not None:
+                writer.close()
+                os.remove(tmp_path)
+            raise
+
+        if writer is None:
+            return None, 0
+
+        writer.close()
+        name = f'part-{min_id:012d}-{max_id:012d}'
+        path = os.path.join(day_dir, f'{name}.parquet')
+        sequence = 1
+        while os.path.exists(path):
+            path = os.path.join(day_dir, f'{name}-{sequence}.parquet')
+            sequence += 1
+        os.replace(tmp_path, path)
+        return path, rows
+
+    def _delete_archived(self, start_date: date, end_date: date) -> Dict[str, Any]:
+        """删除 [start_date, end_date] 内已归档、日志仍在数据库中的文件对应的日志"""
+        archived = {}  # day -> [(min_id, max_id, 路径, 行数)]
+        for day in self._archived_days(start_date, end_date):
+            parts = self._pending_parts(day)
+            if parts:
+                archived[day] = [
+                    (min_id, max_id, path, pq.read_metadata(path).num_rows) for min_id, max_id, path in parts
+                ]
+
+        dropped = []
+        skipped = []
+        deleted_parts = {}  # day -> 日志已删除的文件名，事务提交后写入清单
+        deleted_rows = 0
+        partitions = [
+            (partition['name'], date.fromisoformat(partition['start']), date.fromisoformat(partition['end']))
+            for partition in log_partition_service.list_partitions()
+        ]
+        with get_db_session() as db:
+            remaining = dict(archived)
+            range_end = end_date + timedelta(days=1)
+            for name, partition_start, partition_end in partitions:
+                if partition_start < start_date or partition_end > range_end:
+                    continue
+                days = [day for day in archived if partition_start <= day < partition_end]
+                archived_rows = sum(part[3] for day in days for part in archived[day])
+                # 锁定分区后核对行数，确认分区内全部日志都已归档才删除整个分区
+                db.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+                partition_rows = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+                if partition_rows == archived_rows:
+                    db.execute(text(f"ALTER TABLE {ACCESS_LOG_TABLE} DETACH PARTITION {name}"))
+                    db.execute(text(f"DROP TABLE {name}"))
+                    dropped.append(name)
+                    deleted_rows += partition_rows
+                    for day in days:
+                        deleted_parts[day] = [os.path.basename(part[2]) for part in remaining.pop(day)]
+
+            if remaining and engine.dialect.name == 'postgresql':
+                # 等待进行中的导入提交并阻止新的导入直到删除提交，核对的行数与删除的行一致
+                db.execute(text(f"LOCK TABLE {ACCESS_LOG_TABLE} IN SHARE ROW EXCLUSIVE MODE"))
+            for day, parts in sorted(remaining.items()):
+                day_start, day_end = _day_range(day)
+                for min_id, max_id, path, archived_rows in parts:
+                    query = db.query(GitlabApiAccessLog).filter(
+                        GitlabApiAccessLog.access_time >= day_start,
+                        GitlabApiAccessLog.access_time < day_end,
+                        GitlabApiAccessLog.id.between(min_id, max_id)
+                    )
+                    part_rows = query.count()
+                    if part_rows not in (archived_rows, 0):
+                        # 有未归档的行（id 在归档之前分配、在归档之后提交），下次归档也不会导出，需人工处理
+                        logger.warning(
+                            f"{path} 对应的日志（{day}，id {min_id} ~ {max_id}）在数据库中有 {part_rows} 行，"
+                            f"已归档 {archived_rows} 行，跳过删除"
+                        )
+                        if day.isoformat() not in skipped:
+                            skipped.append(day.isoformat())
+                        continue
+                    # 0 行表示已在之前删除（删除后未能写入清单），只补记清单
+                    deleted_rows += query.delete(synchronize_session=False)
+                    deleted_parts.setdefault(day, []).append(os.path.basename(path))
+
+        for day, names in deleted_parts.items():
+            self._mark_deleted(day, names)
+        if dropped:
+            log_partition_service.forget_partitions()
+        return {'deleted_rows': deleted_rows, 'dropped_partitions': dropped, 'skipped_days': skipped}
+
+    def list_archives(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+        """列出已归档的日期及其文件数、行数和大小（只读取 Parquet 元数据）"""
+        self._require_pyarrow()
+        archives = []
+        for day in self._archived_days(start_date, end_date):
+            parts = self._part_files(day)
+            if not parts:
+                continue
+            archives.append({
+                'date': day.isoformat(),
+                'files': len(parts),
+                'rows': sum(pq.read_metadata(path).num_rows for _, _, path in parts),
+                'size_bytes': sum(os.path.getsize(path) for _, _, path in parts)
+            })
+        return archives
+
+    def get_logs(self, limit: int = 100, start_date: Optional[date] = None,
+                 end_date: Optional[date] = None) -> List[ApiAccessLogData]:
+        """从归档文件查询日志，语义与 DatabaseService.get_logs 相同（按访问时间倒序）
+
+        从最近的日期开始逐天读取，取满 limit 条即停止，不读取更早日期的文件。
+        """
+        self._require_pyarrow()
+        logs = []
+        for day in reversed(self._archived_days(start_date, end_date)):
+            if len(logs) >= limit:
+                break
+            paths = [path for _, _, path in self._part_files(day)]
+            if not paths:
+                continue
+            table = pa.concat_tables([pq.read_table(path, schema=_archive_schema()) for path in paths])
+            table = table.sort_by([('access_time', 'descending'), ('id', 'descending')])
+            for row in table.slice(0, limit - len(logs)).to_pylist():
+                logs.append(ApiAccessLogData.from_archive_row(row))
+        return logs
+
+
+# 创建全局归档服务实例
+log_archive_service = LogArchiveService()
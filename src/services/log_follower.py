@@ -0,0 +1,436 @@
+"""
+访问日志跟随导入服务
+
+类似 tail -F：后台线程定期读取日志文件新增的完整行，按批写入数据库，
+每批与字节偏移断点在同一事务中提交，重启后从断点继续，不会重复或遗漏。
+
+轮转处理：
+- 文件被改名轮转（inode 变化）时，先读完旧文件句柄中剩余的行，再切换到新文件从头读取
+- 文件被截断（copytruncate，大小小于当前偏移）时从头读取
+- 启动时断点中的 inode/首行指纹与当前文件不一致，视为新文件从头读取
+
+没有跟随断点时，如果该文件已按文件导入过（log_ingest_checkpoint 中有相同内容标识的断点），
+从该断点继续；否则首次读到文件末尾之前跳过已完整导入日期的行，避免重复导入 /parse 导入过的数据。
+
+多进程部署（如多个 gunicorn worker）：
+- PostgreSQL 下跟随期间持有该日志源的会话级咨询锁，同一日志源只有一个进程在跟随
+- 运行状态保存在 log_follower_state 表中，任意进程都可以查询状态或请求停止
+"""
+import hashlib
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from config.settings import settings
+from database.connection import engine, get_db_session
+from database.models import LogFollowerState
+from services.database_service import DatabaseService, ImportDateClaims
+from services.log_line_parser import AccessLogLineParser
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 计算文件指纹时读取的首行最大字节数
+FINGERPRINT_BYTES = 1024
+
+# 跟随锁的咨询锁键（与日志源路径的哈希组成两段式键）
+FOLLOW_LOCK_KEY = 7301005
+
+# 心跳超过 max(轮询间隔 × 3, 该秒数) 未更新时，视为跟随进程已退出
+FOLLOWER_STALE_SECONDS = 60
+
+
+class LogFollower:
+    """日志跟随导入器，每个进程一个实例（见模块底部的 log_follower）"""
+
+    def __init__(self):
+        self.db_service = DatabaseService()
+        self.line_parser = AccessLogLineParser()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_connection = None
+        self._handle = None
+        self._inode: Optional[int] = None
+        self._fingerprint: Optional[str] = None
+        self._offset = 0
+        self._check_dates = False
+        self._import_claims: Optional[ImportDateClaims] = None
+        self.log_file_path: Optional[str] = None
+        self.source_key: Optional[str] = None
+        self.interval = settings.log_ingest.follow_interval
+        self.started_at: Optional[datetime] = None
+        self.last_poll_time: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.lines_ingested = 0
+        self.batches = 0
+        self.rotations = 0
+
+    @property
+    def running(self) -> bool:
+        """本进程中的跟随线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, log_file_path: Optional[str] = None, interval: Optional[int] = None) -> Dict[str, Any]:
+        """启动跟随导入，本进程或其他进程已在跟随该日志源时返回当前状态"""
+        with self._lock:
+            if self.running:
+                return {'success': False, 'message': 'Log follower is already running', **self.status()}
+
+            log_file_path = log_file_path or settings.app.log_file_path
+            if not log_file_path:
+                return {'success': False, 'message': 'Log file path not provided'}
+            source_key = os.path.abspath(log_file_path)
+
+            state = self._load_state(source_key)
+            if state and state['running']:
+                return {'success': False, 'message': f"Log follower is already running in {state['owner']}", **state}
+            if not self._acquire_follow_lock(source_key):
+                return {'success': False, 'message': 'Log follower is already running in another process',
+                        **(state or self.status(log_file_path))}
+
+            self.log_file_path = log_file_path
+            self.source_key = source_key
+            self.interval = interval or settings.log_ingest.follow_interval
+            self.started_at = datetime.now()
+            self.last_poll_time = None
+            self.last_error = None
+            self.lines_ingested = 0
+            self.batches = 0
+            self.rotations = 0
+            self._save_state(started=True)
+
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='log-follower', daemon=True)
+            self._thread.start()
+            logger.info(f"日志跟随导入已启动: {self.log_file_path}, 轮询间隔 {self.interval}s")
+            return {'success': True, 'message': f'Started following {self.log_file_path}', **self.status()}
+
+    def stop(self, log_file_path: Optional[str] = None, timeout: float = 30) -> Dict[str, Any]:
+        """停止跟随导入，等待当前批次提交完成
+
+        跟随线程不在本进程时，通过 log_follower_state 请求停止，并等待运行进程确认（最多 timeout 秒）。
+        """
+        with self._lock:
+            if self.running and (not log_file_path or os.path.abspath(log_file_path) == self.source_key):
+                self._stop_event.set()
+                self._thread.join(timeout)
+                logger.info("日志跟随导入已停止")
+                return {'success': True, 'message': 'Log follower stopped', **self.status()}
+
+        path = log_file_path or self.log_file_path or settings.app.log_file_path
+        source_key = os.path.abspath(path) if path else None
+        state = self._load_state(source_key) if source_key else None
+        if not state or not state['running']:
+            return {'success': False, 'message': 'Log follower is not running', **(state or self.status(path))}
+
+        with get_db_session() as db:
+            db.query(LogFollowerState).filter(LogFollowerState.source_key == source_key).update(
+                {'stop_requested': True}, synchronize_session=False
+            )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self._load_state(source_key)
+            if not state['running']:
+                logger.info(f"日志跟随导入已停止: {state['owner']}")
+                return {'success': True, 'message': 'Log follower stopped', **state}
+            time.sleep(0.5)
+        return {'success': True, 'message': f"Stop requested, waiting for {state['owner']}", **state}
+
+    def status(self, log_file_path: Optional[str] = None) -> Dict[str, Any]:
+        """跟随导入状态（从 log_follower_state 读取，与跟随线程所在的进程无关）
+
+        log_file_path 为空时使用本进程正在跟随的文件或配置的日志文件。
+        """
+        path = log_file_path or self.log_file_path or settings.app.log_file_path
+        state = self._load_state(os.path.abspath(path)) if path else None
+        if state:
+            return state
+        return {
+            'running': False,
+            'log_file_path': path,
+            'owner': None,
+            'interval': self.interval,
+            'started_at': None,
+            'last_poll_time': None,
+            'stopped_at': None,
+            'stop_requested': False,
+            'lines_ingested': 0,
+            'batches': 0,
+            'rotations': 0,
+            'last_error': None
+        }
+
+    def _load_state(self, source_key: str) -> Optional[Dict[str, Any]]:
+        """读取日志源的跟随状态，心跳过期或已停止时 running 为 False"""
+        with get_db_session() as db:
+            state = db.query(LogFollowerState).filter(LogFollowerState.source_key == source_key).first()
+            if state is None:
+                return None
+            stale_after = timedelta(seconds=max(state.interval * 3, FOLLOWER_STALE_SECONDS))
+            running = (state.stopped_at is None and state.heartbeat_at is not None
+                       and datetime.now() - state.heartbeat_at < stale_after)
+            return {
+                'running': running,
+                'log_file_path': state.log_file_path,
+                'owner': state.owner,
+                'interval': state.interval,
+                'started_at': state.started_at.isoformat() if state.started_at else None,
+                'last_poll_time': state.heartbeat_at.isoformat() if state.heartbeat_at else None,
+                'stopped_at': state.stopped_at.isoformat() if state.stopped_at else None,
+                'stop_requested': state.stop_requested,
+                'lines_ingested': state.lines_ingested,
+                'batches': state.batches,
+                'rotations': state.rotations,
+                'last_error': state.last_error
+            }
+
+    def _save_state(self, started: bool = False, stopped: bool = False):
+        """写入本进程跟随器的状态（同时作为心跳），发现其他进程请求停止时通知跟随线程停止"""
+        with get_db_session() as db:
+            state = db.query(LogFollowerState).filter(LogFollowerState.source_key == self.source_key).first()
+            if state is None:
+                state = LogFollowerState(source_key=self.source_key, log_file_path=self.log_file_path)
+                db.add(state)
+            if started:
+                state.log_file_path = self.log_file_path
+                state.owner = self.owner
+                state.interval = self.interval
+                state.started_at = self.started_at
+                state.stopped_at = None
+                state.stop_requested = False
+            elif state.stop_requested:
+                self._stop_event.set()
+            state.heartbeat_at = datetime.now()
+            state.lines_ingested = self.lines_ingested
+            state.batches = self.batches
+            state.rotations = self.rotations
+            state.last_error = self.last_error
+            if stopped:
+                state.stopped_at = datetime.now()
+
+    def _acquire_follow_lock(self, source_key: str) -> bool:
+        """获取日志源的跟随锁，跟随线程退出时释放
+
+        PostgreSQL 使用会话级咨询锁，在专用的自动提交连接上一直持有，进程退出时自动释放；
+        其他数据库只能依赖 log_follower_state 的心跳判断（单进程部署）。
+        """
+        if engine.dialect.name != 'postgresql':
+            return True
+        connection = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:key, hashtext(:source_key))"),
+            {'key': FOLLOW_LOCK_KEY, 'source_key': source_key}
+        ).scalar()
+        if not acquired:
+            connection.close()
+            return False
+        self._lock_connection = connection
+        return True
+
+    def _release_follow_lock(self):
+        if self._lock_connection is None:
+            return
+        try:
+            self._lock_connection.execute(
+                text("SELECT pg_advisory_unlock(:key, hashtext(:source_key))"),
+                {'key': FOLLOW_LOCK_KEY, 'source_key': self.source_key}
+            )
+        finally:
+            self._lock_connection.close()
+            self._lock_connection = None
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.poll_once()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error(f"日志跟随导入失败: {e}", exc_info=True)
+                    # 出错后重新打开文件并从数据库断点恢复
+                    self._close_handle()
+                try:
+                    self._save_state()
+                except Exception as e:
+                    logger.warning(f"更新日志跟随状态失败: {e}")
+                self._stop_event.wait(self.interval)
+        finally:
+            self._close_handle()
+            try:
+                self._finish_import_run()
+            except Exception as e:
+                logger.warning(f"记录导入结束失败: {e}")
+            try:
+                self._save_state(stopped=True)
+            except Exception as e:
+                logger.warning(f"更新日志跟随状态失败: {e}")
+            self._release_follow_lock()
+
+    def poll_once(self) -> int:
+        """读取并导入一次新增内容，返回导入的行数"""
+        self.last_poll_time = datetime.now()
+        if self._handle is None and not self._open_from_checkpoint():
+            return 0
+
+        ingested = self._drain()
+
+        try:
+            current = os.stat(self.log_file_path)
+        except FileNotFoundError:
+            # 轮转过程中新文件尚未创建，下次轮询再检查
+            return ingested
+
+        if current.st_ino != self._inode:
+            logger.info(f"检测到日志轮转: {self.log_file_path} (inode {self._inode} -> {current.st_ino})")
+            self.rotations += 1
+            self._close_handle()
+            self._open_file(offset=0)
+            ingested += self._drain()
+        elif current.st_size < self._offset:
+            logger.info(f"检测到日志截断: {self.log_file_path} (offset {self._offset} > size {current.st_size})")
+            self.rotations += 1
+            self._handle.seek(0)
+            self._offset = 0
+            self._fingerprint = None
+            ingested += self._drain()
+
+        return ingested
+
+    def _open_from_checkpoint(self) -> bool:
+        """打开日志文件，断点与当前文件一致时从断点继续，否则从头读取"""
+        if not os.path.exists(self.log_file_path):
+            logger.warning(f"日志文件不存在: {self.log_file_path}")
+            return False
+
+        checkpoint = self.db_service.get_log_checkpoint(self.source_key)
+        stat = os.stat(self.log_file_path)
+        fingerprint = self._read_fingerprint(self.log_file_path)
+        offset = None
+        if checkpoint and checkpoint['offset'] <= stat.st_size:
+            if checkpoint['fingerprint'] and fingerprint:
+                same_file = checkpoint['fingerprint'] == fingerprint
+            else:
+                same_file = checkpoint['inode'] == stat.st_ino
+            if same_file:
+                offset = checkpoint['offset']
+
+        self._check_dates = False
+        self._finish_import_run()
+        if offset is None:
+            offset = self._seed_offset(fingerprint, stat.st_size)
+
+        self._open_file(offset)
+        logger.info(f"从偏移 {offset} 开始跟随 {self.log_file_path}")
+        return True
+
+    def _seed_offset(self, fingerprint: Optional[str], file_size: int) -> int:
+        """没有可用的跟随断点时确定起始偏移
+
+        内容标识与文件首行指纹的计算方式相同：该文件按文件导入过时从其断点继续；
+        否则从头读取，读到文件末尾之前跳过已完整导入或正被其他导入写入的日期（如 /parse 导入过的数据），
+        中断导入留下的日期先清除再导入（见 DatabaseService.claim_import_dates）。
+        """
+        content_checkpoint = self.db_service.get_log_checkpoint(f'content:{fingerprint}') if fingerprint else None
+        if content_checkpoint and content_checkpoint['offset'] <= file_size:
+            logger.info(f"{self.log_file_path} 已按文件导入到偏移 {content_checkpoint['offset']}，从该位置继续")
+            return content_checkpoint['offset']
+
+        self._check_dates = True
+        self._import_claims = ImportDateClaims(
+            self.db_service, self.db_service.start_import_run(self.log_file_path),
+            self.db_service.get_imported_dates()
+        )
+        return 0
+
+    def _finish_import_run(self):
+        """结束读到文件末尾之前的日期检查所登记的导入运行记录"""
+        if self._import_claims is not None:
+            self.db_service.finish_import_run(self._import_claims.import_run_id)
+            self._import_claims = None
+
+    def _open_file(self, offset: int):
+        self._handle = open(self.log_file_path, 'rb')
+        self._inode = os.fstat(self._handle.fileno()).st_ino
+        self._fingerprint = self._read_fingerprint(self.log_file_path)
+        self._handle.seek(offset)
+        self._offset = offset
+
+    def _close_handle(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    @staticmethod
+    def _read_fingerprint(file_path: str) -> Optional[str]:
+        """文件首行（最多 FINGERPRINT_BYTES 字节）的哈希，首行尚未写完整时返回 None"""
+        with open(file_path, 'rb') as log_file:
+            first_line = log_file.readline(FINGERPRINT_BYTES)
+        if not first_line.endswith(b'\n') and len(first_line) < FINGERPRINT_BYTES:
+            return None
+        return hashlib.sha256(first_line).hexdigest()
+
+    def _drain(self) -> int:
+        """从当前句柄读取所有完整的新行并分批导入，未写完的行留到下次读取"""
+        ingested = 0
+        batch: List[dict] = []
+        batch_offset = self._offset
+
+        while True:
+            raw_line = self._handle.readline()
+            if not raw_line or not raw_line.endswith(b'\n'):
+                # 到达文件末尾，或最后一行尚未写完：回退到行首等待下次读取
+                self._handle.seek(batch_offset)
+                break
+            batch_offset += len(raw_line)
+
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if line:
+                try:
+                    parsed = self.line_parser.parse(line)
+                except ValueError as e:
+                    logger.warning(f"跳过无法解析的日志行: {line[:100]} ({e})")
+                    parsed = None
+                if parsed:
+                    batch.append(parsed)
+
+            if len(batch) >= settings.log_ingest.chunk_size:
+                ingested += self._commit_batch(batch, batch_offset)
+                batch = []
+                if self._stop_event.is_set():
+                    break
+
+        if batch or batch_offset != self._offset:
+            ingested += self._commit_batch(batch, batch_offset)
+        if not self._stop_event.is_set():
+            # 已追上文件末尾，之后读到的都是新写入的行
+            self._check_dates = False
+            self._finish_import_run()
+        return ingested
+
+    def _commit_batch(self, rows: List[dict], offset: int) -> int:
+        """写入一批日志并推进断点"""
+        if self._fingerprint is None:
+            self._fingerprint = self._read_fingerprint(self.log_file_path)
+        import_run_id = None
+        if self._check_dates:
+            rows, _ = self._import_claims.filter(rows)
+            import_run_id = self._import_claims.import_run_id
+        count = self.db_service.insert_logs_with_checkpoint(
+            rows, self.source_key, self.log_file_path, self._inode, offset, self._fingerprint,
+            import_run_id=import_run_id
+        )
+        self._offset = offset
+        self.lines_ingested += count
+        self.batches += 1
+        return count
+
+
+log_follower = LogFollower()
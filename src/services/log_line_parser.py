@@ -0,0 +1,115 @@
+"""
+访问日志单行解析器
+
+不依赖数据库和配置模块，可单独导入用于基准测试或多进程解析。
+
+请求目标拆分为 api_path（不含查询字符串）、api_template（接口模板，见 api_path_normalizer）
+和 extra（查询字符串，以及非 HTTP/1.1 的协议版本）。
+"""
+import re
+from datetime import datetime
+from typing import Dict, Optional
+
+from services.api_path_normalizer import ApiPathNormalizer, default_normalizer
+
+# GitLab/Nginx 访问日志格式
+# IP - user [timestamp] "METHOD /path?query HTTP/1.1" status size "referer" "user-agent" response_time
+# 请求目标在正则中直接拆分为路径、查询字符串和协议三个分组
+ACCESS_LOG_PATTERN = re.compile(
+    r'(\S+) - (\S+) \[([^\]]+)\] "(\S+) ([^"?\s]*)(?:\?([^"\s]*))?(?: ([^"]*))?" '
+    r'(\d+) (\d+|-) "([^"]*)" "([^"]*)"(?:\s+(\S+))?'
+)
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+
+class AccessLogLineParser:
+    """预编译的访问日志行解析器
+
+    - 正则只编译一次
+    - 时间戳按固定格式 %d/%b/%Y:%H:%M:%S 手工切片解析，并缓存最近出现的秒级时间字符串
+      （同一秒内的日志行很多，命中缓存时无需再次解析）
+    - 各字段只转换一次
+    - 接口模板由 ApiPathNormalizer 按路径缓存
+    """
+
+    def __init__(self, timestamp_cache_size: int = 4096, normalizer: Optional[ApiPathNormalizer] = None):
+        self.timestamp_cache_size = timestamp_cache_size
+        self._timestamp_cache: Dict[str, datetime] = {}
+        self.normalizer = normalizer or default_normalizer
+
+    def parse(self, line: str) -> Optional[dict]:
+        """解析单行日志，格式不匹配时返回 None"""
+        match = ACCESS_LOG_PATTERN.match(line)
+        if match is None:
+            return None
+
+        (client_ip, _, timestamp, method, path, query, protocol, status,
+         size, _, user_agent, response_time) = match.groups()
+        path = path or '/'
+
+        if response_time is not None:
+            try:
+                response_time = float(response_time)
+            except ValueError:
+                response_time = None
+
+        return {
+            'client_ip': client_ip,
+            'access_time': self.parse_timestamp(timestamp),
+            'http_method': method,
+            'api_path': path,
+            'http_status': int(status),
+            'response_size': int(size) if size != '-' else None,
+            'user_agent': user_agent,
+            'response_time': response_time,
+            'api_template': self.normalizer.template(path),
+            'extra': self._build_extra(query, protocol)
+        }
+
+    @staticmethod
+    def _build_extra(query: Optional[str], protocol: Optional[str]) -> Optional[dict]:
+        """查询字符串和非默认协议版本放入 extra，多数行没有附加信息时为 None"""
+        if not query and protocol in (None, 'HTTP/1.1'):
+            return None
+        extra = {}
+        if query:
+            extra['query'] = query
+        if protocol not in (None, 'HTTP/1.1'):
+            extra['protocol'] = protocol
+        return extra
+
+    def parse_timestamp(self, timestamp_str: str) -> datetime:
+        """解析 '01/Jan/2024:00:00:00 +0800' 格式的时间戳（忽略时区部分）"""
+        key = timestamp_str[:20]
+        cached = self._timestamp_cache.get(key)
+        if cached is not None:
+            return cached
+
+        value = self._parse_fixed_timestamp(key)
+        if value is None:
+            value = datetime.strptime(timestamp_str.split()[0], '%d/%b/%Y:%H:%M:%S')
+
+        if len(self._timestamp_cache) >= self.timestamp_cache_size:
+            self._timestamp_cache.clear()
+        self._timestamp_cache[key] = value
+        return value
+
+    @staticmethod
+    def _parse_fixed_timestamp(value: str) -> Optional[datetime]:
+        """按固定位置切片解析时间戳，格式不符时返回 None 交给 strptime 处理"""
+        if len(value) != 20 or value[2] != '/' or value[6] != '/' or value[11] != ':':
+            return None
+        month = MONTHS.get(value[3:6])
+        if month is None:
+            return None
+        try:
+            return datetime(
+                int(value[7:11]), month, int(value[0:2]),
+                int(value[12:14]), int(value[15:17]), int(value[18:20])
+            )
+        except ValueError:
+            return None
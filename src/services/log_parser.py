@@ -1,25 +1,150 @@
-import re
 from datetime import datetime
-from typing import List, Optional
-from services.database_service import DatabaseService
+import glob
+import gzip
+import hashlib
+import io
+import mmap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Callable, Tuple, BinaryIO
+from database.connection import engine
+from services.database_service import DatabaseService, ImportDateClaims
+from services.log_line_parser import AccessLogLineParser
 from dto.import_dto import ImportResult
 from dto.log_dto import ApiAccessLogData
 from dto.base_dto import BaseResult
 from config.settings import settings
 import os
 
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，未安装时只支持纯文本和 gzip 日志
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# 计算文件内容标识时读取的首行最大字节数
+IDENTITY_BYTES = 1024
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """按文件头识别压缩格式，返回 'gzip'、'zstd' 或 None（纯文本）"""
+    with open(file_path, 'rb') as log_file:
+        magic = log_file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def open_log_stream(file_path: str, offset: int = 0) -> BinaryIO:
+    """以二进制流方式打开日志文件，压缩文件边读边解压（不生成临时文件）
+    
+    offset 为解压后内容的字节偏移，压缩文件通过解压并丢弃前面的内容实现跳转。
+    """
+    compression = detect_compression(file_path)
+    if compression == 'gzip':
+        stream = gzip.open(file_path, 'rb')
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ValueError(f"zstandard is not installed, cannot read {file_path}")
+        raw = open(file_path, 'rb')
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    else:
+        stream = open(file_path, 'rb')
+    
+    if offset:
+        if compression == 'zstd':
+            remaining = offset
+            while remaining > 0:
+                skipped = len(stream.read(min(remaining, 1024 * 1024)))
+                if not skipped:
+                    break
+                remaining -= skipped
+        else:
+            stream.seek(offset)
+    return stream
+
+
+def expand_log_paths(path_pattern: str) -> List[str]:
+    """展开日志文件路径，支持 glob 模式（如 /var/log/gitlab/nginx/access.log*），按修改时间从旧到新排序"""
+    if not glob.has_magic(path_pattern):
+        return [path_pattern] if os.path.isfile(path_pattern) else []
+    paths = [path for path in glob.glob(path_pattern) if os.path.isfile(path)]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def log_content_identity(file_path: str) -> Optional[str]:
+    """日志内容标识：解压后首行的哈希
+    
+    轮转只改名或压缩、不改内容，因此 access.log.1 和之后的 access.log.2.gz 标识相同，
+    可据此识别重复文件并共用导入断点。首行尚未写完整时返回 None。
+    """
+    with open_log_stream(file_path) as stream:
+        first_line = stream.readline(IDENTITY_BYTES)
+    if not first_line.endswith(b'\n') and len(first_line) < IDENTITY_BYTES:
+        return None
+    return hashlib.sha256(first_line).hexdigest()
+
+
+def split_byte_ranges(file_path: str, parts: int) -> List[Tuple[int, int]]:
+    """将文件切分为按换行对齐的字节范围 [start, end)，每个范围只包含完整的行"""
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return []
+    
+    boundaries = [0]
+    with open(file_path, 'rb') as log_file, \
+            mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for index in range(1, parts):
+            position = max(file_size * index // parts, boundaries[-1])
+            newline = mapped.find(b'\n', position)
+            boundary = file_size if newline == -1 else newline + 1
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if boundaries[-1] != file_size:
+        boundaries.append(file_size)
+    
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _init_parse_worker():
+    """子进程初始化：丢弃从父进程继承的数据库连接池，避免多个进程共用同一连接"""
+    engine.dispose(close=False)
+
+
+def _import_byte_range(log_file_path: str, start: int, end: int, imported_before: set,
+                       import_run_id: str, chunk_size: int) -> ImportResult:
+    """子进程任务：解析并导入一个字节范围，返回包含各日期行数的导入结果（导入状态保持未完成）"""
+    parser = LogParser(log_file_path)
+    chunks = LogParser.iter_chunks(parser.iter_range_entries(start, end), chunk_size)
+    return parser.db_service.insert_log_stream(
+        chunks, log_file_path, imported_before=imported_before, mark_complete=False,
+        import_run_id=import_run_id
+    )
+
+
+def _import_log_file(log_file_path: str, identity: str, imported_before: set,
+                     import_run_id: str, chunk_size: int) -> ImportResult:
+    """子进程任务：从断点继续导入一个（可能压缩的）日志文件，返回导入结果"""
+    return LogParser(log_file_path).import_file(identity, imported_before, chunk_size, import_run_id)
+
+
 class LogParser:
     def __init__(self, log_file_path: str = None, db_connection=None):
         # 优先使用传入参数，否则使用配置
         self.log_file_path = log_file_path or settings.app.log_file_path or "logs/gitlab_access.log"
         self.db_connection = db_connection
         self.db_service = DatabaseService()
+        self._bytes_read = 0
+        self.line_parser = AccessLogLineParser()
     
     def start_parsing(self) -> BaseResult:
         """启动日志解析服务"""
         print(f"Starting log parser for file: {self.log_file_path}")
         
-        if not os.path.exists(self.log_file_path):
+        if not expand_log_paths(self.log_file_path):
             return BaseResult.create_failure(f"Log file not found: {self.log_file_path}")
         
         try:
@@ -31,33 +156,48 @@ class LogParser:
         except Exception as e:
             return BaseResult.create_failure(f"Error during parsing: {str(e)}")
     
-    def parse_log(self) -> ImportResult:
-        """解析日志文件并返回解析结果"""
+    def parse_log(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  workers: Optional[int] = None) -> ImportResult:
+        """流式解析日志文件并分批导入数据库
+        
+        逐行读取、解析，每 LOG_INGEST_CHUNK_SIZE 行写入一次数据库，
+        内存占用只与批大小有关，与日志文件大小无关。
+        
+        log_file_path 可以是 glob 模式（如 access.log*）或 gzip/zstd 压缩文件，
+        此时按文件导入（见 _parse_log_files）：边读边解压，多个文件并行处理，
+        按内容标识和字节偏移去重。
+        
+        Args:
+            progress_callback: 每批导入后调用，参数为进度字典
+                （在 DatabaseService.insert_log_stream 的基础上增加 bytes_read/total_bytes/percent）
+            workers: 并行解析的进程数，为 None 时使用 LOG_INGEST_WORKERS 配置，1 表示单进程
+        """
         try:
-            if not os.path.exists(self.log_file_path):
+            log_paths = expand_log_paths(self.log_file_path)
+            if not log_paths:
                 return ImportResult.create_file_not_found(self.log_file_path)
             
-            parsed_data = []
+            workers = workers or settings.log_ingest.workers
+            if len(log_paths) > 1 or detect_compression(log_paths[0]):
+                return self._parse_log_files(log_paths, workers, progress_callback)
+            if workers > 1:
+                return self._parse_log_parallel(workers, progress_callback)
             
-            with open(self.log_file_path, 'r', encoding='utf-8') as log_file:
-                for line_number, line in enumerate(log_file, 1):
-                    try:
-                        parsed_line = self._parse_line(line.strip())
-                        if parsed_line:
-                            parsed_data.append(parsed_line)
-                    except Exception as e:
-                        print(f"Error parsing line {line_number}: {e}")
-                        continue
+            total_bytes = os.path.getsize(self.log_file_path)
+            self._bytes_read = 0
             
-            print(f"Successfully parsed {len(parsed_data)} log entries from file")
+            def report_progress(progress: Dict[str, Any]):
+                progress['bytes_read'] = self._bytes_read
+                progress['total_bytes'] = total_bytes
+                progress['percent'] = round(self._bytes_read * 100 / total_bytes, 1) if total_bytes else 100.0
+                print(f"Log import progress: {progress['percent']}% ({progress['processed']} lines)")
+                if progress_callback:
+                    progress_callback(progress)
             
-            # 保存到数据库
-            if parsed_data:
-                result = self.db_service.insert_logs(parsed_data, self.log_file_path)
-                print(f"Database insert result: success={result.success}, message={result.message}")
-                return result
-            else:
-                return ImportResult.create_no_data()
+            chunks = self.iter_chunks(self.iter_entries(), settings.log_ingest.chunk_size)
+            result = self.db_service.insert_log_stream(chunks, self.log_file_path, report_progress)
+            print(f"Database insert result: success={result.success}, message={result.message}")
+            return result
                 
         except FileNotFoundError:
             print(f"Log file not found: {self.log_file_path}")
@@ -66,9 +206,239 @@ class LogParser:
             print(f"Error parsing log file: {e}")
             return ImportResult.create_failure(str(e))
     
-    def parse(self) -> ImportResult:
+    def _parse_log_parallel(self, workers: int,
+                            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> ImportResult:
+        """多进程并行导入：按换行对齐的字节范围分片，每个分片在独立进程中解析并写入数据库
+        
+        各分片逐批写入日志行并累加导入状态（未完成），所有分片成功后由当前进程统一标记为完成；
+        任一分片失败时已提交的日期保持未完成，再次导入时清除后重新导入（见 DatabaseService.insert_log_stream）。
+        各分片共用当前进程登记的导入运行记录，心跳由当前进程维持。
+        """
+        # 分片数多于进程数，避免个别分片较大时其他进程空闲
+        ranges = split_byte_ranges(self.log_file_path, workers * 4)
+        imported_before = self.db_service.get_imported_dates()
+        chunk_size = settings.log_ingest.chunk_size
+        print(f"Parsing {self.log_file_path} with {workers} processes in {len(ranges)} ranges")
+        
+        with self.db_service.import_run(self.log_file_path) as import_run_id:
+            tasks = [
+                (_import_byte_range, (self.log_file_path, start, end, imported_before,
+                                      import_run_id, chunk_size), end - start)
+                for start, end in ranges
+            ]
+            return self._run_import_tasks(tasks, workers, 'ranges', import_run_id, progress_callback)
+    
+    def _parse_log_files(self, log_paths: List[str], workers: int,
+                         progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> ImportResult:
+        """按文件导入多个（可能压缩的）日志文件，每个文件一个任务，workers > 1 时多进程并行
+        
+        去重方式：
+        - 内容标识（解压后首行哈希）相同的文件只导入一个，如同时存在的 access.log.1 和 access.log.1.gz
+        - 每个内容标识在 log_ingest_checkpoint 中记录已导入的解压后字节偏移，与日志行在同一事务中提交，
+          再次导入（或文件轮转压缩后）从该偏移继续，中断后重跑也不会重复导入
+        """
+        files = {}
+        for log_path in log_paths:
+            identity = log_content_identity(log_path)
+            if identity is None:
+                print(f"Skipping {log_path}: no complete line yet")
+                continue
+            if identity in files:
+                print(f"Skipping {log_path}: same content as {files[identity]}")
+                continue
+            files[identity] = log_path
+        
+        imported_before = self.db_service.get_imported_dates()
+        chunk_size = settings.log_ingest.chunk_size
+        print(f"Parsing {len(files)} log files with {workers} processes")
+        
+        with self.db_service.import_run(self.log_file_path) as import_run_id:
+            tasks = [
+                (_import_log_file, (log_path, identity, imported_before, import_run_id, chunk_size),
+                 os.path.getsize(log_path))
+                for identity, log_path in files.items()
+            ]
+            return self._run_import_tasks(tasks, workers, 'files', import_run_id, progress_callback)
+    
+    def _run_import_tasks(self, tasks: List[Tuple[Callable[..., ImportResult], tuple, int]], workers: int,
+                          unit: str, import_run_id: str,
+                          progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> ImportResult:
+        """执行导入任务（函数, 参数, 字节数），全部成功后把导入的日期标记为完成
+        
+        workers > 1 时每个任务在独立进程中执行，否则在当前进程中依次执行。
+        任务逐批写入导入状态，任一任务失败时取消尚未开始的任务并抛出异常，已提交的日期保持未完成。
+        """
+        total_bytes = sum(size for _, _, size in tasks)
+        processed_count = 0
+        inserted_count = 0
+        bytes_done = 0
+        date_counts = {}
+        skipped_dates = set()
+        
+        def completed_tasks() -> Iterator[Tuple[ImportResult, int]]:
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as executor:
+                    futures = {executor.submit(func, *args): size for func, args, size in tasks}
+                    try:
+                        for future in as_completed(futures):
+                            yield future.result(), futures[future]
+                    except BaseException:
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+            else:
+                for func, args, size in tasks:
+                    yield func(*args), size
+        
+        for completed, (result, size) in enumerate(completed_tasks(), 1):
+            processed_count += result.total_found
+            inserted_count += result.count
+            skipped_dates.update(result.already_imported_dates)
+            for entry_date, count in result.date_counts.items():
+                date_counts[entry_date] = date_counts.get(entry_date, 0) + count
+            bytes_done += size
+            
+            progress = {
+                'chunk': completed,
+                'processed': processed_count,
+                'inserted': inserted_count,
+                'skipped': processed_count - inserted_count,
+                'bytes_read': bytes_done,
+                'total_bytes': total_bytes,
+                'percent': round(bytes_done * 100 / total_bytes, 1) if total_bytes else 100.0
+            }
+            print(f"Log import progress: {progress['percent']}% ({completed}/{len(tasks)} {unit}, {processed_count} lines)")
+            if progress_callback:
+                progress_callback(progress)
+        
+        self.db_service.mark_import_complete(date_counts, import_run_id)
+        result = self.db_service.build_import_result(processed_count, inserted_count, date_counts, skipped_dates)
+        print(f"Database insert result: success={result.success}, message={result.message}")
+        return result
+    
+    def import_file(self, identity: str, imported_before: set, chunk_size: int,
+                    import_run_id: Optional[str] = None) -> ImportResult:
+        """从断点继续导入当前日志文件（支持压缩文件），每批日志与断点在同一事务中提交
+        
+        首次导入的内容按已导入日期快照跳过重复日期，并逐个认领写入的日期：正被其他导入写入的日期跳过，
+        属于中断导入的日期先清除再导入（见 DatabaseService.claim_import_dates）；已有断点的内容从断点继续，
+        不再按日期跳过（断点之后的行一定没有导入过）。导入状态与日志、断点在同一事务中逐批写入。
+        """
+        source_key = f'content:{identity}'
+        checkpoint = self.db_service.get_log_checkpoint(source_key)
+        offset = checkpoint['offset'] if checkpoint else 0
+        check_dates = checkpoint is None
+        # 压缩文件内容已完整，最后一行没有换行符也可导入；纯文本文件的最后一行可能尚未写完
+        complete_file = detect_compression(self.log_file_path) is not None
+        inode = os.stat(self.log_file_path).st_ino
+        
+        if check_dates and import_run_id is None:
+            with self.db_service.import_run(self.log_file_path) as import_run_id:
+                return self.import_file(identity, imported_before, chunk_size, import_run_id)
+        claims = ImportDateClaims(self.db_service, import_run_id, imported_before) if check_dates else None
+        
+        processed_count = 0
+        inserted_count = 0
+        date_counts = {}
+        skipped_dates = set()
+        
+        with open_log_stream(self.log_file_path, offset) as stream:
+            for entries, end_offset in self.iter_stream_chunks(stream, offset, chunk_size, complete_file):
+                processed_count += len(entries)
+                rows = entries
+                if claims:
+                    rows, chunk_skipped = claims.filter(entries)
+                    skipped_dates |= chunk_skipped
+                for entry in rows:
+                    entry_date = self.db_service._get_entry_date(entry)
+                    if entry_date:
+                        date_counts[entry_date] = date_counts.get(entry_date, 0) + 1
+                
+                inserted_count += self.db_service.insert_logs_with_checkpoint(
+                    rows, source_key, self.log_file_path, inode, end_offset, identity,
+                    import_run_id=import_run_id
+                )
+        
+        print(f"Imported {self.log_file_path} from offset {offset}: "
+              f"{inserted_count}/{processed_count} lines")
+        return self.db_service.build_import_result(processed_count, inserted_count, date_counts, skipped_dates)
+    
+    def iter_stream_chunks(self, stream: BinaryIO, offset: int, chunk_size: int,
+                           complete_file: bool = True) -> Iterator[Tuple[List[dict], int]]:
+        """逐行解析二进制流并分批，生成 (日志行列表, 该批最后一行结束处的字节偏移)
+        
+        complete_file 为 False 时，末尾没有换行符的行视为尚未写完，不解析也不计入偏移。
+        """
+        chunk = []
+        position = offset
+        chunk_end = offset
+        for raw_line in stream:
+            if not complete_file and not raw_line.endswith(b'\n'):
+                break
+            position += len(raw_line)
+            try:
+                parsed_line = self._parse_line(raw_line.decode('utf-8', errors='replace').strip())
+                if parsed_line:
+                    chunk.append(parsed_line)
+            except Exception as e:
+                print(f"Error parsing line at byte {position}: {e}")
+            
+            if len(chunk) >= chunk_size:
+                yield chunk, position
+                chunk = []
+                chunk_end = position
+        
+        if chunk or position != chunk_end:
+            yield chunk, position
+    
+    def iter_range_entries(self, start: int, end: int) -> Iterator[dict]:
+        """解析文件中 [start, end) 字节范围内的日志行（范围需按换行对齐）"""
+        if start >= end:
+            return
+        with open(self.log_file_path, 'rb') as log_file, \
+                mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = start
+            while position < end:
+                newline = mapped.find(b'\n', position, end)
+                if newline == -1:
+                    newline = end
+                raw_line = mapped[position:newline]
+                position = newline + 1
+                try:
+                    parsed_line = self._parse_line(raw_line.decode('utf-8', errors='replace').strip())
+                    if parsed_line:
+                        yield parsed_line
+                except Exception as e:
+                    print(f"Error parsing line at byte {position}: {e}")
+                    continue
+    
+    def iter_entries(self) -> Iterator[dict]:
+        """逐行读取并解析日志文件，生成解析后的日志行字典"""
+        with open(self.log_file_path, 'rb') as log_file:
+            for line_number, raw_line in enumerate(log_file, 1):
+                self._bytes_read += len(raw_line)
+                try:
+                    parsed_line = self._parse_line(raw_line.decode('utf-8', errors='replace').strip())
+                    if parsed_line:
+                        yield parsed_line
+                except Exception as e:
+                    print(f"Error parsing line {line_number}: {e}")
+                    continue
+    
+    @staticmethod
+    def iter_chunks(entries: Iterable[dict], chunk_size: int) -> Iterator[List[dict]]:
+        """将日志行迭代器按固定大小分批"""
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def parse(self, workers: Optional[int] = None) -> ImportResult:
         """用于API调用的解析方法"""
-        return self.parse_log()
+        return self.parse_log(workers=workers)
     
     def parse_to_dto(self) -> List[ApiAccessLogData]:
         """解析日志文件并返回 DTO 对象列表"""
@@ -93,7 +463,9 @@ class LogParser:
                                 http_status=parsed_line['http_status'],
                                 response_size=parsed_line.get('response_size'),
                                 user_agent=parsed_line.get('user_agent'),
-                                response_time=parsed_line.get('response_time')
+                                response_time=parsed_line.get('response_time'),
+                                api_template=parsed_line.get('api_template'),
+                                extra=parsed_line.get('extra')
                             )
                             dto_list.append(dto)
                     except Exception as e:
@@ -112,26 +484,11 @@ class LogParser:
             return None
             
         try:
-            # GitLab访问日志的典型格式
-            # IP - user [timestamp] "METHOD /path HTTP/1.1" status size "referer" "user-agent" response_time
-            pattern = r'(\S+) - (\S+) \[([^\]]+)\] "(\S+) ([^"]*)" (\d+) (\d+|-) "([^"]*)" "([^"]*)"(?:\s+(\S+))?'
-            match = re.match(pattern, line)
-            
-            if match:
-                return {
-                    'client_ip': match.group(1),
-                    'access_time': self._parse_timestamp(match.group(3)),
-                    'http_method': match.group(4),
-                    'api_path': match.group(5),
-                    'http_status': int(match.group(6)),
-                    'response_size': int(match.group(7)) if match.group(7) != '-' else None,
-                    'user_agent': match.group(9),
-                    'response_time': float(match.group(10)) if match.group(10) and match.group(10) != '-' and self._is_float(match.group(10)) else None
-                }
-            else:
+            parsed_line = self.line_parser.parse(line)
+            if parsed_line is None:
                 # 如果正则不匹配，打印日志信息但不尝试简单解析
                 print(f"Unable to parse log line format: {line[:100]}...")
-                return None
+            return parsed_line
                 
         except (IndexError, ValueError) as e:
             print(f"Error parsing line: {line}, Error: {e}")
@@ -154,9 +511,7 @@ class LogParser:
     def _parse_timestamp(self, timestamp_str: str) -> datetime:
         """解析标准时间戳格式"""
         try:
-            # 处理时区信息
-            timestamp_part = timestamp_str.split()[0]
-            return datetime.strptime(timestamp_part, '%d/%b/%Y:%H:%M:%S')
+            return self.line_parser.parse_timestamp(timestamp_str)
         except Exception as e:
             print(f"Error parsing timestamp '{timestamp_str}': {e}")
             return datetime.now()
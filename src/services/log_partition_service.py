@@ -0,0 +1,211 @@
+"""
+访问日志分区服务
+
+PostgreSQL 下 gitlab_api_access_log 可转换为按 access_time 范围分区的分区表
+（见 scripts/partition_access_log.py），本模块负责：
+- 导入前按需创建日/月分区（LOG_PARTITION_INTERVAL）
+- 按保留天数（LOG_RETENTION_DAYS）删除整个过期分区，代替逐行 DELETE
+
+其他数据库或尚未转换的表上，创建分区为空操作，过期清理退化为 DELETE。
+"""
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from config.settings import settings
+from database.connection import engine, get_db_session
+from database.models import GitlabApiAccessLog, LogImportStatus
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ACCESS_LOG_TABLE = 'gitlab_api_access_log'
+
+# 创建分区时使用的事务级咨询锁，并行导入的多个进程可能同时创建同一分区
+PARTITION_LOCK_KEY = 7301001
+
+PARTITION_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# 插入的行没有对应分区时 PostgreSQL 返回的错误信息
+MISSING_PARTITION_MESSAGE = 'no partition of relation'
+
+T = TypeVar('T')
+
+
+def partition_bounds(day: date, interval: str) -> Tuple[date, date]:
+    """日期所在分区的范围 [start, end)"""
+    if interval == 'month':
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start, end
+    return day, day + timedelta(days=1)
+
+
+def partition_name(start: date, interval: str) -> str:
+    """分区表名，如 gitlab_api_access_log_p20240101（按天）或 gitlab_api_access_log_p202401（按月）"""
+    suffix = start.strftime('%Y%m') if interval == 'month' else start.strftime('%Y%m%d')
+    return f'{ACCESS_LOG_TABLE}_p{suffix}'
+
+
+class LogPartitionService:
+    """访问日志分区管理"""
+
+    def __init__(self, interval: Optional[str] = None):
+        self.interval = interval or settings.log_ingest.partition_interval
+        self._partitioned: Optional[bool] = None
+        self._known_starts = set()  # 已确认存在的分区起始日期，避免每批都查询系统表
+        self._lock = threading.Lock()
+
+    def is_partitioned(self) -> bool:
+        """访问日志表是否为 PostgreSQL 分区表（结果缓存，转换表结构后需重启服务）"""
+        if self._partitioned is None:
+            if engine.dialect.name != 'postgresql':
+                self._partitioned = False
+            else:
+                with get_db_session() as db:
+                    self._partitioned = db.execute(text(
+                        "SELECT 1 FROM pg_partitioned_table pt "
+                        "JOIN pg_class c ON c.oid = pt.partrelid "
+                        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+                    ), {'table': ACCESS_LOG_TABLE}).first() is not None
+        return self._partitioned
+
+    def ensure_partitions(self, dates: Iterable[date]) -> List[str]:
+        """创建 dates 所需的分区（已存在的跳过），返回新建的分区名
+
+        在独立的短事务中执行并提交，之后插入日志的事务不持有 DDL 锁。
+        """
+        if not self.is_partitioned():
+            return []
+
+        with self._lock:
+            starts = {partition_bounds(day, self.interval)[0] for day in dates if day} - self._known_starts
+            if not starts:
+                return []
+
+            created = []
+            with get_db_session() as db:
+                db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PARTITION_LOCK_KEY})
+                existing = {partition['name'] for partition in self._list_partitions(db)}
+                for start in sorted(starts):
+                    start, end = partition_bounds(start, self.interval)
+                    name = partition_name(start, self.interval)
+                    if name not in existing:
+                        db.execute(text(
+                            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ACCESS_LOG_TABLE} "
+                            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                        ))
+                        created.append(name)
+
+            self._known_starts.update(starts)
+            if created:
+                logger.info(f"创建访问日志分区: {', '.join(created)}")
+            return created
+
+    def write_with_partitions(self, dates: Iterable[date], write: Callable[[], T]) -> T:
+        """创建 dates 所需的分区后执行写入，返回 write 的结果
+
+        分区缓存只在本进程内有效，其他进程（如过期清理）删除分区后缓存会过期，
+        此时插入因找不到分区而失败：清空缓存、重新创建分区后重试一次。
+        write 应在自己的事务中完成写入，失败时该事务已回滚，可以安全重试。
+        """
+        dates = [day for day in dates if day]
+        self.ensure_partitions(dates)
+        try:
+            return write()
+        except DBAPIError as e:
+            if not self.is_partitioned() or MISSING_PARTITION_MESSAGE not in str(e.orig):
+                raise
+            logger.warning(f"访问日志分区已被删除，重新创建后重试: {e.orig}")
+            self.forget_partitions()
+            self.ensure_partitions(dates)
+            return write()
+
+    def forget_partitions(self):
+        """清空已确认存在的分区缓存（删除分区后调用，之后导入到这些日期时重新创建分区）"""
+        with self._lock:
+            self._known_starts.clear()
+
+    def list_partitions(self) -> List[Dict[str, Any]]:
+        """列出访问日志表的分区及其范围，非分区表返回空列表"""
+        if not self.is_partitioned():
+            return []
+        with get_db_session() as db:
+            return [
+                {'name': p['name'], 'start': p['start'].isoformat(), 'end': p['end'].isoformat()}
+                for p in self._list_partitions(db)
+            ]
+
+    def _list_partitions(self, db) -> List[Dict[str, Any]]:
+        rows = db.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+        ), {'table': ACCESS_LOG_TABLE}).fetchall()
+
+        partitions = []
+        for name, bound in rows:
+            match = PARTITION_BOUND_PATTERN.search(bound or '')
+            if not match:
+                # DEFAULT 分区等无法解析范围的分区不参与过期清理
+                continue
+            partitions.append({
+                'name': name,
+                'start': datetime.fromisoformat(match.group(1)).date(),
+                'end': datetime.fromisoformat(match.group(2)).date()
+            })
+        return sorted(partitions, key=lambda p: p['start'])
+
+    def drop_expired(self, retention_days: Optional[int] = None) -> Dict[str, Any]:
+        """清理 retention_days 天之前的访问日志
+
+        分区表：DETACH 并 DROP 整个落在截止日期之前的分区（跨越截止日期的分区保留到整体过期）；
+        非分区表：DELETE 截止日期之前的行。
+        同时删除已清理日期的导入状态，使导入统计与实际数据一致。
+        """
+        retention_days = settings.log_ingest.retention_days if retention_days is None else retention_days
+        if retention_days <= 0:
+            return {'cutoff': None, 'dropped_partitions': [], 'deleted_rows': 0}
+
+        cutoff = date.today() - timedelta(days=retention_days)
+        dropped = []
+        deleted_rows = 0
+
+        with get_db_session() as db:
+            if self.is_partitioned():
+                status_cutoff = None
+                for partition in self._list_partitions(db):
+                    if partition['end'] > cutoff:
+                        break
+                    db.execute(text(f"ALTER TABLE {ACCESS_LOG_TABLE} DETACH PARTITION {partition['name']}"))
+                    db.execute(text(f"DROP TABLE {partition['name']}"))
+                    dropped.append(partition['name'])
+                    status_cutoff = partition['end']
+            else:
+                deleted_rows = db.query(GitlabApiAccessLog).filter(
+                    GitlabApiAccessLog.access_time < datetime.combine(cutoff, datetime.min.time())
+                ).delete(synchronize_session=False)
+                status_cutoff = cutoff
+
+            if status_cutoff:
+                db.query(LogImportStatus).filter(
+                    LogImportStatus.import_date < status_cutoff
+                ).delete(synchronize_session=False)
+
+        if dropped:
+            self.forget_partitions()
+            logger.info(f"删除过期访问日志分区（早于 {cutoff}）: {', '.join(dropped)}")
+        elif deleted_rows:
+            logger.info(f"删除了 {deleted_rows} 条过期访问日志（早于 {cutoff}）")
+
+        return {'cutoff': cutoff.isoformat(), 'dropped_partitions': dropped, 'deleted_rows': deleted_rows}
+
+
+# 创建全局分区服务实例
+log_partition_service = LogPartitionService()
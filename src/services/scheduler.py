@@ -1,20 +1,59 @@
 """
 调度器模块
 
-提供定时任务调度功能，用于自动采集监控数据。
+提供定时任务调度功能，用于自动采集监控数据、清理过期数据和定时同步 GitLab 数据。
+
+定时同步（SYNC_SCHEDULE_ENABLED）通过后台任务队列执行：
+- 每 SYNC_INCREMENTAL_INTERVAL_MINUTES 分钟增量 sync_all
+- 每晚 SYNC_FULL_SYNC_TIME 全量 sync_all，完成后重新生成分支汇总
+每次触发带 SYNC_SCHEDULE_JITTER_SECONDS 内的随机延迟；多个副本各自触发，
+但只有拿到数据库咨询锁、且本周期内还没有执行记录的进程会创建任务。
+每次执行的开始/结束时间、耗时和结果记录在 scheduled_job_run 表中，由 /scheduler/status 返回。
 """
 
 import logging
-from datetime import datetime
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from sqlalchemy import func, text
 
 from config.settings import settings
+from database.connection import engine, get_db_session
+from database.models import ScheduledJobRun
+from services import task_handlers
 from services.monitoring_service import monitoring_service
+from services.log_partition_service import log_partition_service
+from services.log_archive_service import log_archive_service
+from services.task_service import FINISHED_STATUSES, TaskStatus, task_service
 
 logger = logging.getLogger(__name__)
 
+# 定时同步使用的会话级咨询锁，多个副本中同一时间只有一个进程执行定时同步
+SYNC_SCHEDULE_LOCK_KEY = 7301004
+
+# 访问日志过期清理使用的会话级咨询锁，多个副本中同一时间只有一个进程执行归档和清理
+RETENTION_LOCK_KEY = 7301006
+
+# 定时同步的任务 ID
+INCREMENTAL_SYNC_JOB_ID = 'gitlab_incremental_sync'
+NIGHTLY_SYNC_JOB_ID = 'gitlab_nightly_full_sync'
+SYNC_JOB_IDS = (INCREMENTAL_SYNC_JOB_ID, NIGHTLY_SYNC_JOB_ID)
+
+# 等待定时同步创建的后台任务完成的最长时间，以及查询任务状态的间隔（秒）
+SYNC_JOB_MAX_WAIT = timedelta(hours=6)
+SYNC_JOB_POLL_SECONDS = 5
+
+# 定时任务执行记录保留天数
+JOB_HISTORY_RETENTION_DAYS = 30
+
 
 class MonitoringScheduler:
     """监控数据调度器"""
@@ -28,6 +67,10 @@ class MonitoringScheduler:
                 'max_instances': 1  # 每个任务最多只运行一个实例
             }
         )
+        self._host = f"{socket.gethostname()}:{os.getpid()}"
+        self._local_sync_lock = threading.Lock()  # 非 PostgreSQL 数据库时代替咨询锁
+        self._local_retention_lock = threading.Lock()
+        self._stop_event = threading.Event()  # 停止调度器时结束对后台任务的等待
         self._setup_event_listeners()
     
     def _setup_event_listeners(self):
@@ -55,22 +98,315 @@ class MonitoringScheduler:
         except Exception as e:
             logger.error(f"监控数据清理任务执行失败: {e}", exc_info=True)
     
+    def cleanup_old_access_logs_job(self):
+        """清理过期访问日志的定时任务（分区表删除整个过期分区）
+        
+        每个副本都会触发，持有清理锁的进程执行，其他进程跳过，避免并发归档和删除分区。
+        """
+        with self._advisory_lock(RETENTION_LOCK_KEY, self._local_retention_lock, timedelta(0)) as acquired:
+            if not acquired:
+                logger.info("其他进程正在执行访问日志清理，跳过")
+                return
+            self._cleanup_old_access_logs()
+    
+    def _cleanup_old_access_logs(self):
+        try:
+            logger.info("开始执行访问日志清理任务...")
+            
+            # LOG_ARCHIVE_ON_CLEANUP 开启时先把即将过期的日志归档，归档失败则本次不清理
+            if settings.log_ingest.archive_on_cleanup:
+                cutoff = date.today() - timedelta(days=settings.log_ingest.retention_days)
+                archive_result = log_archive_service.archive(end_date=cutoff - timedelta(days=1))
+                logger.info(
+                    f"过期访问日志归档完成，归档 {archive_result['archived_rows']} 行到 "
+                    f"{len(archive_result['files'])} 个文件"
+                )
+            
+            result = log_partition_service.drop_expired()
+            logger.info(
+                f"访问日志清理完成，截止日期 {result['cutoff']}，"
+                f"删除分区 {len(result['dropped_partitions'])} 个，删除记录 {result['deleted_rows']} 条"
+            )
+            
+        except Exception as e:
+            logger.error(f"访问日志清理任务执行失败: {e}", exc_info=True)
+    
+    def incremental_sync_job(self, force: bool = False):
+        """定时增量同步 GitLab 数据（sync_all incremental=True）"""
+        interval = timedelta(minutes=settings.sync.incremental_interval_minutes)
+        self._run_sync_job(INCREMENTAL_SYNC_JOB_ID, [
+            ('sync_all', task_handlers.sync_all, {'incremental': True}),
+        ], min_gap=None if force else interval / 2, lock_wait=timedelta(0))
+    
+    def nightly_full_sync_job(self, force: bool = False):
+        """每晚全量同步 GitLab 数据，完成后重新生成分支汇总（增量同步正在执行时等待其完成）"""
+        self._run_sync_job(NIGHTLY_SYNC_JOB_ID, [
+            ('sync_all', task_handlers.sync_all, {'incremental': False}),
+            ('generate_branch_summaries', task_handlers.generate_branch_summaries, {}),
+        ], min_gap=None if force else timedelta(hours=12), lock_wait=SYNC_JOB_MAX_WAIT)
+    
+    def _run_sync_job(self, job_id: str, steps: List[Tuple[str, Callable, Dict[str, Any]]],
+                      min_gap: Optional[timedelta], lock_wait: timedelta):
+        """
+        持有定时同步锁，依次创建后台任务并等待其完成，前一步未成功时不再执行后续步骤
+        
+        lock_wait 内未拿到锁（其他进程正在执行定时同步）或 min_gap 内已有该任务的执行记录
+        （其他副本已执行过本周期）时直接跳过，不记录执行历史。
+        
+        Args:
+            job_id: 调度器任务 ID
+            steps: [(任务类型, 任务处理函数, 关键字参数)]
+            min_gap: 两次执行的最小间隔，None 表示不检查（手动执行）
+            lock_wait: 等待定时同步锁的最长时间
+        """
+        with self._sync_lock(lock_wait) as acquired:
+            if not acquired:
+                logger.info(f"其他进程正在执行定时同步，跳过: {job_id}")
+                return
+            if min_gap is not None and self._ran_since(job_id, datetime.now() - min_gap):
+                logger.info(f"本周期已执行过定时同步，跳过: {job_id}")
+                return
+            
+            run_id = self._start_run(job_id)
+            status = 'completed'
+            details = []
+            try:
+                for task_type, handler, kwargs in steps:
+                    step = self._run_task_and_wait(job_id, task_type, handler, kwargs)
+                    details.append(step)
+                    if step['status'] != TaskStatus.COMPLETED.value:
+                        status = step['status']
+                        break
+            except Exception as e:
+                self._finish_run(run_id, 'failed', message=str(e), details=details)
+                raise
+            
+            message = '; '.join(f"{step['task_type']}: {step['status']}" for step in details)
+            self._finish_run(run_id, status, message=message, details=details)
+    
+    def _run_task_and_wait(self, job_id: str, task_type: str, handler: Callable,
+                           kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """创建后台任务并等待其结束，返回该步骤的任务 ID、状态和耗时
+        
+        与手动同步使用相同的任务类型，因此已有同类任务等待或运行时本次跳过，不会重复同步。
+        """
+        step = {'task_type': task_type, 'task_id': None, 'status': 'skipped', 'message': None, 'duration': None}
+        try:
+            created = task_service.create_task(
+                task_type, handler, metadata={'scheduled_job': job_id}, **kwargs
+            )
+        except ValueError as e:
+            # 触发过于频繁或队列已满
+            step['message'] = str(e)
+            return step
+        
+        step['task_id'] = created['task_id']
+        if not created['is_new']:
+            step['message'] = created['message']
+            return step
+        
+        deadline = datetime.now() + SYNC_JOB_MAX_WAIT
+        while True:
+            task = task_service.get_task(created['task_id'])
+            if task is None:
+                step.update(status=TaskStatus.FAILED.value, message='任务记录不存在')
+                return step
+            if task['status'] in FINISHED_STATUSES:
+                step.update(status=task['status'], message=task['error'] or task['message'],
+                            duration=task['duration'])
+                return step
+            if datetime.now() > deadline:
+                step.update(status='timeout', message=f"等待超过 {SYNC_JOB_MAX_WAIT}，任务状态: {task['status']}")
+                return step
+            if self._stop_event.wait(SYNC_JOB_POLL_SECONDS):
+                step.update(status='interrupted', message=f"调度器已停止，任务状态: {task['status']}")
+                return step
+    
+    def _sync_lock(self, wait: timedelta):
+        """获取定时同步锁，最多等待 wait，返回是否获得"""
+        return self._advisory_lock(SYNC_SCHEDULE_LOCK_KEY, self._local_sync_lock, wait)
+    
+    @contextmanager
+    def _advisory_lock(self, key: int, local_lock: threading.Lock, wait: timedelta):
+        """
+        获取咨询锁，最多等待 wait（每 SYNC_JOB_POLL_SECONDS 秒重试一次），返回是否获得
+        
+        PostgreSQL 使用会话级咨询锁（pg_try_advisory_lock）在整个任务期间持有，跨副本有效；
+        连接使用自动提交，避免长时间处于事务中。其他数据库只在进程内用 local_lock 互斥。
+        """
+        deadline = datetime.now() + wait
+        
+        def acquire(try_lock: Callable[[], bool]) -> bool:
+            while not try_lock():
+                if datetime.now() >= deadline or self._stop_event.wait(SYNC_JOB_POLL_SECONDS):
+                    return False
+            return True
+        
+        if engine.dialect.name != 'postgresql':
+            acquired = acquire(lambda: local_lock.acquire(blocking=False))
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    local_lock.release()
+            return
+        
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            acquired = acquire(lambda: conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {'key': key}
+            ).scalar())
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': key})
+    
+    # ==================== 执行历史 ====================
+    
+    def _tracked(self, job_id: str, job_func: Callable) -> Callable:
+        """包装定时任务，记录每次执行的开始/结束时间、耗时和结果"""
+        def run():
+            run_id = self._start_run(job_id)
+            try:
+                job_func()
+            except Exception as e:
+                self._finish_run(run_id, 'failed', message=str(e))
+                raise
+            self._finish_run(run_id, 'completed')
+        return run
+    
+    def _ran_since(self, job_id: str, since: datetime) -> bool:
+        """since 之后是否有该任务的执行记录（任意进程）"""
+        with get_db_session() as db:
+            return db.query(ScheduledJobRun.id).filter(
+                ScheduledJobRun.job_id == job_id,
+                ScheduledJobRun.started_at >= since
+            ).first() is not None
+    
+    def _start_run(self, job_id: str) -> Optional[int]:
+        """记录任务开始执行，记录失败时返回 None（不影响任务执行）"""
+        try:
+            with get_db_session() as db:
+                run = ScheduledJobRun(job_id=job_id, status='running', host=self._host, started_at=datetime.now())
+                db.add(run)
+                db.flush()
+                return run.id
+        except Exception as e:
+            logger.error(f"记录定时任务开始失败: {job_id}, 错误: {e}")
+            return None
+    
+    def _finish_run(self, run_id: Optional[int], status: str, message: Optional[str] = None,
+                    details: Optional[List[Dict[str, Any]]] = None):
+        """记录任务执行结果和耗时，并清理过期的执行记录"""
+        if run_id is None:
+            return
+        try:
+            with get_db_session() as db:
+                run = db.get(ScheduledJobRun, run_id)
+                if run is None:
+                    return
+                run.status = status
+                run.finished_at = datetime.now()
+                run.duration_seconds = round((run.finished_at - run.started_at).total_seconds(), 3)
+                run.message = message
+                run.details = details
+                
+                db.query(ScheduledJobRun).filter(
+                    ScheduledJobRun.started_at < datetime.now() - timedelta(days=JOB_HISTORY_RETENTION_DAYS)
+                ).delete(synchronize_session=False)
+        except Exception as e:
+            logger.error(f"记录定时任务结果失败: {run_id}, 错误: {e}")
+    
+    def get_job_history(self, job_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的执行记录（按开始时间倒序）"""
+        with get_db_session() as db:
+            query = db.query(ScheduledJobRun)
+            if job_id:
+                query = query.filter(ScheduledJobRun.job_id == job_id)
+            runs = query.order_by(ScheduledJobRun.started_at.desc()).limit(limit).all()
+            return [run.to_dict() for run in runs]
+    
+    def _job_duration_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各任务成功执行的次数、平均和最长耗时"""
+        with get_db_session() as db:
+            rows = db.query(
+                ScheduledJobRun.job_id,
+                func.count(ScheduledJobRun.id),
+                func.avg(ScheduledJobRun.duration_seconds),
+                func.max(ScheduledJobRun.duration_seconds)
+            ).filter(
+                ScheduledJobRun.status == 'completed'
+            ).group_by(ScheduledJobRun.job_id).all()
+        return {
+            job_id: {
+                'completed_runs': count,
+                'avg_duration_seconds': round(avg, 3) if avg is not None else None,
+                'max_duration_seconds': maximum
+            }
+            for job_id, count, avg, maximum in rows
+        }
+    
     def add_jobs(self):
         """添加所有定时任务"""
         # 监控数据清理任务 - 每周日凌晨3点执行
         self.scheduler.add_job(
-            func=self.cleanup_old_metrics_job,
+            func=self._tracked('monitoring_data_cleanup', self.cleanup_old_metrics_job),
             trigger=CronTrigger(day_of_week='sun', hour=3, minute=0),
             id='monitoring_data_cleanup',
             name='监控数据清理',
             replace_existing=True
         )
         logger.info("已添加定时任务: 监控数据清理 (每周日 03:00)")
+        
+        # 访问日志清理任务 - 每天凌晨3点30分执行（LOG_RETENTION_DAYS 为 0 时不添加）
+        if settings.log_ingest.retention_days > 0:
+            self.scheduler.add_job(
+                func=self._tracked('access_log_retention', self.cleanup_old_access_logs_job),
+                trigger=CronTrigger(hour=3, minute=30),
+                id='access_log_retention',
+                name='访问日志清理',
+                replace_existing=True
+            )
+            logger.info(f"已添加定时任务: 访问日志清理 (每天 03:30，保留 {settings.log_ingest.retention_days} 天)")
+        
+        if settings.sync.schedule_enabled:
+            self._add_sync_jobs()
+    
+    def _add_sync_jobs(self):
+        """添加定时同步任务（SYNC_SCHEDULE_ENABLED 开启时）"""
+        jitter = settings.sync.schedule_jitter_seconds or None
+        
+        # 增量同步 - 每 SYNC_INCREMENTAL_INTERVAL_MINUTES 分钟执行
+        interval = settings.sync.incremental_interval_minutes
+        if interval > 0:
+            self.scheduler.add_job(
+                func=self.incremental_sync_job,
+                trigger=IntervalTrigger(minutes=interval, jitter=jitter),
+                id=INCREMENTAL_SYNC_JOB_ID,
+                name='GitLab 增量同步',
+                replace_existing=True
+            )
+            logger.info(f"已添加定时任务: GitLab 增量同步 (每 {interval} 分钟，随机延迟 {jitter or 0} 秒内)")
+        
+        # 全量同步和分支汇总 - 每天 SYNC_FULL_SYNC_TIME 执行
+        if settings.sync.full_sync_time:
+            hour, minute = settings.sync.full_sync_time.split(':')
+            self.scheduler.add_job(
+                func=self.nightly_full_sync_job,
+                trigger=CronTrigger(hour=int(hour), minute=int(minute), jitter=jitter),
+                id=NIGHTLY_SYNC_JOB_ID,
+                name='GitLab 全量同步',
+                replace_existing=True
+            )
+            logger.info(
+                f"已添加定时任务: GitLab 全量同步 (每天 {settings.sync.full_sync_time}，随机延迟 {jitter or 0} 秒内)"
+            )
     
     def start(self):
         """启动调度器"""
         try:
             if not self.scheduler.running:
+                self._stop_event.clear()
                 self.add_jobs()
                 self.scheduler.start()
                 logger.info("监控调度器已启动")
@@ -90,6 +426,7 @@ class MonitoringScheduler:
         """停止调度器"""
         try:
             if self.scheduler.running:
+                self._stop_event.set()
                 self.scheduler.shutdown(wait=True)
                 logger.info("监控调度器已停止")
             else:
@@ -98,16 +435,22 @@ class MonitoringScheduler:
             logger.error(f"停止监控调度器失败: {e}", exc_info=True)
     
     def get_jobs_status(self):
-        """获取所有任务状态"""
+        """获取所有任务状态（含最近一次执行和成功执行的耗时统计）"""
         jobs = self.scheduler.get_jobs()
         status = []
+        duration_stats = self._job_duration_stats()
         
         for job in jobs:
+            last_run = self.get_job_history(job.id, limit=1)
             status.append({
                 'id': job.id,
                 'name': job.name,
                 'next_run_time': job.next_run_time.isoformat() if job.next_run_time else None,
-                'trigger': str(job.trigger)
+                'trigger': str(job.trigger),
+                'last_run': last_run[0] if last_run else None,
+                **duration_stats.get(job.id, {
+                    'completed_runs': 0, 'avg_duration_seconds': None, 'max_duration_seconds': None
+                })
             })
         
         return status
@@ -116,6 +459,13 @@ class MonitoringScheduler:
         """立即运行指定任务"""
         try:
             job = self.scheduler.get_job(job_id)
+            if job and job_id in SYNC_JOB_IDS:
+                # 定时同步需要等待后台任务完成，在后台线程执行，不检查本周期是否已执行
+                threading.Thread(
+                    target=job.func, kwargs={'force': True}, name=f'scheduler-{job_id}', daemon=True
+                ).start()
+                logger.info(f"已在后台开始执行任务: {job_id}")
+                return True
             if job:
                 job.func()
                 logger.info(f"手动执行任务成功: {job_id}")
@@ -0,0 +1,162 @@
+"""
+同步任务的进度上报与协作式取消
+
+GitlabService 的 sync_* 方法接收一个 SyncContext：
+- begin_stage()/advance() 记录当前阶段已处理/总数，按时间节流上报进度百分比、消息和预计剩余时间
+- check_cancelled() 在仓库之间、分页之间调用，任务被取消时抛出 SyncCancelledError
+
+sync_all 用 span() 把各子同步映射到整体进度的不同区间。
+未传入上下文时使用 SyncContext()，不上报进度，也不会被取消。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SyncCancelledError(BaseException):
+    """同步任务已被取消
+    
+    与 asyncio.CancelledError 一样继承 BaseException，
+    避免被同步代码中逐仓库、逐分组的 except Exception 吞掉而继续执行。
+    """
+    pass
+
+
+def format_duration(seconds: float) -> str:
+    """把秒数格式化为“1 小时 2 分”“3 分 4 秒”这样的文本"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} 小时 {seconds % 3600 // 60} 分"
+    if seconds >= 60:
+        return f"{seconds // 60} 分 {seconds % 60} 秒"
+    return f"{seconds} 秒"
+
+
+class SyncContext:
+    """同步进度与取消上下文（线程安全）"""
+    
+    def __init__(self, reporter: Optional[Callable[[int, str, Dict[str, Any]], None]] = None,
+                 cancel_check: Optional[Callable[[], bool]] = None,
+                 report_interval: float = 1.0, cancel_check_interval: float = 1.0):
+        """
+        Args:
+            reporter: 进度回调 (百分比, 消息, 详情)
+            cancel_check: 返回任务是否已被请求取消的回调（如查询任务表）
+            report_interval: 两次进度上报的最小间隔（秒）
+            cancel_check_interval: 两次调用 cancel_check 的最小间隔（秒）
+        """
+        self._reporter = reporter
+        self._cancel_check = cancel_check
+        self._report_interval = report_interval
+        self._cancel_check_interval = cancel_check_interval
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._last_report = 0.0
+        self._last_cancel_check = 0.0
+        
+        self._span: Tuple[float, float] = (0.0, 100.0)
+        self.stage: Optional[str] = None
+        self.processed = 0
+        self.total: Optional[int] = None
+        self._stage_started = time.monotonic()
+    
+    # ==================== 取消 ====================
+    
+    def cancel(self):
+        """在本进程内直接请求取消"""
+        self._cancelled.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        """任务是否已被请求取消（按 cancel_check_interval 节流查询）"""
+        if self._cancelled.is_set():
+            return True
+        if self._cancel_check is None:
+            return False
+        
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_cancel_check < self._cancel_check_interval:
+                return False
+            self._last_cancel_check = now
+        if self._cancel_check():
+            self._cancelled.set()
+            return True
+        return False
+    
+    def check_cancelled(self):
+        """任务已被请求取消时抛出 SyncCancelledError"""
+        if self.cancelled:
+            raise SyncCancelledError(f"同步已取消（阶段: {self.stage or '-'}，已处理 {self.processed}）")
+    
+    # ==================== 进度 ====================
+    
+    @contextmanager
+    def span(self, start: float, end: float):
+        """在 with 块内，把阶段进度 0~100% 映射到整体进度的 [start, end] 区间（相对当前区间）"""
+        outer = self._span
+        width = outer[1] - outer[0]
+        self._span = (outer[0] + width * start / 100, outer[0] + width * end / 100)
+        try:
+            yield self
+        finally:
+            self._span = outer
+    
+    def begin_stage(self, stage: str, total: Optional[int] = None):
+        """开始一个阶段，total 为需要处理的仓库/分组数（未知时为 None）"""
+        with self._lock:
+            self.stage = stage
+            self.total = total
+            self.processed = 0
+            self._stage_started = time.monotonic()
+        self._report(force=True)
+    
+    def set_total(self, total: Optional[int]):
+        """更新当前阶段的总数（如分页拉取时从响应头得知总数）"""
+        with self._lock:
+            self.total = total
+    
+    def advance(self, count: int = 1):
+        """当前阶段又处理完 count 个"""
+        with self._lock:
+            self.processed += count
+        self._report()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """当前阶段的进度详情"""
+        with self._lock:
+            stage, processed, total = self.stage, self.processed, self.total
+            elapsed = time.monotonic() - self._stage_started
+        
+        fraction = min(1.0, processed / total) if total else 0.0
+        percent = int(self._span[0] + (self._span[1] - self._span[0]) * fraction)
+        rate = processed / elapsed if elapsed > 0 else None
+        eta_seconds = (total - processed) / rate if total and rate else None
+        return {
+            'stage': stage,
+            'processed': processed,
+            'total': total,
+            'percent': percent,
+            'elapsed_seconds': round(elapsed, 1),
+            'rate_per_second': round(rate, 3) if rate else None,
+            'eta_seconds': round(eta_seconds) if eta_seconds is not None else None
+        }
+    
+    def _report(self, force: bool = False):
+        """按 report_interval 节流调用 reporter"""
+        if self._reporter is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self._report_interval:
+                return
+            self._last_report = now
+        
+        detail = self.snapshot()
+        message = f"{detail['stage']}: {detail['processed']}"
+        if detail['total']:
+            message += f"/{detail['total']}"
+        if detail['eta_seconds'] is not None:
+            message += f"，预计剩余 {format_duration(detail['eta_seconds'])}"
+        self._reporter(detail['percent'], message, detail)
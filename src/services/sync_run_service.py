@@ -0,0 +1,296 @@
+"""
+全量同步运行记录与检查点
+
+sync_all 每次运行在 sync_run 表中记录各阶段（repositories、groups、branches、permissions、summary）
+的状态和耗时，并在 sync_run_repository 表中逐仓库记录 仓库/分支/规则分析/权限 各阶段的状态和耗时，
+可据此找出同步最慢的仓库。
+
+以 resume=True 运行时沿用最近一次未完成的同模式运行记录：
+- 已完成的阶段直接跳过
+- 分支和权限阶段跳过该记录中已完成的仓库，只重试失败或未处理的仓库
+- 规则分析未完成的仓库重新分析全部分支（中断时分支可能已写入但未分析，不会再被识别为有变化）
+（整体成功但有仓库失败的运行记为 partial，同样可以继续）
+- 水位候选值沿用首次运行时记录的值，继续执行完成后写入的水位不会越过中断前未同步的活动
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func, or_
+
+from database.connection import get_db_session
+from database.models import SyncRun, SyncRunRepository
+from utils.logger import get_logger
+
+logger = get_logger(__name__, 'gitlab')
+
+# 运行记录保留天数
+SYNC_RUN_RETENTION_DAYS = 30
+
+STAGE_DONE = 'done'
+STAGE_FAILED = 'failed'
+
+# sync_run_repository 中各仓库阶段对应的状态列和耗时列
+REPOSITORY_STAGE_COLUMNS = {
+    'repository': ('repository_status', None),
+    'branches': ('branches_status', 'branches_seconds'),
+    'analysis': ('analysis_status', 'analysis_seconds'),
+    'permissions': ('permissions_status', 'permissions_seconds'),
+}
+
+
+class SyncCheckpoint:
+    """一次 sync_all 运行的检查点（线程安全），由 SyncRunService.start_run 创建"""
+    
+    def __init__(self, service: 'SyncRunService', run_id: int, stages: Dict[str, Any],
+                 watermarks: Dict[str, str], completed: Dict[str, Set[int]],
+                 reanalyze: Optional[Set[int]] = None):
+        self._service = service
+        self.run_id = run_id
+        self._stages = stages
+        self._watermarks = watermarks
+        self._completed = completed  # 仓库阶段 -> 已完成的仓库 ID
+        self._reanalyze = reanalyze or set()  # 之前的执行中规则分析未完成的仓库
+        self._failed: Dict[str, int] = {}  # 本次执行中各仓库阶段失败的仓库数
+        self._lock = threading.Lock()
+    
+    def stage_done(self, stage: str) -> bool:
+        """该阶段是否已在之前的执行中完成"""
+        return self._stages.get(stage, {}).get('status') == STAGE_DONE
+    
+    def run_stage(self, stage: str, run: Callable[[], Any], repository_stages: Iterable[str] = ()) -> Optional[Any]:
+        """
+        执行一个阶段并记录状态和耗时，阶段已完成时跳过并返回 None
+        
+        run 返回结果的 success 为 True 且 repository_stages 中没有仓库失败时，阶段标记为完成。
+        """
+        if self.stage_done(stage):
+            logger.info(f"同步运行 {self.run_id}: 阶段 {stage} 已完成，跳过")
+            return None
+        
+        started_at = datetime.now()
+        result = run()
+        failed = sum(self._failed.get(name, 0) for name in repository_stages)
+        status = STAGE_DONE if getattr(result, 'success', True) and not failed else STAGE_FAILED
+        self._stages[stage] = {
+            'status': status,
+            'seconds': round((datetime.now() - started_at).total_seconds(), 3),
+            'started_at': started_at.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'failed_repositories': failed
+        }
+        self._service._update_run(self.run_id, stages=dict(self._stages))
+        return result
+    
+    def is_done(self, stage: str, repository_id: int) -> bool:
+        """仓库的该阶段是否已完成"""
+        with self._lock:
+            return repository_id in self._completed.get(stage, set())
+    
+    def needs_full_analysis(self, repository_id: int) -> bool:
+        """仓库在之前的执行中规则分析未完成（失败或中断），需要重新分析全部分支"""
+        with self._lock:
+            return repository_id in self._reanalyze
+    
+    def record(self, repository_id: int, stage: str, status: str, seconds: Optional[float] = None,
+               error: Optional[str] = None, **values):
+        """记录仓库某阶段的状态和耗时（写入失败只记录日志，不影响同步）"""
+        with self._lock:
+            if status == STAGE_DONE:
+                self._completed.setdefault(stage, set()).add(repository_id)
+                if stage == 'analysis':
+                    self._reanalyze.discard(repository_id)
+            else:
+                self._failed[stage] = self._failed.get(stage, 0) + 1
+        
+        status_column, seconds_column = REPOSITORY_STAGE_COLUMNS[stage]
+        values[status_column] = status
+        if seconds_column and seconds is not None:
+            values[seconds_column] = round(seconds, 3)
+        if error is not None:
+            values['error'] = error[:2000]
+        try:
+            self._service._upsert_repositories(self.run_id, [repository_id], values)
+        except Exception as e:
+            logger.warning(f"记录同步检查点失败: 运行 {self.run_id}, 仓库 {repository_id}, 阶段 {stage} - {e}")
+    
+    def record_many(self, repository_ids: List[int], stage: str, status: str):
+        """批量记录多个仓库某阶段的状态（用于按列表同步的仓库阶段）"""
+        with self._lock:
+            if status == STAGE_DONE:
+                self._completed.setdefault(stage, set()).update(repository_ids)
+        status_column, _ = REPOSITORY_STAGE_COLUMNS[stage]
+        try:
+            self._service._upsert_repositories(self.run_id, repository_ids, {status_column: status})
+        except Exception as e:
+            logger.warning(f"记录同步检查点失败: 运行 {self.run_id}, 阶段 {stage} - {e}")
+    
+    def watermark_candidate(self, resource: str, compute: Callable[[], Optional[datetime]]) -> Optional[datetime]:
+        """水位候选值：首次执行该阶段时计算并保存，从检查点继续时沿用保存的值"""
+        with self._lock:
+            saved = self._watermarks.get(resource)
+        if saved:
+            return datetime.fromisoformat(saved)
+        
+        value = compute()
+        if value is not None:
+            with self._lock:
+                self._watermarks[resource] = value.isoformat()
+                watermarks = dict(self._watermarks)
+            self._service._update_run(self.run_id, watermarks=watermarks)
+        return value
+    
+    def failed_stages(self) -> List[str]:
+        """有仓库失败（或结果不成功）的阶段"""
+        return [stage for stage, info in self._stages.items() if info.get('status') == STAGE_FAILED]
+    
+    def finish(self, status: str, error: Optional[str] = None):
+        """记录运行结束状态"""
+        self._service._update_run(self.run_id, status=status, error=error, finished_at=datetime.now())
+
+
+class SyncRunService:
+    """全量同步运行记录服务"""
+    
+    def start_run(self, incremental: bool, resume: bool = False) -> SyncCheckpoint:
+        """
+        开始一次 sync_all 运行
+        
+        Args:
+            incremental: 是否为增量同步（只会继续同模式的运行）
+            resume: 最近一次同模式运行未完成（失败、取消或进程退出）时从它的检查点继续；
+                    执行 sync_all 的进程退出后任务被重新执行时，任务服务自动传入 True
+        """
+        mode = 'incremental' if incremental else 'full'
+        with get_db_session() as db:
+            run = None
+            if resume:
+                # 只继续最近一次运行，之后已有完成的运行时不再继续更早的运行
+                run = db.query(SyncRun).filter(SyncRun.mode == mode).order_by(SyncRun.started_at.desc()).first()
+                if run is not None and run.status == 'completed':
+                    run = None
+            
+            reanalyze = set()
+            if run is not None:
+                run.status = 'running'
+                run.error = None
+                run.finished_at = None
+                run.resume_count = (run.resume_count or 0) + 1
+                completed = {}
+                rows = db.query(SyncRunRepository).filter(SyncRunRepository.run_id == run.id).all()
+                for stage, (status_column, _) in REPOSITORY_STAGE_COLUMNS.items():
+                    completed[stage] = {row.repository_id for row in rows if getattr(row, status_column) == STAGE_DONE}
+                reanalyze = {row.repository_id for row in rows if row.analysis_status != STAGE_DONE}
+                logger.info(
+                    f"从同步运行 {run.id} 的检查点继续（第 {run.resume_count} 次），"
+                    f"已完成分支 {len(completed['branches'])} 个仓库、权限 {len(completed['permissions'])} 个仓库"
+                )
+            else:
+                # 仍标记为运行中的记录来自已退出的进程
+                db.query(SyncRun).filter(SyncRun.status == 'running').update(
+                    {'status': 'failed', 'error': '同步进程已退出', 'finished_at': datetime.now()},
+                    synchronize_session=False
+                )
+                self._cleanup_old_runs(db)
+                run = SyncRun(mode=mode, status='running', stages={}, watermarks={}, started_at=datetime.now())
+                db.add(run)
+                db.flush()
+                completed = {}
+                logger.info(f"开始同步运行 {run.id} ({mode})")
+            
+            return SyncCheckpoint(
+                self, run.id, dict(run.stages or {}), dict(run.watermarks or {}), completed, reanalyze
+            )
+    
+    def _cleanup_old_runs(self, db):
+        """删除超过保留天数的运行记录"""
+        cutoff = datetime.now() - timedelta(days=SYNC_RUN_RETENTION_DAYS)
+        run_ids = [run_id for (run_id,) in db.query(SyncRun.id).filter(SyncRun.started_at < cutoff).all()]
+        if run_ids:
+            db.query(SyncRunRepository).filter(SyncRunRepository.run_id.in_(run_ids)).delete(synchronize_session=False)
+            db.query(SyncRun).filter(SyncRun.id.in_(run_ids)).delete(synchronize_session=False)
+    
+    def _update_run(self, run_id: int, **values):
+        with get_db_session() as db:
+            db.query(SyncRun).filter(SyncRun.id == run_id).update(values, synchronize_session=False)
+    
+    def _upsert_repositories(self, run_id: int, repository_ids: List[int], values: Dict[str, Any]):
+        """更新仓库阶段记录，不存在时插入（同一运行的检查点由同步线程串行写入）"""
+        with get_db_session() as db:
+            existing = {
+                repository_id for (repository_id,) in db.query(SyncRunRepository.repository_id).filter(
+                    SyncRunRepository.run_id == run_id,
+                    SyncRunRepository.repository_id.in_(repository_ids)
+                ).all()
+            }
+            if existing:
+                db.query(SyncRunRepository).filter(
+                    SyncRunRepository.run_id == run_id,
+                    SyncRunRepository.repository_id.in_(existing)
+                ).update(dict(values, updated_at=datetime.now()), synchronize_session=False)
+            db.bulk_insert_mappings(SyncRunRepository, [
+                dict(values, run_id=run_id, repository_id=repository_id, updated_at=datetime.now())
+                for repository_id in repository_ids if repository_id not in existing
+            ])
+    
+    def _run_to_dict(self, run: SyncRun) -> Dict[str, Any]:
+        return {
+            'id': run.id,
+            'mode': run.mode,
+            'status': run.status,
+            'stages': run.stages or {},
+            'resume_count': run.resume_count,
+            'error': run.error,
+            'started_at': run.started_at.isoformat() if run.started_at else None,
+            'finished_at': run.finished_at.isoformat() if run.finished_at else None
+        }
+    
+    def list_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的同步运行（按开始时间倒序）"""
+        with get_db_session() as db:
+            runs = db.query(SyncRun).order_by(SyncRun.started_at.desc()).limit(limit).all()
+            return [self._run_to_dict(run) for run in runs]
+    
+    def get_run(self, run_id: int, slowest: int = 20) -> Optional[Dict[str, Any]]:
+        """同步运行详情：各阶段耗时、各仓库阶段的状态统计、耗时最长的仓库和失败的仓库"""
+        with get_db_session() as db:
+            run = db.get(SyncRun, run_id)
+            if run is None:
+                return None
+            
+            status_counts = {}
+            for stage, (status_column, _) in REPOSITORY_STAGE_COLUMNS.items():
+                column = getattr(SyncRunRepository, status_column)
+                rows = db.query(column, func.count(SyncRunRepository.id)).filter(
+                    SyncRunRepository.run_id == run_id,
+                    column.isnot(None)
+                ).group_by(column).all()
+                status_counts[stage] = dict(rows)
+            
+            total_seconds = (
+                func.coalesce(SyncRunRepository.branches_seconds, 0)
+                + func.coalesce(SyncRunRepository.analysis_seconds, 0)
+                + func.coalesce(SyncRunRepository.permissions_seconds, 0)
+            )
+            slowest_rows = db.query(SyncRunRepository).filter(
+                SyncRunRepository.run_id == run_id
+            ).order_by(total_seconds.desc()).limit(slowest).all()
+            failed_rows = db.query(SyncRunRepository).filter(
+                SyncRunRepository.run_id == run_id,
+                or_(*[
+                    getattr(SyncRunRepository, status_column) == STAGE_FAILED
+                    for status_column, _ in REPOSITORY_STAGE_COLUMNS.values()
+                ])
+            ).limit(100).all()
+            
+            result = self._run_to_dict(run)
+            result.update({
+                'repository_status': status_counts,
+                'slowest_repositories': [row.to_dict() for row in slowest_rows],
+                'failed_repositories': [row.to_dict() for row in failed_rows]
+            })
+            return result
+
+
+# 创建全局同步运行记录服务实例
+sync_run_service = SyncRunService()
@@ -0,0 +1,67 @@
+"""
+后台任务处理函数
+
+通过 task_service.create_task 创建的任务由任意进程的工作线程按注册名执行，
+因此任务函数在这里统一注册，参数只能是可 JSON 序列化的值。
+耗时长的全量任务默认使用低优先级，避免阻塞单个仓库的同步等交互操作。
+context 由工作线程传入（SyncContext），用于上报进度和响应取消。
+"""
+from datetime import date
+from typing import Optional
+
+from services.gitlab_service import GitlabService
+from services.log_archive_service import log_archive_service
+from services.sync_context import SyncContext
+from services.task_service import PRIORITY_LOW, task_handler
+
+
+@task_handler('sync_repositories')
+def sync_repositories(incremental: bool = False, context: Optional[SyncContext] = None):
+    """同步 GitLab 仓库数据"""
+    return GitlabService().sync_repositories(incremental=incremental, context=context)
+
+
+@task_handler('sync_groups')
+def sync_groups(context: Optional[SyncContext] = None):
+    """同步 GitLab 组织和用户数据"""
+    return GitlabService().sync_groups(context=context)
+
+
+@task_handler('sync_branches')
+def sync_branches(repository_id: Optional[int] = None, concurrent: Optional[bool] = None,
+                  max_workers: Optional[int] = None, deep: bool = False, incremental: bool = False,
+                  context: Optional[SyncContext] = None):
+    """同步仓库分支数据（repository_id 为空时同步所有仓库）"""
+    return GitlabService().sync_repository_branches(
+        repository_id, concurrent=concurrent, max_workers=max_workers,
+        deep=deep, incremental=incremental, context=context
+    )
+
+
+@task_handler('sync_permissions')
+def sync_permissions(repository_id: Optional[int] = None, incremental: bool = False,
+                     context: Optional[SyncContext] = None):
+    """同步仓库权限数据（repository_id 为空时同步所有仓库）"""
+    return GitlabService().sync_repository_permissions(repository_id, incremental=incremental, context=context)
+
+
+@task_handler('sync_all', priority=PRIORITY_LOW)
+def sync_all(incremental: bool = False, resume: bool = False, context: Optional[SyncContext] = None):
+    """同步所有 GitLab 数据（resume 为 True 时从上次未完成运行的检查点继续）"""
+    return GitlabService().sync_all(incremental=incremental, context=context, resume=resume)
+
+
+@task_handler('generate_branch_summaries', priority=PRIORITY_LOW)
+def generate_branch_summaries(force_refresh: bool = False, context: Optional[SyncContext] = None):
+    """生成所有仓库的分支汇总统计"""
+    return GitlabService().generate_branch_summaries(force_refresh, context=context)
+
+
+@task_handler('archive_access_logs', priority=PRIORITY_LOW)
+def archive_access_logs(start_date: Optional[str] = None, end_date: Optional[str] = None, delete: bool = False):
+    """把访问日志归档为 Parquet 文件（日期为 YYYY-MM-DD，delete 为 True 时归档后删除数据库中的日志）"""
+    return log_archive_service.archive(
+        date.fromisoformat(start_date) if start_date else None,
+        date.fromisoformat(end_date) if end_date else None,
+        delete=delete
+    )
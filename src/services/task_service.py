@@ -1,18 +1,96 @@
 """
 异步任务服务
 处理长时间运行的后台任务，如 GitLab 数据同步
+
+任务保存在数据库 background_task 表中，多个进程（如多个 gunicorn worker、
+scripts/run_task_worker.py）共享同一任务队列：
+- 任何进程都能查询任务状态，重启后等待中的任务不会丢失
+- 防重复通过 active_key 唯一约束实现，跨进程有效
+- 每个进程启动 MAX_CONCURRENT_TASKS 个工作线程认领任务，PostgreSQL 使用
+  SELECT ... FOR UPDATE SKIP LOCKED，每种任务的全局并发数受 TASK_TYPE_CONCURRENCY 限制
+- 执行中的任务定期续约，进程退出后租约过期，任务重新排队或标记为失败；
+  重新执行时处理函数有 resume 参数的传入 resume=True，从上次执行的检查点继续
+- 等待中的任务按优先级、创建时间排队，队列长度超过 TASK_MAX_QUEUE_DEPTH /
+  TASK_MAX_QUEUE_PER_TYPE 时拒绝创建（TaskQueueFullError，接口返回 429）
+- 处理函数声明 context 参数时会收到 SyncContext，用于上报细粒度进度（已处理/总数、预计剩余时间）；
+  取消运行中的任务只设置 cancel_requested，任务在下一个检查点抛出 SyncCancelledError 后标记为已取消
+
+任务函数需使用 @task_handler 注册（见 services/task_handlers.py），参数须可 JSON 序列化，
+这样任务才能在创建它的进程之外执行。
 """
+import inspect
+import json
+import os
+import socket
 import uuid
 import threading
-import time
-from datetime import datetime
-from typing import Dict, Any, Callable, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional, Union
 from enum import Enum
 from dataclasses import dataclass, field, asdict, is_dataclass
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+
+from config.settings import settings
+from database.connection import get_db_session
+from database.models import BackgroundTask
+from services.sync_context import SyncCancelledError, SyncContext
 from utils.logger import get_logger
 
 logger = get_logger(__name__, 'app')
 
+# 认领任务时使用的事务级咨询锁，保证按任务类型统计的并发数在多个进程间准确
+TASK_CLAIM_LOCK_KEY = 7301003
+
+# 已完成/失败/取消的任务保留时长（小时）
+TASK_RETENTION_HOURS = 24
+
+# 任务优先级，数值大的先执行
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+# 已注册的任务处理函数：名称 -> 函数
+TASK_HANDLERS: Dict[str, Callable] = {}
+# 各处理函数的默认优先级
+TASK_HANDLER_PRIORITIES: Dict[str, int] = {}
+
+
+def task_handler(name: str, priority: int = PRIORITY_NORMAL):
+    """注册后台任务处理函数的装饰器，任务按名称在任意工作进程中执行
+
+    priority 为该类任务的默认优先级，创建任务时可单独指定。
+    处理函数有 context 参数时，执行时传入该任务的 SyncContext；
+    有 resume 参数时，任务因执行进程退出被重新执行（第二次及以后）时传入 resume=True。
+    """
+    def decorator(handler: Callable) -> Callable:
+        TASK_HANDLERS[name] = handler
+        TASK_HANDLER_PRIORITIES[name] = priority
+        handler.task_handler_name = name
+        handler.accepts_context = 'context' in inspect.signature(handler).parameters
+        handler.accepts_resume = 'resume' in inspect.signature(handler).parameters
+        return handler
+    return decorator
+
+
+class TaskQueueFullError(ValueError):
+    """任务队列已满，拒绝创建新任务（接口返回 429）"""
+    pass
+
+
+def _to_json(value: Any) -> Any:
+    """把任务结果转换为可 JSON 序列化的值（dataclass 转字典，日期等转字符串）"""
+    if value is None:
+        return None
+    if is_dataclass(value):
+        try:
+            value = asdict(value)
+        except Exception as e:
+            logger.warning(f"Failed to convert result to dict: {e}")
+            return str(value)
+    return json.loads(json.dumps(value, default=str, ensure_ascii=False))
+
 
 class TaskStatus(str, Enum):
     """任务状态枚举"""
@@ -23,6 +101,9 @@ class TaskStatus(str, Enum):
     CANCELLED = "cancelled"  # 已取消
 
 
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+
+
 @dataclass
 class Task:
     """任务数据类"""
@@ -35,8 +116,37 @@ class Task:
     result: Optional[Any] = None
     error: Optional[str] = None
     progress: int = 0  # 0-100
+    progress_detail: Optional[Dict[str, Any]] = None  # 当前阶段、已处理/总数、预计剩余秒数
     message: str = ""
+    cancel_requested: bool = False
     metadata: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    worker_id: Optional[str] = None
+    priority: int = PRIORITY_NORMAL
+    queue_position: Optional[int] = None  # 等待中的任务在队列中的位置（从 1 开始）
+    
+    @classmethod
+    def from_model(cls, model: BackgroundTask, queue_position: Optional[int] = None) -> 'Task':
+        """从数据库模型创建任务对象"""
+        return cls(
+            task_id=model.task_id,
+            task_type=model.task_type,
+            status=TaskStatus(model.status),
+            created_at=model.created_at,
+            started_at=model.started_at,
+            completed_at=model.completed_at,
+            result=model.result,
+            error=model.error,
+            progress=model.progress or 0,
+            progress_detail=model.progress_detail,
+            message=model.message or "",
+            cancel_requested=bool(model.cancel_requested),
+            metadata=model.task_metadata or {},
+            attempts=model.attempts or 0,
+            worker_id=model.worker_id,
+            priority=model.priority or 0,
+            queue_position=queue_position
+        )
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -59,8 +169,14 @@ class Task:
             'result': result_value,
             'error': self.error,
             'progress': self.progress,
+            'progress_detail': self.progress_detail,
             'message': self.message,
+            'cancel_requested': self.cancel_requested,
             'metadata': self.metadata,
+            'attempts': self.attempts,
+            'worker_id': self.worker_id,
+            'priority': self.priority,
+            'queue_position': self.queue_position,
             'duration': self._get_duration()
         }
     
@@ -77,8 +193,8 @@ class TaskService:
     """
     任务服务 - 管理异步后台任务
     
-    这是一个单例服务，使用内存存储任务状态
-    适合中小规模应用，如需持久化可改用 Redis 或数据库
+    这是一个单例服务，任务状态保存在数据库中，多个进程共享；
+    start_workers() 在本进程启动工作线程执行任务（Web 进程在 create_app 中启动）
     """
     
     _instance = None
@@ -99,38 +215,40 @@ class TaskService:
             return
         
         self._initialized = True
-        self.tasks: Dict[str, Task] = {}  # 存储所有任务
-        self._lock = threading.Lock()
-        
-        # 防重复机制
-        self.running_task_types: set = set()  # 正在运行的任务类型
-        self.last_task_time: Dict[str, datetime] = {}  # 最后执行时间
-        self.task_type_lock = threading.Lock()
-        
-        # 启动清理线程（定期清理旧任务）
-        self._start_cleanup_thread()
+        self._claim_lock = threading.Lock()  # 本进程内的工作线程依次认领任务
+        self._running: Dict[str, str] = {}  # 本进程正在执行的任务：task_id -> worker_id
+        self._contexts: Dict[str, SyncContext] = {}  # 本进程正在执行的任务的进度/取消上下文
+        self._running_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._workers_pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()  # 创建任务后唤醒本进程空闲的工作线程
         
         logger.info("任务服务已初始化")
     
+    # ==================== 创建与查询 ====================
+    
     def create_task(
         self,
         task_type: str,
-        func: Callable,
+        func: Union[Callable, str],
         *args,
         allow_duplicate: bool = False,
         metadata: Optional[Dict[str, Any]] = None,
+        priority: Optional[int] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
-        创建并启动异步任务（带防重复检查）
+        创建异步任务（带防重复检查和队列长度限制），由任意进程的工作线程执行
         
         Args:
             task_type: 任务类型（如 'sync_repositories'）
-            func: 要执行的函数
-            *args: 函数参数
+            func: 使用 @task_handler 注册的函数或其注册名
+            *args: 函数参数（须可 JSON 序列化）
             allow_duplicate: 是否允许重复任务（默认 False）
             metadata: 任务元数据
-            **kwargs: 函数关键字参数
+            priority: 优先级（默认为处理函数注册时的优先级）
+            **kwargs: 函数关键字参数（须可 JSON 序列化）
         
         Returns:
             Dict: {
@@ -138,73 +256,81 @@ class TaskService:
                 'is_new': bool,
                 'message': str
             }
+        
+        Raises:
+            ValueError: 触发过于频繁
+            TaskQueueFullError: 等待执行的任务过多
         """
+        handler_name = func if isinstance(func, str) else getattr(func, 'task_handler_name', None)
+        if handler_name not in TASK_HANDLERS:
+            raise ValueError(f"任务函数未注册，请使用 @task_handler 注册: {handler_name or func}")
         
-        # 防重复检查
-        if not allow_duplicate:
-            # 1. 检查是否有相同任务正在运行
-            with self.task_type_lock:
-                if task_type in self.running_task_types:
-                    running_task = self._find_running_task(task_type)
-                    
+        task_id = str(uuid.uuid4())
+        try:
+            with get_db_session() as db:
+                # 防重复检查
+                if not allow_duplicate:
+                    # 1. 检查是否有相同任务正在等待或运行
+                    running_task = db.query(BackgroundTask).filter(
+                        BackgroundTask.active_key == task_type
+                    ).first()
                     if running_task:
                         logger.warning(
                             f"任务类型 {task_type} 已在运行中 "
-                            f"(任务ID: {running_task['task_id']})"
+                            f"(任务ID: {running_task.task_id})"
                         )
-                        
                         return {
-                            'task_id': running_task['task_id'],
+                            'task_id': running_task.task_id,
                             'is_new': False,
                             'message': '已有相同任务正在运行，已返回现有任务'
                         }
-                
-                # 2. 检查时间窗口（防止频繁执行）
-                from config.settings import settings
-                min_interval = settings.task.min_interval
-                
-                last_time = self.last_task_time.get(task_type)
-                if last_time:
-                    elapsed = (datetime.now() - last_time).total_seconds()
                     
-                    if elapsed < min_interval:
-                        remaining = int(min_interval - elapsed)
-                        error_msg = f"请勿频繁同步，请 {remaining} 秒后再试"
-                        
-                        logger.warning(
-                            f"任务 {task_type} 触发过于频繁 "
-                            f"(距上次 {int(elapsed)} 秒，需间隔 {min_interval} 秒)"
-                        )
+                    # 2. 检查时间窗口（防止频繁执行）
+                    min_interval = settings.task.min_interval
+                    last_time = db.query(BackgroundTask.created_at).filter(
+                        BackgroundTask.task_type == task_type
+                    ).order_by(BackgroundTask.created_at.desc()).limit(1).scalar()
+                    if last_time:
+                        elapsed = (datetime.now() - last_time).total_seconds()
                         
-                        raise ValueError(error_msg)
+                        if elapsed < min_interval:
+                            remaining = int(min_interval - elapsed)
+                            error_msg = f"请勿频繁同步，请 {remaining} 秒后再试"
+                            
+                            logger.warning(
+                                f"任务 {task_type} 触发过于频繁 "
+                                f"(距上次 {int(elapsed)} 秒，需间隔 {min_interval} 秒)"
+                            )
+                            
+                            raise ValueError(error_msg)
                 
-                # 标记任务类型为运行中
-                self.running_task_types.add(task_type)
-                self.last_task_time[task_type] = datetime.now()
-        
-        # 创建新任务
-        task_id = str(uuid.uuid4())
-        
-        task = Task(
-            task_id=task_id,
-            task_type=task_type,
-            status=TaskStatus.PENDING,
-            created_at=datetime.now(),
-            metadata=metadata or {}
-        )
-        
-        with self._lock:
-            self.tasks[task_id] = task
+                self._check_queue_depth(db, handler_name)
+                
+                db.add(BackgroundTask(
+                    task_id=task_id,
+                    task_type=task_type,
+                    handler=handler_name,
+                    params={'args': list(args), 'kwargs': kwargs},
+                    status=TaskStatus.PENDING.value,
+                    priority=TASK_HANDLER_PRIORITIES[handler_name] if priority is None else priority,
+                    active_key=None if allow_duplicate else task_type,
+                    message='等待执行',
+                    task_metadata=metadata or {},
+                    created_at=datetime.now()
+                ))
+        except IntegrityError:
+            # 另一个进程同时创建了相同类型的任务
+            running_task = self._find_running_task(task_type)
+            if running_task:
+                return {
+                    'task_id': running_task['task_id'],
+                    'is_new': False,
+                    'message': '已有相同任务正在运行，已返回现有任务'
+                }
+            raise
         
         logger.info(f"创建任务: {task_type} (ID: {task_id})")
-        
-        # 在新线程中执行任务
-        thread = threading.Thread(
-            target=self._execute_task,
-            args=(task_id, func, args, kwargs),
-            daemon=True
-        )
-        thread.start()
+        self._wakeup.set()
         
         return {
             'task_id': task_id,
@@ -212,92 +338,54 @@ class TaskService:
             'message': '任务已创建'
         }
     
-    def _execute_task(
-        self,
-        task_id: str,
-        func: Callable,
-        args: tuple,
-        kwargs: dict
-    ):
-        """
-        执行任务（在独立线程中运行）
-        
-        Args:
-            task_id: 任务 ID
-            func: 要执行的函数
-            args: 函数参数
-            kwargs: 函数关键字参数
+    def _check_queue_depth(self, db, handler_name: str):
+        """等待执行的任务总数或同类任务数达到上限时抛出 TaskQueueFullError
+
+        多个进程同时创建任务时计数可能略有超出，上限用于削峰而非精确配额。
         """
-        task = self.tasks.get(task_id)
-        if not task:
-            logger.error(f"任务不存在: {task_id}")
-            return
-        
-        try:
-            # 更新状态为运行中
-            task.status = TaskStatus.RUNNING
-            task.started_at = datetime.now()
-            task.message = "任务执行中..."
-            
-            logger.info(f"开始执行任务: {task.task_type} (ID: {task_id})")
-            
-            # 执行实际任务
-            result = func(*args, **kwargs)
-            
-            # 更新状态为完成
-            task.status = TaskStatus.COMPLETED
-            task.completed_at = datetime.now()
-            task.progress = 100
-            task.result = result
-            task.message = "任务完成"
-            
-            logger.info(
-                f"任务完成: {task.task_type} (ID: {task_id}) "
-                f"- 耗时: {task._get_duration():.2f}秒"
+        depths = dict(db.query(BackgroundTask.handler, func.count(BackgroundTask.task_id)).filter(
+            BackgroundTask.status == TaskStatus.PENDING.value
+        ).group_by(BackgroundTask.handler).all())
+        
+        total = sum(depths.values())
+        if total >= settings.task.max_queue_depth:
+            logger.warning(f"任务队列已满: 等待中的任务 {total} 个（上限 {settings.task.max_queue_depth}）")
+            raise TaskQueueFullError(f"任务队列已满（{total} 个任务等待执行），请稍后再试")
+        
+        queued = depths.get(handler_name, 0)
+        if queued >= settings.task.max_queue_per_type:
+            logger.warning(
+                f"{handler_name} 任务排队过多: 等待中 {queued} 个（上限 {settings.task.max_queue_per_type}）"
             )
-            
-        except Exception as e:
-            # 更新状态为失败
-            task.status = TaskStatus.FAILED
-            task.completed_at = datetime.now()
-            
-            # 提取错误信息（保持完整性）
-            error_message = str(e)
-            
-            # 特殊处理 GitLab 认证错误，提取关键信息
-            if "GitLab 认证失败" in error_message or "401 Unauthorized" in error_message:
-                # 清理和格式化错误消息
-                task.error = "GitLab 认证失败 (401 Unauthorized)"
-                task.message = (
-                    "❌ GitLab 认证失败\n\n"
-                    "📋 可能的原因:\n"
-                    "  1. Token 已过期或被撤销\n"
-                    "  2. Token 权限不足（需要 'api' 或 'read_api' 权限）\n"
-                    "  3. GitLab 服务器地址配置错误\n\n"
-                    "✅ 解决方案:\n"
-                    "  1. 访问 GitLab → Settings → Access Tokens\n"
-                    "  2. 创建新 Token（勾选 'api' 权限）\n"
-                    "  3. 复制 Token 并更新到 .env 文件的 GITLAB_TOKEN\n"
-                    "  4. 重启应用\n\n"
-                    "📖 详细指南: docs/GITLAB_TOKEN_GUIDE.md"
-                )
-                # GitLab 认证错误是已知错误，不需要完整堆栈跟踪
-                logger.error(f"任务失败: {task.task_type} (ID: {task_id}) - {error_message}")
-            else:
-                # 其他未知错误，保持原样并记录完整堆栈跟踪以便调试
-                task.error = error_message
-                task.message = f"任务执行失败: {error_message}"
-                logger.error(
-                    f"任务失败: {task.task_type} (ID: {task_id}) - {error_message}",
-                    exc_info=True
-                )
-        
-        finally:
-            # 任务完成后，移除类型锁
-            with self.task_type_lock:
-                if task.task_type in self.running_task_types:
-                    self.running_task_types.remove(task.task_type)
-                    logger.debug(f"已释放任务类型锁: {task.task_type}")
+            raise TaskQueueFullError(f"已有 {queued} 个同类任务等待执行，请稍后再试")
+    
+    def _queue_positions(self, db) -> Dict[str, int]:
+        """等待中任务的排队位置（按优先级从高到低、创建时间从早到晚，从 1 开始）"""
+        pending = db.query(BackgroundTask.task_id).filter(
+            BackgroundTask.status == TaskStatus.PENDING.value
+        ).order_by(BackgroundTask.priority.desc(), BackgroundTask.created_at).all()
+        return {task_id: position for position, (task_id,) in enumerate(pending, start=1)}
+    
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """各类任务的等待数和运行数"""
+        with get_db_session() as db:
+            rows = db.query(BackgroundTask.handler, BackgroundTask.status, func.count(BackgroundTask.task_id)).filter(
+                BackgroundTask.status.in_([TaskStatus.PENDING.value, TaskStatus.RUNNING.value])
+            ).group_by(BackgroundTask.handler, BackgroundTask.status).all()
+        
+        handlers = {}
+        for handler, status, count in rows:
+            stats = handlers.setdefault(handler, {
+                'pending': 0, 'running': 0, 'concurrency': settings.task.concurrency_for(handler)
+            })
+            stats[status] = count
+        return {
+            'pending': sum(stats['pending'] for stats in handlers.values()),
+            'running': sum(stats['running'] for stats in handlers.values()),
+            'max_queue_depth': settings.task.max_queue_depth,
+            'max_queue_per_type': settings.task.max_queue_per_type,
+            'handlers': handlers
+        }
     
     def _find_running_task(self, task_type: str) -> Optional[Dict[str, Any]]:
         """
@@ -309,12 +397,15 @@ class TaskService:
         Returns:
             正在运行的任务信息，如果没有则返回 None
         """
-        with self._lock:
-            for task in self.tasks.values():
-                if (task.task_type == task_type and 
-                    task.status in [TaskStatus.PENDING, TaskStatus.RUNNING]):
-                    return task.to_dict()
-        return None
+        with get_db_session() as db:
+            task = db.query(BackgroundTask).filter(
+                BackgroundTask.task_type == task_type,
+                BackgroundTask.status.in_([TaskStatus.PENDING.value, TaskStatus.RUNNING.value])
+            ).order_by(BackgroundTask.created_at.desc()).first()
+            if not task:
+                return None
+            position = self._queue_positions(db).get(task.task_id)
+            return Task.from_model(task, position).to_dict()
     
     def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -326,10 +417,12 @@ class TaskService:
         Returns:
             任务信息字典，如果不存在则返回 None
         """
-        task = self.tasks.get(task_id)
-        if task:
-            return task.to_dict()
-        return None
+        with get_db_session() as db:
+            task = db.get(BackgroundTask, task_id)
+            if not task:
+                return None
+            position = self._queue_positions(db).get(task_id) if task.status == TaskStatus.PENDING.value else None
+            return Task.from_model(task, position).to_dict()
     
     def get_all_tasks(
         self,
@@ -346,49 +439,77 @@ class TaskService:
             limit: 返回数量限制
         
         Returns:
-            任务列表
+            任务列表（按创建时间倒序）
         """
-        with self._lock:
-            tasks = list(self.tasks.values())
-        
-        # 过滤
-        if task_type:
-            tasks = [t for t in tasks if t.task_type == task_type]
-        if status:
-            tasks = [t for t in tasks if t.status == status]
-        
-        # 按创建时间倒序排序
-        tasks.sort(key=lambda t: t.created_at, reverse=True)
-        
-        # 限制数量
-        tasks = tasks[:limit]
-        
-        return [task.to_dict() for task in tasks]
+        with get_db_session() as db:
+            query = db.query(BackgroundTask)
+            if task_type:
+                query = query.filter(BackgroundTask.task_type == task_type)
+            if status:
+                query = query.filter(BackgroundTask.status == status.value)
+            tasks = query.order_by(BackgroundTask.created_at.desc()).limit(limit).all()
+            positions = self._queue_positions(db) if any(
+                task.status == TaskStatus.PENDING.value for task in tasks
+            ) else {}
+            return [Task.from_model(task, positions.get(task.task_id)).to_dict() for task in tasks]
     
     def cancel_task(self, task_id: str) -> bool:
         """
-        取消任务（注意：只能取消等待中的任务）
+        取消任务
+        
+        等待中的任务直接标记为已取消；运行中的任务标记 cancel_requested，
+        由执行它的工作线程在下一个检查点（仓库之间、分页之间）停止并标记为已取消。
         
         Args:
             task_id: 任务 ID
         
         Returns:
-            bool: 是否成功取消
+            bool: 是否成功取消或已请求取消
         """
-        task = self.tasks.get(task_id)
-        if not task:
-            return False
-        
-        if task.status == TaskStatus.PENDING:
-            task.status = TaskStatus.CANCELLED
-            task.completed_at = datetime.now()
-            task.message = "任务已取消"
+        with get_db_session() as db:
+            cancelled = db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.status == TaskStatus.PENDING.value
+            ).update({
+                'status': TaskStatus.CANCELLED.value,
+                'completed_at': datetime.now(),
+                'message': '任务已取消',
+                'active_key': None
+            }, synchronize_session=False)
+            requested = 0 if cancelled else db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).update({
+                'cancel_requested': True,
+                'message': '已请求取消，任务将在下一个检查点停止'
+            }, synchronize_session=False)
+            status = None if cancelled or requested else db.query(BackgroundTask.status).filter(
+                BackgroundTask.task_id == task_id
+            ).scalar()
+        
+        if cancelled:
             logger.info(f"任务已取消: {task_id}")
             return True
         
-        logger.warning(f"无法取消任务（状态: {task.status}）: {task_id}")
+        if requested:
+            # 任务在本进程执行时立即通知，其他进程的任务由 SyncContext 轮询 cancel_requested
+            with self._running_lock:
+                context = self._contexts.get(task_id)
+            if context is not None:
+                context.cancel()
+            logger.info(f"已请求取消运行中的任务: {task_id}")
+            return True
+        
+        logger.warning(f"无法取消任务（状态: {status}）: {task_id}")
         return False
     
+    def is_cancel_requested(self, task_id: str) -> bool:
+        """运行中的任务是否已被请求取消"""
+        with get_db_session() as db:
+            return bool(db.query(BackgroundTask.cancel_requested).filter(
+                BackgroundTask.task_id == task_id
+            ).scalar())
+    
     def update_progress(
         self,
         task_id: str,
@@ -403,48 +524,360 @@ class TaskService:
             progress: 进度 (0-100)
             message: 进度消息
         """
-        task = self.tasks.get(task_id)
-        if task:
-            task.progress = max(0, min(100, progress))  # 限制在 0-100
-            if message:
-                task.message = message
+        values = {'progress': max(0, min(100, progress))}  # 限制在 0-100
+        if message:
+            values['message'] = message
+        with get_db_session() as db:
+            db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).update(values, synchronize_session=False)
+        
+        logger.debug(f"任务进度更新: {task_id} - {progress}% - {message}")
+    
+    def report_progress(self, task_id: str, progress: int, message: str, detail: Dict[str, Any]):
+        """SyncContext 的进度回调：更新进度、消息和进度详情（已请求取消时保留取消提示）"""
+        values = {'progress': max(0, min(100, progress)), 'progress_detail': _to_json(detail)}
+        with get_db_session() as db:
+            db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).update(values, synchronize_session=False)
+            db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.status == TaskStatus.RUNNING.value,
+                BackgroundTask.cancel_requested.is_(False)
+            ).update({'message': message}, synchronize_session=False)
+    
+    def _create_context(self, task_id: str) -> SyncContext:
+        """创建任务的进度/取消上下文；上报失败只记录日志，不影响任务执行"""
+        def reporter(progress: int, message: str, detail: Dict[str, Any]):
+            try:
+                self.report_progress(task_id, progress, message, detail)
+            except Exception as e:
+                logger.warning(f"上报任务进度失败: {task_id} - {e}")
+        
+        def cancel_check() -> bool:
+            try:
+                return self.is_cancel_requested(task_id)
+            except Exception as e:
+                logger.warning(f"检查任务取消状态失败: {task_id} - {e}")
+                return False
+        
+        return SyncContext(reporter=reporter, cancel_check=cancel_check)
+    
+    # ==================== 工作线程 ====================
+    
+    def start_workers(self, count: Optional[int] = None):
+        """在本进程启动工作线程和维护线程（重复调用无效；fork 出的子进程会重新启动）"""
+        with self._running_lock:
+            if self._workers_pid == os.getpid() and self._workers:
+                return
+            self._workers_pid = os.getpid()
+            self._workers = []
+            self._stop_event.clear()
+        
+        # 导入任务处理函数模块，完成注册
+        import services.task_handlers  # noqa: F401
+        
+        count = count or settings.task.max_concurrent
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for index in range(count):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(f"{prefix}:{index}",),
+                name=f"task-worker-{index}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        
+        maintenance = threading.Thread(target=self._maintenance_loop, name='task-maintenance', daemon=True)
+        maintenance.start()
+        self._workers.append(maintenance)
+        
+        logger.info(f"任务工作线程已启动: {count} 个 ({prefix})")
+    
+    def stop_workers(self, wait: bool = False):
+        """停止本进程的工作线程，wait 为 True 时等待正在执行的任务完成"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+    
+    def _worker_loop(self, worker_id: str):
+        """工作线程：循环认领并执行任务，没有任务时等待轮询间隔或被唤醒"""
+        while not self._stop_event.is_set():
+            try:
+                task = self._claim_task(worker_id)
+            except Exception as e:
+                logger.error(f"认领任务失败 ({worker_id}): {e}", exc_info=True)
+                task = None
+            
+            if task is None:
+                self._wakeup.wait(settings.task.poll_interval)
+                self._wakeup.clear()
+                continue
             
-            logger.debug(f"任务进度更新: {task_id} - {progress}% - {message}")
+            self._execute_task(task, worker_id)
     
-    def _start_cleanup_thread(self):
-        """启动清理线程，定期删除旧任务"""
-        def cleanup():
-            while True:
-                time.sleep(3600)  # 每小时清理一次
-                self._cleanup_old_tasks()
+    def _claim_task(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        认领一个等待中的任务并标记为运行中，没有可执行的任务时返回 None
         
-        thread = threading.Thread(target=cleanup, daemon=True)
-        thread.start()
-        logger.info("任务清理线程已启动")
+        PostgreSQL 在事务级咨询锁内统计各类任务的运行数（保证并发上限准确），
+        再用 FOR UPDATE SKIP LOCKED 选取任务，跳过正被其他事务（如取消）锁定的行；
+        其他数据库用带状态条件的 UPDATE 保证同一任务只被认领一次。
+        """
+        with self._claim_lock, get_db_session() as db:
+            postgresql = db.get_bind().dialect.name == 'postgresql'
+            if postgresql:
+                db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': TASK_CLAIM_LOCK_KEY})
+            
+            running = db.query(BackgroundTask.handler, func.count(BackgroundTask.task_id)).filter(
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).group_by(BackgroundTask.handler).all()
+            saturated = [
+                handler for handler, count in running
+                if count >= settings.task.concurrency_for(handler)
+            ]
+            
+            query = db.query(BackgroundTask).filter(BackgroundTask.status == TaskStatus.PENDING.value)
+            if saturated:
+                query = query.filter(BackgroundTask.handler.notin_(saturated))
+            query = query.order_by(BackgroundTask.priority.desc(), BackgroundTask.created_at)
+            if postgresql:
+                query = query.with_for_update(skip_locked=True)
+            task = query.first()
+            if task is None:
+                return None
+            
+            now = datetime.now()
+            claimed = db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task.task_id,
+                BackgroundTask.status == TaskStatus.PENDING.value
+            ).update({
+                'status': TaskStatus.RUNNING.value,
+                'worker_id': worker_id,
+                'lease_expires_at': now + timedelta(seconds=settings.task.lease_seconds),
+                'started_at': now,
+                'attempts': BackgroundTask.attempts + 1,
+                'message': '任务执行中...'
+            }, synchronize_session=False)
+            if not claimed:
+                return None
+            
+            with self._running_lock:
+                self._running[task.task_id] = worker_id
+            return {
+                'task_id': task.task_id,
+                'task_type': task.task_type,
+                'handler': task.handler,
+                'params': task.params or {},
+                'attempts': (task.attempts or 0) + 1
+            }
     
-    def _cleanup_old_tasks(self, max_age_hours: int = 24):
+    def _execute_task(self, task: Dict[str, Any], worker_id: str):
         """
-        清理旧任务
+        执行已认领的任务
         
         Args:
-            max_age_hours: 任务最大保留时长（小时）
+            task: _claim_task 返回的任务信息
+            worker_id: 工作线程标识
         """
-        now = datetime.now()
-        to_delete = []
-        
-        with self._lock:
-            for task_id, task in self.tasks.items():
-                # 只清理已完成/失败/取消的任务
-                if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
-                    age_hours = (now - task.created_at).total_seconds() / 3600
-                    if age_hours > max_age_hours:
-                        to_delete.append(task_id)
+        task_id = task['task_id']
+        started = datetime.now()
+        try:
+            handler = TASK_HANDLERS.get(task['handler'])
+            if handler is None:
+                raise ValueError(f"未注册的任务处理函数: {task['handler']}")
+            
+            logger.info(f"开始执行任务: {task['task_type']} (ID: {task_id}, 工作线程: {worker_id})")
+            
+            # 执行实际任务
+            kwargs = dict(task['params'].get('kwargs', {}))
+            if getattr(handler, 'accepts_context', False):
+                kwargs['context'] = self._create_context(task_id)
+                with self._running_lock:
+                    self._contexts[task_id] = kwargs['context']
+            if task.get('attempts', 1) > 1 and getattr(handler, 'accepts_resume', False):
+                # 上次执行的进程已退出，从它留下的检查点继续，而不是从头开始
+                logger.info(f"任务第 {task['attempts']} 次执行，从检查点继续: {task['task_type']} (ID: {task_id})")
+                kwargs['resume'] = True
+            result = handler(*task['params'].get('args', []), **kwargs)
+            
+            # 更新状态为完成
+            self._finish_task(
+                task_id, worker_id, TaskStatus.COMPLETED,
+                result=_to_json(result), progress=100, message="任务完成"
+            )
+            
+            logger.info(
+                f"任务完成: {task['task_type']} (ID: {task_id}) "
+                f"- 耗时: {(datetime.now() - started).total_seconds():.2f}秒"
+            )
+        
+        except SyncCancelledError as e:
+            logger.info(
+                f"任务已取消: {task['task_type']} (ID: {task_id}) "
+                f"- 耗时: {(datetime.now() - started).total_seconds():.2f}秒 - {e}"
+            )
+            try:
+                self._finish_task(task_id, worker_id, TaskStatus.CANCELLED, message=str(e))
+            except Exception as db_error:
+                logger.error(f"更新任务状态失败: {task_id} - {db_error}")
+        
+        except Exception as e:
+            # 提取错误信息（保持完整性）
+            error_message = str(e)
+            
+            # 特殊处理 GitLab 认证错误，提取关键信息
+            if "GitLab 认证失败" in error_message or "401 Unauthorized" in error_message:
+                # 清理和格式化错误消息
+                error = "GitLab 认证失败 (401 Unauthorized)"
+                message = (
+                    "❌ GitLab 认证失败\n\n"
+                    "📋 可能的原因:\n"
+                    "  1. Token 已过期或被撤销\n"
+                    "  2. Token 权限不足（需要 'api' 或 'read_api' 权限）\n"
+                    "  3. GitLab 服务器地址配置错误\n\n"
+                    "✅ 解决方案:\n"
+                    "  1. 访问 GitLab → Settings → Access Tokens\n"
+                    "  2. 创建新 Token（勾选 'api' 权限）\n"
+                    "  3. 复制 Token 并更新到 .env 文件的 GITLAB_TOKEN\n"
+                    "  4. 重启应用\n\n"
+                    "📖 详细指南: docs/GITLAB_TOKEN_GUIDE.md"
+                )
+                # GitLab 认证错误是已知错误，不需要完整堆栈跟踪
+                logger.error(f"任务失败: {task['task_type']} (ID: {task_id}) - {error_message}")
+            else:
+                # 其他未知错误，保持原样并记录完整堆栈跟踪以便调试
+                error = error_message
+                message = f"任务执行失败: {error_message}"
+                logger.error(
+                    f"任务失败: {task['task_type']} (ID: {task_id}) - {error_message}",
+                    exc_info=True
+                )
             
-            for task_id in to_delete:
-                del self.tasks[task_id]
+            try:
+                self._finish_task(task_id, worker_id, TaskStatus.FAILED, error=error, message=message)
+            except Exception as db_error:
+                logger.error(f"更新任务状态失败: {task_id} - {db_error}")
+        
+        finally:
+            with self._running_lock:
+                self._running.pop(task_id, None)
+                self._contexts.pop(task_id, None)
+    
+    def _finish_task(self, task_id: str, worker_id: str, status: TaskStatus, **values):
+        """记录任务结束状态并释放防重复标记；租约已被回收（任务已重新分配）时不覆盖"""
+        values.update({
+            'status': status.value,
+            'completed_at': datetime.now(),
+            'active_key': None,
+            'lease_expires_at': None
+        })
+        with get_db_session() as db:
+            updated = db.query(BackgroundTask).filter(
+                BackgroundTask.task_id == task_id,
+                BackgroundTask.worker_id == worker_id,
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).update(values, synchronize_session=False)
+        if not updated:
+            logger.warning(f"任务 {task_id} 的租约已失效，忽略本次执行结果")
+    
+    # ==================== 续约与清理 ====================
+    
+    def _maintenance_loop(self):
+        """维护线程：为本进程执行中的任务续约，回收租约过期的任务，定期清理旧任务"""
+        interval = max(1, settings.task.lease_seconds // 3)
+        last_cleanup = None
+        while not self._stop_event.wait(interval):
+            try:
+                self._renew_leases()
+                self._reclaim_expired_tasks()
+                if last_cleanup is None or datetime.now() - last_cleanup > timedelta(hours=1):
+                    self._cleanup_old_tasks()
+                    last_cleanup = datetime.now()
+            except Exception as e:
+                logger.error(f"任务维护失败: {e}", exc_info=True)
+    
+    def _renew_leases(self):
+        """为本进程执行中的任务续约"""
+        with self._running_lock:
+            running = dict(self._running)
+        if not running:
+            return
+        
+        with get_db_session() as db:
+            db.query(BackgroundTask).filter(
+                BackgroundTask.task_id.in_(list(running)),
+                BackgroundTask.worker_id.in_(list(running.values())),
+                BackgroundTask.status == TaskStatus.RUNNING.value
+            ).update({
+                'lease_expires_at': datetime.now() + timedelta(seconds=settings.task.lease_seconds)
+            }, synchronize_session=False)
+    
+    def _reclaim_expired_tasks(self):
+        """回收租约过期的任务（执行它的进程已退出）：已请求取消的标记为已取消，
+        未超过最大执行次数的重新排队，否则标记为失败"""
+        now = datetime.now()
+        with get_db_session() as db:
+            expired = [
+                BackgroundTask.status == TaskStatus.RUNNING.value,
+                BackgroundTask.lease_expires_at < now
+            ]
+            cancelled = db.query(BackgroundTask).filter(
+                *expired, BackgroundTask.cancel_requested.is_(True)
+            ).update({
+                'status': TaskStatus.CANCELLED.value,
+                'completed_at': now,
+                'active_key': None,
+                'lease_expires_at': None,
+                'message': '任务已取消（执行任务的进程已退出）'
+            }, synchronize_session=False)
+            requeued = db.query(BackgroundTask).filter(
+                *expired, BackgroundTask.attempts < settings.task.max_attempts
+            ).update({
+                'status': TaskStatus.PENDING.value,
+                'worker_id': None,
+                'lease_expires_at': None,
+                'message': '执行任务的进程已退出，任务重新排队'
+            }, synchronize_session=False)
+            failed = db.query(BackgroundTask).filter(*expired).update({
+                'status': TaskStatus.FAILED.value,
+                'completed_at': now,
+                'active_key': None,
+                'lease_expires_at': None,
+                'error': '执行任务的进程已退出',
+                'message': f'任务执行失败: 执行任务的进程已退出（已执行 {settings.task.max_attempts} 次）'
+            }, synchronize_session=False)
+        
+        if cancelled or requeued or failed:
+            logger.warning(
+                f"回收租约过期的任务: 取消 {cancelled} 个，重新排队 {requeued} 个，标记失败 {failed} 个"
+            )
+            if requeued:
+                self._wakeup.set()
+    
+    def _cleanup_old_tasks(self, max_age_hours: int = TASK_RETENTION_HOURS):
+        """
+        清理旧任务
         
-        if to_delete:
-            logger.info(f"清理了 {len(to_delete)} 个旧任务")
+        Args:
+            max_age_hours: 任务最大保留时长（小时）
+        """
+        cutoff = datetime.now() - timedelta(hours=max_age_hours)
+        with get_db_session() as db:
+            # 只清理已完成/失败/取消的任务
+            deleted = db.query(BackgroundTask).filter(
+                BackgroundTask.status.in_(FINISHED_STATUSES),
+                BackgroundTask.created_at < cutoff
+            ).delete(synchronize_session=False)
+        
+        if deleted:
+            logger.info(f"清理了 {deleted} 个旧任务")
 
 
 # 创建全局任务服务实例
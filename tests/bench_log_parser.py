@@ -0,0 +1,99 @@
+"""
+访问日志行解析基准测试
+
+生成一个 100 万行的访问日志，对比旧的逐行解析方式（每行 re.match 字符串模式、
+strptime 解析时间、response_time 两次 float）与 AccessLogLineParser 的每秒解析行数。
+
+运行方式:
+    python tests/bench_log_parser.py
+    python tests/bench_log_parser.py --lines 200000
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from services.log_line_parser import AccessLogLineParser
+
+LEGACY_PATTERN = r'(\S+) - (\S+) \[([^\]]+)\] "(\S+) ([^"]*)" (\d+) (\d+|-) "([^"]*)" "([^"]*)"(?:\s+(\S+))?'
+
+
+def _is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def legacy_parse(line):
+    """旧实现的解析逻辑"""
+    match = re.match(LEGACY_PATTERN, line)
+    if not match:
+        return None
+    return {
+        'client_ip': match.group(1),
+        'access_time': datetime.strptime(match.group(3).split()[0], '%d/%b/%Y:%H:%M:%S'),
+        'http_method': match.group(4),
+        'api_path': match.group(5),
+        'http_status': int(match.group(6)),
+        'response_size': int(match.group(7)) if match.group(7) != '-' else None,
+        'user_agent': match.group(9),
+        'response_time': float(match.group(10)) if match.group(10) and match.group(10) != '-' and _is_float(match.group(10)) else None
+    }
+
+
+def generate_log(path, line_count):
+    """生成测试日志，平均每秒约 20 行"""
+    start = datetime(2024, 1, 1)
+    methods = ['GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE']
+    with open(path, 'w', encoding='utf-8') as log_file:
+        for index in range(line_count):
+            timestamp = (start + timedelta(seconds=index // 20)).strftime('%d/%b/%Y:%H:%M:%S')
+            log_file.write(
+                f'10.0.{index % 256}.{index % 200} - - [{timestamp} +0800] '
+                f'"{methods[index % len(methods)]} /api/v4/projects/{index % 5000}/repository/branches HTTP/1.1" '
+                f'{200 if index % 17 else 404} {index % 65536} "-" "python-gitlab/4.4.0" 0.{index % 1000:03d}\n'
+            )
+
+
+def benchmark(label, parse, path):
+    parsed = 0
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as log_file:
+        for line in log_file:
+            if parse(line.strip()) is not None:
+                parsed += 1
+    elapsed = time.perf_counter() - start
+    print(f'{label:<10} {parsed} lines in {elapsed:.2f}s -> {parsed / elapsed:,.0f} lines/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='访问日志行解析基准测试')
+    parser.add_argument('--lines', type=int, default=1_000_000, help='生成的日志行数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'access.log')
+        generate_log(path, args.lines)
+
+        sample = open(path, encoding='utf-8').readline().strip()
+        legacy_fields = legacy_parse(sample)
+        compiled_fields = AccessLogLineParser().parse(sample)
+        # 新解析器的 api_path 不含协议部分，另外输出 api_template 和 extra
+        assert legacy_fields.pop('api_path').split(' ')[0] == compiled_fields['api_path']
+        assert all(compiled_fields[key] == value for key, value in legacy_fields.items())
+
+        legacy = benchmark('legacy', legacy_parse, path)
+        compiled = benchmark('compiled', AccessLogLineParser().parse, path)
+        print(f'speedup    {legacy / compiled:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+测试公共配置
+
+使用临时 SQLite 数据库运行服务层测试：在导入任何 src 模块之前设置环境变量，
+每个测试结束后清空所有表。
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+_test_dir = tempfile.mkdtemp(prefix='gitlab_insight_test_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_test_dir, 'test.db')}"
+os.environ.setdefault('GITLAB_URL', 'http://gitlab.test')
+os.environ.setdefault('GITLAB_TOKEN', 'test-token')
+os.environ['LOG_TO_FILE'] = 'false'
+os.environ['LOG_TO_CONSOLE'] = 'false'
+
+
+@pytest.fixture
+def db():
+    """创建所有表，测试结束后清空数据"""
+    from database.connection import engine
+    from database.models import Base
+
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
@@ -0,0 +1,93 @@
+"""访问日志归档、删除已归档日志及归档后补导入的测试"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert
+
+from database.connection import get_db_session
+from database.models import GitlabApiAccessLog
+from services.log_archive_service import LogArchiveService, pq
+from services.log_parser import LogParser
+from tests.test_log_import import DAY_ONE, DAY_TWO, write_log
+
+pytestmark = pytest.mark.skipif(pq is None, reason='需要安装 pyarrow')
+
+
+@pytest.fixture
+def archive(db, tmp_path):
+    path = tmp_path / 'access.log'
+    write_log(path, 50)
+    assert LogParser(str(path)).parse_log(workers=1).success
+    return LogArchiveService(str(tmp_path / 'archive'))
+
+
+def late_import(count, day=DAY_ONE, first_id=None):
+    """模拟归档之后补导入某天的日志，first_id 指定时从该 id 起分配（模拟数据库复用已删除的 id）"""
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+    with get_db_session() as db:
+        db.execute(insert(GitlabApiAccessLog), [{
+            **({'id': first_id + index} if first_id is not None else {}),
+            'access_time': start + timedelta(seconds=index),
+            'client_ip': '10.0.1.1',
+            'http_method': 'GET',
+            'api_path': f'/api/v4/projects/{index}',
+            'http_status': 200
+        } for index in range(count)])
+
+
+def day_rows(day):
+    start = datetime.combine(day, datetime.min.time())
+    with get_db_session() as db:
+        return db.query(func.count(GitlabApiAccessLog.id)).filter(
+            GitlabApiAccessLog.access_time >= start,
+            GitlabApiAccessLog.access_time < start + timedelta(days=1)
+        ).scalar()
+
+
+def archived_rows(service, day):
+    return sum(pq.read_metadata(path).num_rows for _, _, path in service._part_files(day))
+
+
+def test_delete_after_late_import(archive):
+    result = archive.archive(DAY_ONE, DAY_ONE, delete=True)
+    assert result['archived_rows'] == 25
+    assert result['deleted_rows'] == 25
+    assert day_rows(DAY_ONE) == 0
+
+    late_import(3)
+    result = archive.archive(DAY_ONE, DAY_ONE, delete=True)
+    # 只核对和删除新文件对应的行，已删除的文件不再参与核对
+    assert result['archived_rows'] == 3
+    assert result['deleted_rows'] == 3
+    assert result['skipped_days'] == []
+    assert day_rows(DAY_ONE) == 0
+    assert archived_rows(archive, DAY_ONE) == 28
+    assert day_rows(DAY_TWO) == 25
+
+    # 没有新的日志时重复执行不导出也不删除
+    result = archive.archive(DAY_ONE, DAY_ONE, delete=True)
+    assert result['archived_rows'] == 0
+    assert result['deleted_rows'] == 0
+    assert result['skipped_days'] == []
+
+
+def test_archive_late_rows_with_reused_ids(archive):
+    archive.archive(DAY_ONE, DAY_TWO, delete=True)
+    assert day_rows(DAY_ONE) == day_rows(DAY_TWO) == 0
+
+    # 未使用 AUTOINCREMENT 的 SQLite 表删除全部日志后从 1 重新分配 id
+    late_import(25, first_id=1)
+    result = archive.archive(DAY_ONE, DAY_ONE, delete=True)
+    assert result['archived_rows'] == 25
+    assert result['deleted_rows'] == 25
+    assert day_rows(DAY_ONE) == 0
+    # 与已删除文件的 id 范围相同，写入新的文件，不覆盖原有归档
+    assert len(archive._part_files(DAY_ONE)) == 2
+    assert archived_rows(archive, DAY_ONE) == 50
+
+
+def test_access_log_ids_not_reused(archive):
+    archive.archive(DAY_ONE, DAY_TWO, delete=True)
+    late_import(1)
+    with get_db_session() as db:
+        assert db.query(func.min(GitlabApiAccessLog.id)).scalar() > 50
@@ -0,0 +1,186 @@
+"""访问日志导入中断后重试及预聚合重建的测试"""
+import multiprocessing
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+
+from config.settings import settings
+from database.connection import get_db_session
+from database.models import ApiAccessDailyRollup, GitlabApiAccessLog, LogImportRun, LogImportStatus
+from services import database_service
+from services.access_rollup_service import access_rollup_service
+from services.log_parser import LogParser
+
+DAY_ONE = date(2024, 1, 1)
+DAY_TWO = date(2024, 1, 2)
+
+
+def write_log(path, line_count, start=datetime(2024, 1, 1, 23, 59, 35)):
+    """生成每秒一行的访问日志（默认前 25 行在 1 月 1 日，其余在 1 月 2 日）"""
+    with open(path, 'w', encoding='utf-8') as log_file:
+        for index in range(line_count):
+            timestamp = (start + timedelta(seconds=index)).strftime('%d/%b/%Y:%H:%M:%S')
+            log_file.write(
+                f'10.0.0.{index % 200} - - [{timestamp} +0800] '
+                f'"GET /api/v4/projects/{index}/repository/branches HTTP/1.1" '
+                f'200 {index} "-" "python-gitlab/4.4.0" 0.{index:03d}\n'
+            )
+
+
+def fail_on_call(monkeypatch, target, name, call_number):
+    """让 target.name 的第 call_number 次调用抛出异常"""
+    original = getattr(target, name)
+    calls = {'count': 0}
+
+    def wrapper(*args, **kwargs):
+        calls['count'] += 1
+        if calls['count'] == call_number:
+            raise RuntimeError('simulated failure')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(target, name, wrapper)
+
+
+def import_state():
+    with get_db_session() as db:
+        rows = dict(db.query(func.date(GitlabApiAccessLog.access_time), func.count(GitlabApiAccessLog.id))
+                    .group_by(func.date(GitlabApiAccessLog.access_time)).all())
+        statuses = {status.import_date: (status.record_count, status.is_complete)
+                    for status in db.query(LogImportStatus)}
+        rollup_total = db.query(func.sum(ApiAccessDailyRollup.request_count)).scalar() or 0
+    return {date.fromisoformat(day): count for day, count in rows.items()}, statuses, rollup_total
+
+
+@pytest.fixture
+def access_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.log_ingest, 'chunk_size', 10)
+    path = tmp_path / 'access.log'
+    write_log(path, 50)
+    return str(path)
+
+
+def test_streaming_import_retry_after_failed_chunk(db, access_log, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_on_call(patch, access_rollup_service, 'apply', 3)
+        result = LogParser(access_log).parse_log(workers=1)
+    assert not result.success
+
+    rows, statuses, _ = import_state()
+    assert rows == {DAY_ONE: 20}
+    # 失败的批次写入前已认领第二天
+    assert statuses == {DAY_ONE: (20, False), DAY_TWO: (0, False)}
+
+    result = LogParser(access_log).parse_log(workers=1)
+    assert result.success
+    assert result.count == 50
+
+    rows, statuses, rollup_total = import_state()
+    assert rows == {DAY_ONE: 25, DAY_TWO: 25}
+    assert statuses == {DAY_ONE: (25, True), DAY_TWO: (25, True)}
+    assert rollup_total == 50
+
+    # 完整导入后再次导入，所有日期都跳过
+    result = LogParser(access_log).parse_log(workers=1)
+    assert result.count == 0
+    assert import_state()[0] == {DAY_ONE: 25, DAY_TWO: 25}
+
+
+def start_other_import(access_log):
+    """模拟另一个导入：登记运行记录并写入第一天的前 10 行，导入状态保持未完成"""
+    other = database_service.DatabaseService()
+    run_id = other.start_import_run(access_log)
+    parser = LogParser(access_log)
+    other.insert_log_stream([next(parser.iter_chunks(parser.iter_entries(), 10))], access_log,
+                            mark_complete=False, import_run_id=run_id)
+    return other, run_id
+
+
+def test_import_skips_days_of_running_import(db, access_log):
+    other, run_id = start_other_import(access_log)
+    try:
+        result = LogParser(access_log).parse_log(workers=1)
+    finally:
+        other.finish_import_run(run_id)
+    assert result.success
+    assert result.count == 25
+    assert result.already_imported_dates == [DAY_ONE]
+
+    # 正在进行的导入写入的行保留，其日期不被清除
+    rows, statuses, _ = import_state()
+    assert rows == {DAY_ONE: 10, DAY_TWO: 25}
+    assert statuses == {DAY_ONE: (10, False), DAY_TWO: (25, True)}
+
+
+def test_import_resets_days_of_stale_import(db, access_log, monkeypatch):
+    # 心跳线程停止更新，模拟进程已退出但未记录结束
+    monkeypatch.setattr(database_service, 'IMPORT_HEARTBEAT_SECONDS', 3600)
+    other, run_id = start_other_import(access_log)
+    with get_db_session() as session:
+        session.query(LogImportRun).filter(LogImportRun.run_id == run_id).update({
+            LogImportRun.heartbeat_at: datetime.now() - timedelta(seconds=database_service.IMPORT_RUN_STALE_SECONDS + 1)
+        })
+
+    result = LogParser(access_log).parse_log(workers=1)
+    assert result.success
+    assert result.count == 50
+
+    rows, statuses, rollup_total = import_state()
+    assert rows == {DAY_ONE: 25, DAY_TWO: 25}
+    assert statuses == {DAY_ONE: (25, True), DAY_TWO: (25, True)}
+    assert rollup_total == 50
+
+    # 过期的导入随后结束，不会把已被重新导入的日期标记为属于它
+    other.mark_import_complete({DAY_ONE: 10}, run_id)
+    other.finish_import_run(run_id)
+    assert import_state()[1] == {DAY_ONE: (25, True), DAY_TWO: (25, True)}
+
+
+def fail_on_row(monkeypatch, response_size):
+    """让包含指定 response_size 行的批次在写入预聚合时失败（fork 出的导入进程同样生效）"""
+    original = access_rollup_service.apply
+
+    def wrapper(db, rows):
+        if any(row.get('response_size') == response_size for row in rows):
+            raise RuntimeError('simulated shard failure')
+        return original(db, rows)
+
+    monkeypatch.setattr(access_rollup_service, 'apply', wrapper)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='导入进程需要继承测试中替换的方法')
+def test_parallel_import_retry_after_failed_shard(db, access_log, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_on_row(patch, 33)
+        result = LogParser(access_log).parse_log(workers=2)
+    assert not result.success
+
+    rows, statuses, _ = import_state()
+    assert sum(rows.values()) < 50
+    # 已提交的分片留下未完成的导入状态，重试时清除后重新导入
+    assert statuses and all(not complete for _, complete in statuses.values())
+    assert {day: count for day, (count, _) in statuses.items()} == rows
+
+    result = LogParser(access_log).parse_log(workers=2)
+    assert result.success
+    assert result.count == 50
+
+    rows, statuses, rollup_total = import_state()
+    assert rows == {DAY_ONE: 25, DAY_TWO: 25}
+    assert statuses == {DAY_ONE: (25, True), DAY_TWO: (25, True)}
+    assert rollup_total == 50
+
+
+def test_rebuild_keeps_rollups_of_purged_days(db, access_log):
+    assert LogParser(access_log).parse_log(workers=1).success
+    # 模拟第一天的原始日志已被过期清理或归档删除
+    with get_db_session() as session:
+        session.query(GitlabApiAccessLog).filter(
+            GitlabApiAccessLog.access_time < datetime.combine(DAY_TWO, datetime.min.time())
+        ).delete(synchronize_session=False)
+
+    assert access_rollup_service.rebuild() == 25
+
+    totals = {row['date']: row['request_count'] for row in access_rollup_service.get_daily_totals(DAY_ONE, DAY_TWO)}
+    assert totals == {DAY_ONE.isoformat(): 25, DAY_TWO.isoformat(): 25}
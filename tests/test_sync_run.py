@@ -0,0 +1,111 @@
+"""sync_all 中断后从检查点继续的测试"""
+import types
+from datetime import datetime
+
+import pytest
+
+from dto.base_dto import SyncResult
+from dto.sync_dto import GroupSyncResult
+from services.gitlab_service import GitlabService
+from services.sync_run_service import sync_run_service
+from services.task_service import task_handler, task_service
+
+REPOSITORY_IDS = [1, 2, 3, 4, 5]
+
+
+class WorkerKilled(BaseException):
+    """模拟执行同步的进程在中途退出"""
+
+
+class Project:
+    def __init__(self, project_id):
+        self.id = project_id
+        self.name = f'project-{project_id}'
+        self.members_all = types.SimpleNamespace(list=lambda **kwargs: iter([]))
+
+
+@pytest.fixture
+def gitlab(db):
+    """不连接 GitLab 的 GitlabService，记录各阶段处理的仓库"""
+    service = GitlabService.__new__(GitlabService)
+    service._listed_projects = {}
+    service.calls = {'repositories': 0, 'branches': [], 'analysis': [], 'permissions': []}
+    service.kill_at = None
+
+    def sync_repositories(incremental=False, context=None):
+        service.calls['repositories'] += 1
+        service._listed_projects.update({project_id: Project(project_id) for project_id in REPOSITORY_IDS})
+        return SyncResult.create_success(len(REPOSITORY_IDS), len(REPOSITORY_IDS))
+
+    def collect_branch_data(project, deep=False, context=None, **kwargs):
+        service.calls['branches'].append(project.id)
+        return [{'name': 'main'}]
+
+    stored = set()
+
+    def store_branches(repository_id, branch_data):
+        # 分支已写入过时没有变化
+        inserted = [] if repository_id in stored else ['main']
+        stored.add(repository_id)
+        return SyncResult(success=True, count=len(branch_data), data={'inserted': inserted, 'updated': []})
+
+    def analyze(repository_id, branch_names=None):
+        if repository_id == service.kill_at:
+            raise WorkerKilled()
+        service.calls['analysis'].append((repository_id, branch_names))
+        return True
+
+    service.sync_repositories = sync_repositories
+    service.sync_groups = lambda context=None: GroupSyncResult.create_success(0, 0, 0)
+    service._resolve_sync_projects = lambda repository_id, resource, incremental: (
+        [Project(project_id) for project_id in REPOSITORY_IDS], None
+    )
+    service._collect_branch_data = collect_branch_data
+    service._analyze_repository_branches = analyze
+    service._generate_cleanup_summary = lambda context: {'success': True}
+    service.db_service = types.SimpleNamespace(
+        sync_repository_branches=store_branches,
+        sync_repository_permissions=lambda repository_id, data: (
+            service.calls['permissions'].append(repository_id), SyncResult.create_success(0, 0)
+        )[1],
+        get_max_repository_activity=lambda: datetime(2024, 1, 1),
+        set_sync_watermark=lambda resource, value, mode: None
+    )
+    return service
+
+
+def test_sync_all_resumes_after_worker_killed(gitlab):
+    gitlab.kill_at = 3
+    with pytest.raises(WorkerKilled):
+        gitlab.sync_all()
+    assert gitlab.calls['branches'] == [1, 2, 3]
+    assert [repository_id for repository_id, _ in gitlab.calls['analysis']] == [1, 2]
+
+    gitlab.kill_at = None
+    gitlab.calls.update(repositories=0, branches=[], analysis=[], permissions=[])
+    result = gitlab.sync_all(resume=True)
+    assert result.success
+
+    # 已完成的阶段和仓库跳过，仓库 3 的分支已写入但未分析，重新分析全部分支
+    assert gitlab.calls['repositories'] == 0
+    assert gitlab.calls['branches'] == [3, 4, 5]
+    assert gitlab.calls['analysis'] == [(3, None), (4, None), (5, None)]
+    assert gitlab.calls['permissions'] == REPOSITORY_IDS
+
+    runs = sync_run_service.list_runs()
+    assert len(runs) == 1
+    assert runs[0]['status'] == 'completed'
+    assert runs[0]['resume_count'] == 1
+
+
+def test_reclaimed_task_resumes(db):
+    calls = []
+
+    @task_handler('test_resumable')
+    def resumable(resume=False):
+        calls.append(resume)
+
+    task = {'task_id': 'reclaimed', 'task_type': 'resumable', 'handler': 'test_resumable', 'params': {}}
+    task_service._execute_task(dict(task, attempts=1), 'worker-1')
+    task_service._execute_task(dict(task, attempts=2), 'worker-2')
+    assert calls == [False, True]
@@ -0,0 +1,126 @@
+"""后台任务队列的测试：认领、防重复、租约过期回收和按类型并发上限"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from config.settings import settings
+from database.connection import get_db_session
+from database.models import BackgroundTask
+from services.task_service import TaskStatus, task_handler, task_service
+
+
+@task_handler('test_echo')
+def echo(value=None):
+    return value
+
+
+@task_handler('test_other')
+def other(value=None):
+    return value
+
+
+@pytest.fixture
+def tasks(db, monkeypatch):
+    monkeypatch.setattr(settings.task, 'min_interval', 0)
+    monkeypatch.setattr(settings.task, 'max_attempts', 2)
+    monkeypatch.setattr(settings.task, 'default_type_concurrency', 2)
+    monkeypatch.setattr(settings.task, 'type_concurrency', {})
+    yield task_service
+    with task_service._running_lock:
+        task_service._running.clear()
+
+
+def task_row(task_id):
+    with get_db_session() as db:
+        task = db.query(BackgroundTask).filter(BackgroundTask.task_id == task_id).one()
+        return {'status': task.status, 'attempts': task.attempts, 'worker_id': task.worker_id,
+                'active_key': task.active_key}
+
+
+def expire_lease(task_id):
+    with get_db_session() as db:
+        db.query(BackgroundTask).filter(BackgroundTask.task_id == task_id).update(
+            {'lease_expires_at': datetime.now() - timedelta(seconds=1)}, synchronize_session=False
+        )
+
+
+def test_task_claimed_only_once(tasks):
+    task_id = tasks.create_task('echo', echo, 1)['task_id']
+
+    claims = []
+    barrier = threading.Barrier(4)
+
+    def claim(index):
+        barrier.wait()
+        claims.append(tasks._claim_task(f'worker-{index}'))
+
+    threads = [threading.Thread(target=claim, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [claim for claim in claims if claim]
+    assert [claim['task_id'] for claim in claimed] == [task_id]
+    row = task_row(task_id)
+    assert row['status'] == TaskStatus.RUNNING.value
+    assert row['attempts'] == 1
+
+
+def test_active_key_suppresses_duplicates(tasks):
+    first = tasks.create_task('echo', echo, 1)
+    duplicate = tasks.create_task('echo', echo, 2)
+    assert first['is_new']
+    assert not duplicate['is_new']
+    assert duplicate['task_id'] == first['task_id']
+
+    # allow_duplicate 的任务不占用防重复标记
+    assert tasks.create_task('echo', echo, 3, allow_duplicate=True)['is_new']
+
+    claimed = tasks._claim_task('worker-1')
+    tasks._execute_task(claimed, 'worker-1')
+    assert task_row(first['task_id'])['active_key'] is None
+
+    # 任务结束后释放防重复标记，可以再次创建
+    assert tasks.create_task('echo', echo, 4)['is_new']
+
+
+def test_expired_lease_requeued_then_failed(tasks):
+    task_id = tasks.create_task('echo', echo, 1)['task_id']
+
+    assert tasks._claim_task('worker-1')['task_id'] == task_id
+    expire_lease(task_id)
+    tasks._reclaim_expired_tasks()
+    row = task_row(task_id)
+    assert row['status'] == TaskStatus.PENDING.value
+    assert row['worker_id'] is None
+    assert row['active_key'] == 'echo'
+
+    assert tasks._claim_task('worker-2')['task_id'] == task_id
+    # 租约已被回收的工作线程结束时不覆盖新的执行
+    tasks._finish_task(task_id, 'worker-1', TaskStatus.COMPLETED)
+    assert task_row(task_id)['status'] == TaskStatus.RUNNING.value
+
+    expire_lease(task_id)
+    tasks._reclaim_expired_tasks()
+    row = task_row(task_id)
+    assert row['status'] == TaskStatus.FAILED.value
+    assert row['attempts'] == 2
+    assert row['active_key'] is None
+    assert tasks._claim_task('worker-3') is None
+
+
+def test_type_concurrency_cap(tasks, monkeypatch):
+    monkeypatch.setattr(settings.task, 'type_concurrency', {'test_echo': 1})
+    first = tasks.create_task('echo', echo, 1, allow_duplicate=True)['task_id']
+    second = tasks.create_task('echo', echo, 2, allow_duplicate=True)['task_id']
+    third = tasks.create_task('other', other, 3, allow_duplicate=True)['task_id']
+
+    assert tasks._claim_task('worker-1')['task_id'] == first
+    # test_echo 已达到并发上限，跳过排在前面的同类任务
+    assert tasks._claim_task('worker-2')['task_id'] == third
+    assert tasks._claim_task('worker-3') is None
+
+    tasks._finish_task(first, 'worker-1', TaskStatus.COMPLETED)
+    assert tasks._claim_task('worker-3')['task_id'] == second